@@ -0,0 +1,362 @@
+#!/usr/bin/env python
+"""Measures how splitting scales on synthetic git repositories.
+
+A repository is generated with a configurable number of commits, files touched per commit,
+directory depth, splits and exclude patterns.  Config loading, commit enumeration and applying the
+splits are then timed against it and the wall time, commits per second, objects written and peak
+RSS of each phase are reported and optionally saved as JSON for comparison against another run."""
+
+from __future__ import print_function
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sapversion import version
+
+import git
+import json
+import optparse
+import platform
+import random
+import resource
+import saplib
+import shutil
+import subprocess
+import tempfile
+import time
+
+def log(message, *args, **kwargs):
+  print(message % args, file = sys.stderr, **kwargs)
+
+def usage(message, *args):
+  print(message % args)
+  exit(1)
+
+class RepoGenerator(object):
+  """Generates a git repository with a synthetic history through a single git fast-import stream.
+  The history is deterministic for a given seed."""
+
+  # The first exclude pattern prunes OWNERS files, the rest each prune files with a given suffix.
+  OWNERS_EXCLUDE = '.+/OWNERS$'
+  SUFFIX_EXCLUDE = r'.+\.gen%d$'
+
+  def __init__(self, commits, files_per_commit, depth, splits, excludes, files_per_split = 50,
+               seed = 0):
+    self._commits = commits
+    self._files_per_commit = files_per_commit
+    self._depth = depth
+    self._splits = splits
+    self._excludes = excludes
+    self._files_per_split = files_per_split
+    self._random = random.Random(seed)
+
+  def excludes(self):
+    """Returns the exclude patterns each split is configured with."""
+
+    patterns = []
+    if self._excludes > 0:
+      patterns.append(RepoGenerator.OWNERS_EXCLUDE)
+    patterns.extend(RepoGenerator.SUFFIX_EXCLUDE % i for i in range(self._excludes - 1))
+    return patterns
+
+  def config(self):
+    """Returns the .saplings config defining every split."""
+
+    excludes = [ '!%s' % exclude for exclude in self.excludes() ]
+    splits = [ { 'name': 'split%d' % i, 'paths': [ 'split%d' % i ] + excludes }
+               for i in range(self._splits) ]
+    return 'splits = %r\n' % splits
+
+  def generate(self, path):
+    """Creates a repository holding the synthetic history at path and returns it."""
+
+    repo = git.Repo.init(path)
+    files = self._files()
+
+    process = subprocess.Popen([ git.Git.GIT_PYTHON_GIT_EXECUTABLE, 'fast-import', '--quiet' ],
+                               cwd = path,
+                               stdin = subprocess.PIPE)
+    date = 1300000000
+    for index in range(self._commits):
+      message = 'Commit %d' % index
+      lines = [ 'commit refs/heads/master',
+                'mark :%d' % (index + 1),
+                'author Bench <bench@example.com> %d +0000' % date,
+                'committer Bench <bench@example.com> %d +0000' % date,
+                'data %d' % len(message),
+                message ]
+      if index == 0:
+        touched = files
+        lines.append(self._inline('.saplings', self.config()))
+      else:
+        lines.append('from :%d' % index)
+        touched = self._random.sample(files, min(self._files_per_commit, len(files)))
+      for file_path in touched:
+        lines.append(self._inline(file_path, '%s %d\n' % (file_path, index)))
+
+      process.stdin.write('\n'.join(lines) + '\n')
+      date += 60
+
+    process.stdin.close()
+    if process.wait() != 0:
+      raise git.GitCommandError([ 'git', 'fast-import' ], process.returncode)
+
+    repo.git.reset('-q', '--hard', 'master')
+    return repo
+
+  def _files(self):
+    suffixes = [ '' ] + [ '.gen%d' % i for i in range(self._excludes - 1) ]
+    files = []
+    for split in range(self._splits):
+      for index in range(self._files_per_split):
+        directories = [ 'split%d' % split ]
+        directories.extend('d%d' % self._random.randrange(4)
+                           for _ in range(self._random.randint(0, self._depth)))
+        if self._excludes and index % 10 == 0:
+          name = 'OWNERS'
+        else:
+          name = 'file%d%s' % (index, self._random.choice(suffixes))
+        files.append('/'.join(directories + [ name ]))
+    return sorted(set(files))
+
+  def _inline(self, path, content):
+    return 'M 100644 inline %s\ndata %d\n%s' % (path, len(content), content)
+
+
+class CountingWriter(saplib.ObjectWriter):
+  """An ObjectWriter that counts the objects written through the writer it wraps."""
+
+  def __init__(self, writer):
+    self._writer = writer
+    self.trees = 0
+    self.commits = 0
+
+  def write_tree(self, entries):
+    self.trees += 1
+    return self._writer.write_tree(entries)
+
+  def write_commit(self, commit):
+    self.commits += 1
+    return self._writer.write_commit(commit)
+
+  def update_branch(self, branch_name, commit):
+    self._writer.update_branch(branch_name, commit)
+
+  def close(self):
+    self._writer.close()
+
+  def abort(self):
+    self._writer.abort()
+
+
+class Benchmark(object):
+  """Times a sequence of phases and collects their measurements."""
+
+  def __init__(self, verbose):
+    self._verbose = verbose
+    self.phases = []
+
+  def run(self, name, function):
+    """Runs the function, which returns a dict of counts including the number of commits it
+    processed, and records the phase."""
+
+    start = time.time()
+    counts = function() or {}
+    wall_time = time.time() - start
+
+    phase = { 'name': name, 'wall_time': wall_time }
+    phase.update(counts)
+    if 'commits' in counts:
+      phase['commits_per_second'] = counts['commits'] / wall_time if wall_time else None
+
+    # Peak RSS only ever grows so each phase reports the peak of the run up to its end.
+    phase['peak_rss_kb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    phase['peak_child_rss_kb'] = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    self.phases.append(phase)
+
+    if self._verbose:
+      log("%s: %.3fs %s", name, wall_time,
+          ", ".join("%s=%s" % item for item in sorted(counts.items())))
+    return phase
+
+
+def run_benchmark(options, path):
+  generator = RepoGenerator(options.commits, options.files_per_commit, options.depth,
+                            options.splits, options.excludes, seed = options.seed)
+  benchmark = Benchmark(options.verbose)
+  state = {}
+
+  def generate():
+    state['repo'] = generator.generate(path)
+    return { 'commits': options.commits }
+  benchmark.run('generate', generate)
+
+  odbt = git.db.GitDB if options.python_git_db else saplib.CatFileObjectDB
+  repo = git.Repo(path, odbt = odbt)
+
+  def load_config():
+    state['splits'] = sorted(saplib.Config(repo, generator.config()).splits.values(),
+                             key = lambda split: split.name)
+    return { 'splits': len(state['splits']) }
+  benchmark.run('config', load_config)
+  splits = state['splits']
+
+  def commits():
+    return { 'commits': sum(len(list(split.commits())) for split in splits) }
+  benchmark.run('commits', commits)
+
+  def indexed_commits():
+    index = saplib.ChangedPathsIndex(repo)
+    return { 'commits': sum(len(list(split.commits(index = index))) for split in splits) }
+  benchmark.run('commits_index', indexed_commits)
+
+  def create_writer():
+    if options.fast_import:
+      writer = saplib.FastImportWriter(repo)
+    elif options.mktree:
+      writer = saplib.MktreeWriter(repo)
+    else:
+      writer = saplib.OdbWriter(repo)
+    if options.pipeline and not options.fast_import:
+      writer = saplib.PipelinedWriter(writer)
+    return CountingWriter(writer)
+
+  class CommitCounter(saplib.Split.ApplyListener):
+    def __init__(self):
+      self.commits = 0
+    def on_commit(self, original_commit, new_commit):
+      self.commits += 1
+
+  def apply():
+    counter = CommitCounter()
+    trees = 0
+    new_commits = 0
+    for split in splits:
+      writer = create_writer()
+      split.apply('bench_%s' % split.name, apply_listener = counter, writer = writer,
+                  pipeline = options.pipeline)
+      trees += writer.trees
+      new_commits += writer.commits
+    return { 'commits': counter.commits, 'trees_written': trees, 'commits_written': new_commits }
+  benchmark.run('apply', apply)
+
+  def apply_set():
+    writer = create_writer()
+    counter = CommitCounter()
+    branch_names = dict((split.name, 'bench_set_%s' % split.name) for split in splits)
+    saplib.SplitSet(repo, splits).apply(branch_names, apply_listener = counter, writer = writer)
+    return { 'commits': counter.commits, 'trees_written': writer.trees,
+             'commits_written': writer.commits }
+  benchmark.run('apply_set', apply_set)
+
+  return {
+    'sapling_version': version(),
+    'python_version': platform.python_version(),
+    'git_version': repo.git.version(),
+    'parameters': {
+      'commits': options.commits,
+      'files_per_commit': options.files_per_commit,
+      'depth': options.depth,
+      'splits': options.splits,
+      'excludes': options.excludes,
+      'seed': options.seed,
+      'fast_import': options.fast_import,
+      'mktree': options.mktree,
+      'pipeline': options.pipeline,
+      'python_git_db': options.python_git_db,
+    },
+    'phases': benchmark.phases,
+  }
+
+def report(results, baseline = None):
+  baseline_phases = dict((phase['name'], phase) for phase in (baseline or {}).get('phases', []))
+
+  print("%-14s %10s %12s %10s %14s" % ('phase', 'wall (s)', 'commits/s', 'objects',
+                                        'peak rss (kb)'))
+  for phase in results['phases']:
+    objects = phase.get('trees_written', 0) + phase.get('commits_written', 0)
+    rate = phase.get('commits_per_second')
+    line = "%-14s %10.3f %12s %10d %14d" % (phase['name'], phase['wall_time'],
+                                              '%.1f' % rate if rate else '-', objects,
+                                              phase['peak_rss_kb'])
+    base = baseline_phases.get(phase['name'])
+    if base and base['wall_time']:
+      change = (phase['wall_time'] - base['wall_time']) / base['wall_time'] * 100
+      line += "  (%+.1f%% vs baseline)" % change
+    print(line)
+
+def parse_args():
+  usage = """
+    %prog [options]"""
+
+  parser = optparse.OptionParser(usage = usage, description = __doc__.split('\n\n')[0])
+  parser.add_option("-v", "--verbose", dest = "verbose", action = "store_true", default = False,
+                    help = "Logs each phase as it completes.")
+  parser.add_option("--commits", dest = "commits", type = "int", default = 1000,
+                    help = "The number of commits to generate. [default: %default]")
+  parser.add_option("--files-per-commit", dest = "files_per_commit", type = "int", default = 5,
+                    help = "The number of files each commit changes. [default: %default]")
+  parser.add_option("--depth", dest = "depth", type = "int", default = 3,
+                    help = "The maximum depth of directories within a split. [default: %default]")
+  parser.add_option("--splits", dest = "splits", type = "int", default = 4,
+                    help = "The number of splits to configure. [default: %default]")
+  parser.add_option("--excludes", dest = "excludes", type = "int", default = 2,
+                    help = "The number of exclude patterns each split has. [default: %default]")
+  parser.add_option("--seed", dest = "seed", type = "int", default = 0,
+                    help = "Seeds the generated history. [default: %default]")
+  parser.add_option("--fast-import", dest = "fast_import", action = "store_true", default = False,
+                    help = "Writes splits through git fast-import.")
+  parser.add_option("--mktree", dest = "mktree", action = "store_true", default = False,
+                    help = "Writes split trees through git mktree.")
+  parser.add_option("--pipeline", dest = "pipeline", action = "store_true", default = False,
+                    help = "Splits with reading, tree building and object storing pipelined on "
+                    "separate threads.")
+  parser.add_option("--python-git-db", dest = "python_git_db", action = "store_true",
+                    default = False,
+                    help = "Reads objects with the python git object database implementation.")
+  parser.add_option("--repo-dir", dest = "repo_dir",
+                    help = "Generates the repository in this (new) directory and keeps it instead "
+                    "of using a temporary directory.")
+  parser.add_option("-o", "--output", dest = "output",
+                    help = "Saves the results as JSON to this file.")
+  parser.add_option("--baseline", dest = "baseline",
+                    help = "Compares the wall time of each phase against a JSON results file.")
+
+  (options, args) = parser.parse_args()
+  if args:
+    parser.error("takes no arguments")
+  if options.fast_import and options.mktree:
+    parser.error("--fast-import and --mktree are mutually exclusive")
+  for name in ('commits', 'splits'):
+    if getattr(options, name) < 1:
+      parser.error("--%s must be at least 1" % name)
+  return options
+
+def main():
+  options = parse_args()
+
+  baseline = None
+  if options.baseline:
+    with open(options.baseline, 'r') as fp:
+      baseline = json.load(fp)
+
+  if options.repo_dir:
+    if os.path.exists(options.repo_dir):
+      usage("Repository directory already exists: %s", options.repo_dir)
+    results = run_benchmark(options, options.repo_dir)
+  else:
+    path = tempfile.mkdtemp(prefix = 'sapling-bench.')
+    try:
+      results = run_benchmark(options, path)
+    finally:
+      shutil.rmtree(path)
+
+  report(results, baseline)
+  if options.output:
+    with open(options.output, 'w') as fp:
+      json.dump(results, fp, indent = 2, sort_keys = True)
+
+if __name__ == '__main__':
+  main()
@@ -1,10 +1,77 @@
-from config import Config, ConfigError
-from lib import find, with_line_numbers
-from split import Split
+import sys
+import types
+
+# The module defining each exported name.  Most saplib modules import GitPython and gitdb, which
+# take far longer to import than a quick git sap --list takes to run, so a module is only imported
+# once a name it defines is first used.
+_EXPORTS = {
+  'CatFile': 'catfile',
+  'CatFileObjectDB': 'catfile',
+  'ChangedPathsIndex': 'index',
+  'Config': 'config',
+  'ConfigError': 'config',
+  'DryRun': 'report',
+  'ExportError': 'export',
+  'Exporter': 'export',
+  'FastImportWriter': 'writer',
+  'LRUCache': 'cache',
+  'MergeError': 'merge',
+  'MktreeWriter': 'writer',
+  'ObjectWriter': 'writer',
+  'OdbWriter': 'writer',
+  'PipelinedWriter': 'pipeline',
+  'ServerError': 'server',
+  'Split': 'split',
+  'SplitServer': 'server',
+  'SplitSet': 'splitset',
+  'Stats': 'stats',
+  'find': 'lib',
+  'with_line_numbers': 'lib',
+}
 
 __all__ = (
+    'CatFile',
+    'CatFileObjectDB',
+    'ChangedPathsIndex',
     'Config',
     'ConfigError',
+    'DryRun',
+    'ExportError',
+    'Exporter',
+    'FastImportWriter',
+    'LRUCache',
+    'MergeError',
+    'MktreeWriter',
+    'ObjectWriter',
+    'OdbWriter',
+    'PipelinedWriter',
+    'ServerError',
     'Split',
-    'version'
+    'SplitServer',
+    'SplitSet',
+    'Stats',
 )
+
+class _LazyModule(types.ModuleType):
+  """Stands in for the saplib package importing the module that defines an exported name on first
+  access."""
+
+  def __init__(self, package):
+    types.ModuleType.__init__(self, package.__name__, package.__doc__)
+    self.__dict__.update(package.__dict__)
+    # Python 2 clears the globals of a module once it is collected; this keeps the package alive.
+    self._package = package
+
+  def __getattr__(self, name):
+    module_name = _EXPORTS.get(name)
+    if module_name is None:
+      raise AttributeError("module %r has no attribute %r" % (self.__name__, name))
+
+    value = getattr(__import__('%s.%s' % (self.__name__, module_name), fromlist = [ name ]), name)
+    setattr(self, name, value)
+    return value
+
+  def __dir__(self):
+    return sorted(set(self.__dict__) | set(_EXPORTS))
+
+sys.modules[__name__] = _LazyModule(sys.modules[__name__])
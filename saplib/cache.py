@@ -0,0 +1,73 @@
+_MISSING = object()
+
+class LRUCache(object):
+  """A bounded mapping that evicts its least recently used entries once it grows past its
+  capacity."""
+
+  __slots__ = ('_capacity', '_entries', '_root')
+
+  # Indexes into the [prev, next, key, value] links of the recency list.
+  _PREV, _NEXT, _KEY, _VALUE = 0, 1, 2, 3
+
+  def __init__(self, capacity):
+    if capacity < 1:
+      raise ValueError("An LRUCache must have a capacity of at least 1, given: %s" % capacity)
+
+    self._capacity = capacity
+    self._entries = {}
+    self._root = []
+    self._root[:] = [ self._root, self._root, None, None ]
+
+  @property
+  def capacity(self):
+    """The maximum number of entries this cache holds."""
+    return self._capacity
+
+  def get(self, key, default = None):
+    """Returns the value cached for key, marking it most recently used, or default if not cached."""
+
+    link = self._entries.get(key)
+    if link is None:
+      return default
+
+    self._unlink(link)
+    self._append(link)
+    return link[LRUCache._VALUE]
+
+  def __setitem__(self, key, value):
+    link = self._entries.get(key)
+    if link is not None:
+      self._unlink(link)
+      link[LRUCache._VALUE] = value
+    else:
+      if len(self._entries) >= self._capacity:
+        oldest = self._root[LRUCache._NEXT]
+        self._unlink(oldest)
+        del self._entries[oldest[LRUCache._KEY]]
+      link = [ None, None, key, value ]
+      self._entries[key] = link
+    self._append(link)
+
+  def __getitem__(self, key):
+    value = self.get(key, _MISSING)
+    if value is _MISSING:
+      raise KeyError(key)
+    return value
+
+  def __contains__(self, key):
+    return key in self._entries
+
+  def __len__(self):
+    return len(self._entries)
+
+  def _unlink(self, link):
+    (prev, next) = (link[LRUCache._PREV], link[LRUCache._NEXT])
+    prev[LRUCache._NEXT] = next
+    next[LRUCache._PREV] = prev
+
+  def _append(self, link):
+    last = self._root[LRUCache._PREV]
+    link[LRUCache._PREV] = last
+    link[LRUCache._NEXT] = self._root
+    last[LRUCache._NEXT] = link
+    self._root[LRUCache._PREV] = link
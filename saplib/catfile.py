@@ -0,0 +1,139 @@
+import git
+import gitdb
+import StringIO
+import subprocess
+
+from gitdb.exc import BadObject
+from gitdb.util import bin_to_hex
+
+class CatFile(object):
+  """Reads objects from a git repository through a single long-lived git cat-file --batch process
+  and a single long-lived git cat-file --batch-check process.  Requests for many objects are
+  pipelined, written to cat-file in batches before any of the responses are read back."""
+
+  __slots__ = ('_working_dir', '_batch', '_batch_check')
+
+  # Bounds the requests in flight so they fit in the cat-file stdin pipe buffer; otherwise cat-file
+  # could block writing responses we are not yet reading while we block writing requests.
+  BATCH_SIZE = 256
+
+  def __init__(self, working_dir):
+    self._working_dir = working_dir
+    self._batch = None
+    self._batch_check = None
+
+  def read(self, binsha):
+    """Returns a tuple of the type name and data of the object with the given binsha.  Raises
+    BadObject if there is no such object."""
+
+    return self.read_all([ binsha ])[0]
+
+  def read_all(self, binshas):
+    """Returns a list of (type name, data) tuples for the objects with the given binshas.  Raises
+    BadObject if any of the objects do not exist."""
+
+    if self._batch is None:
+      self._batch = self._spawn('--batch')
+
+    binshas = list(binshas)
+    objects = []
+    for batch in self._batches(binshas):
+      self._request(self._batch, batch)
+
+      # All responses in a batch must be consumed to keep the process in sync with our requests.
+      missing = None
+      for binsha in batch:
+        header = self._read_header(self._batch)
+        if header is None:
+          missing = missing or binsha
+        else:
+          (typename, size) = header
+          data = self._batch.stdout.read(size)
+          self._batch.stdout.read(1)
+          objects.append((typename, data))
+
+      if missing is not None:
+        raise BadObject(missing)
+    return objects
+
+  def info(self, binsha):
+    """Returns a tuple of the type name and size of the object with the given binsha.  Raises
+    BadObject if there is no such object."""
+
+    if self._batch_check is None:
+      self._batch_check = self._spawn('--batch-check')
+
+    self._request(self._batch_check, [ binsha ])
+    header = self._read_header(self._batch_check)
+    if header is None:
+      raise BadObject(binsha)
+    return header
+
+  def close(self):
+    """Terminates the cat-file processes; they are re-spawned if more objects are read."""
+
+    for process in (self._batch, self._batch_check):
+      if process is not None:
+        process.stdin.close()
+        process.stdout.close()
+        process.wait()
+    self._batch = None
+    self._batch_check = None
+
+  def __del__(self):
+    self.close()
+
+  def _spawn(self, mode):
+    return subprocess.Popen([ git.Git.GIT_PYTHON_GIT_EXECUTABLE, 'cat-file', mode ],
+                            cwd = self._working_dir,
+                            stdin = subprocess.PIPE,
+                            stdout = subprocess.PIPE)
+
+  def _batches(self, binshas):
+    for i in range(0, len(binshas), CatFile.BATCH_SIZE):
+      yield binshas[i:i + CatFile.BATCH_SIZE]
+
+  def _request(self, process, binshas):
+    process.stdin.write(''.join('%s\n' % bin_to_hex(binsha) for binsha in binshas))
+    process.stdin.flush()
+
+  def _read_header(self, process):
+    # Either '<sha> <type> <size>' or '<object> missing'
+    header = process.stdout.readline().split()
+    if len(header) != 3:
+      return None
+    return (header[1], int(header[2]))
+
+
+class CatFileObjectDB(git.db.GitCmdObjectDB):
+  """An object database that reads objects through a CatFile.  Like GitCmdObjectDB new objects are
+  written to the loose object database, but objects are looked up in the packs as well."""
+
+  def __init__(self, root_path, git_cmd):
+    super(CatFileObjectDB, self).__init__(root_path, git_cmd)
+    self._cat_file = CatFile(git_cmd.working_dir)
+
+  def has_object(self, binsha):
+    try:
+      self._cat_file.info(binsha)
+      return True
+    except BadObject:
+      return False
+
+  def info(self, binsha):
+    (typename, size) = self._cat_file.info(binsha)
+    return gitdb.OInfo(binsha, typename, size)
+
+  def stream(self, binsha):
+    (typename, data) = self._cat_file.read(binsha)
+    return self._to_ostream(binsha, typename, data)
+
+  def stream_all(self, binshas):
+    """Returns a list of OStreams for the objects with the given binshas read in a single pipelined
+    batch."""
+
+    return [ self._to_ostream(binsha, typename, data)
+             for (binsha, (typename, data)) in zip(binshas, self._cat_file.read_all(binshas)) ]
+
+  def _to_ostream(self, binsha, typename, data):
+    return gitdb.OStream(binsha, typename, len(data), StringIO.StringIO(data))
@@ -0,0 +1,70 @@
+import git
+
+from git.objects.util import parse_actor_and_date
+from gitdb.util import bin_to_hex, hex_to_bin
+
+class CommitRecord(object):
+  """The parts of an original commit a split copies: its tree and the identities, dates and message
+  the split commit is written with.  Records are parsed in one go from the raw commit, unlike a
+  GitPython Commit whose attributes are each loaded lazily, and hold nothing else."""
+
+  __slots__ = ('binsha', 'tree_binsha', 'author', 'authored_date', 'author_tz_offset',
+               'committer', 'committed_date', 'committer_tz_offset', 'message', 'encoding')
+
+  @property
+  def hexsha(self):
+    return bin_to_hex(self.binsha)
+
+  @classmethod
+  def parse(cls, binsha, data):
+    """Parses the raw data of the commit with the given binsha into a CommitRecord.  Identities and
+    messages are decoded just as GitPython decodes them for a Commit - as UTF-8 whatever the
+    commit's encoding header says - so a split commit copied from a record is identical to one
+    copied from a Commit."""
+
+    record = cls()
+    record.binsha = binsha
+    record.encoding = git.Commit.default_encoding
+
+    # Multi-line headers like gpgsig continue on lines starting with a space, so the first empty
+    # line ends the headers.
+    (headers, _, message) = data.partition('\n\n')
+    for line in headers.split('\n'):
+      if line.startswith('tree '):
+        record.tree_binsha = hex_to_bin(line[5:])
+      elif line.startswith('author '):
+        (record.author, record.authored_date, record.author_tz_offset) = record._identity(line)
+      elif line.startswith('committer '):
+        (record.committer, record.committed_date, record.committer_tz_offset) = \
+            record._identity(line)
+
+    try:
+      record.message = message.decode(record.encoding)
+    except UnicodeDecodeError:
+      record.message = message
+    return record
+
+  def _identity(self, line):
+    try:
+      line = line.decode(self.encoding)
+    except UnicodeDecodeError:
+      pass
+    return parse_actor_and_date(line)
+
+
+def read_commits(odb, binshas, batch_size = 256):
+  """Yields a CommitRecord for each of the commits with the given binshas in turn.  If the object
+  database supports it the commits are read batch_size at a time in single pipelined batches."""
+
+  stream_all = getattr(odb, 'stream_all', None)
+  if stream_all is None:
+    # The streams of some object databases, like GitCmdObjectDB, read lazily from a single shared
+    # git cat-file process, so each must be read before the next is opened.
+    for binsha in binshas:
+      yield CommitRecord.parse(binsha, odb.stream(binsha).read())
+    return
+
+  for start in range(0, len(binshas), batch_size):
+    batch = binshas[start:start + batch_size]
+    for (binsha, ostream) in zip(batch, stream_all(batch)):
+      yield CommitRecord.parse(binsha, ostream.read())
@@ -1,5 +1,7 @@
-from lib import with_line_numbers
+from lib import atomic_file, load_marshalled, with_line_numbers
 from split import Split
+import hashlib
+import marshal
 import traceback
 
 class ConfigError(Exception):
@@ -18,15 +20,44 @@ class Config(object):
   dict that must have the following entries:
   'name': a logical name for the split
   'paths': the paths this split is comprised of relative to the root of the git repository
+  A split may also have the following entries:
+  'keep_empty': True to split commits that leave the split tree unchanged instead of collapsing them
   """
 
   __slots__ = ('_splits')
 
-  def __init__(self, repo, data = None):
+  CACHE_VERSION = 1
+
+  def __init__(self, repo, data = None, cache_path = None):
+    """Parses the given config data.  If a cache_path is given the parsed splits are cached there
+    keyed by the config data and the tree of the current head, which split paths are validated
+    against, so that loading an unchanged config over an unchanged tree neither executes the config
+    nor re-validates its paths."""
+
     if data is None or len(data) == 0 or data.isspace():
       self._splits = {}
-    else:
+    elif cache_path is None:
       self._splits = Config._parse(repo, data.strip())
+    else:
+      self._splits = Config._load_cached(repo, data.strip(), cache_path)
+
+  @classmethod
+  def _load_cached(cls, repo, config, cache_path):
+    key = (hashlib.sha1(config).hexdigest(), repo.git.rev_parse('HEAD^{tree}'))
+
+    cached = load_marshalled(cache_path, Config.CACHE_VERSION)
+    if cached is not None and cached[0] == key:
+      splits = {}
+      for (name, patterns, keep_empty) in cached[1]:
+        splits[name] = Split(repo, name, patterns, keep_empty = keep_empty, validate = False)
+      return splits
+
+    splits = Config._parse(repo, config)
+    split_args = [ (split.name, split.patterns, split.keep_empty)
+                   for (_, split) in sorted(splits.items()) ]
+    with atomic_file(cache_path) as fp:
+      marshal.dump((Config.CACHE_VERSION, key, split_args), fp)
+    return splits
 
   @classmethod
   def _parse(cls, repo, config):
@@ -49,8 +80,9 @@ class Config(object):
   def _parse_split(cls, repo, splitmap):
     name = splitmap.pop('name')
     patterns = splitmap.pop('paths')
+    keep_empty = splitmap.pop('keep_empty', False)
     try:
-      return Split(repo, name, patterns)
+      return Split(repo, name, patterns, keep_empty = keep_empty)
     except KeyError:
       raise ConfigError("Problem creating split: %s\n%s\n\n%s", name, splitmap,
                         traceback.format_exc())
@@ -0,0 +1,84 @@
+import git
+import os
+
+class ExportError(Exception):
+  """Thrown when a split branch cannot be exported."""
+
+  def __init__(self, msg, *args):
+    self.msg = msg % args
+
+  def __str__(self):
+    return self.msg
+
+
+class Bundle(object):
+  """A git bundle written by an Exporter: the split branch it holds, the tip commit it brings the
+  branch to and the commit it was exported relative to, if any, which a repository must already
+  have to fetch from the bundle."""
+
+  __slots__ = ('path', 'branch_name', 'tip', 'basis', 'commit_count')
+
+  def __init__(self, path, branch_name, tip, basis, commit_count):
+    self.path = path
+    self.branch_name = branch_name
+    self.tip = tip
+    self.basis = basis
+    self.commit_count = commit_count
+
+
+class Exporter(object):
+  """Exports split branches as git bundles that can be shipped to mirrors of the split repos and
+  fetched from offline.  The tip of each split exported is recorded in refs/sapling/exported/<name>
+  and the next bundle of that split only holds the objects not reachable from it.  This holds even
+  when a split branch has been rebuilt from scratch since: the rebuilt commits are new but they
+  mostly share their trees and blobs with the commits already exported."""
+
+  __slots__ = ('_repo')
+
+  def __init__(self, repo):
+    self._repo = repo
+
+  @classmethod
+  def exported_ref(cls, name):
+    """The ref recording the tip of the named split last exported."""
+    return 'refs/sapling/exported/%s' % name
+
+  def exported(self, name):
+    """Returns the hexsha of the commit the named split was last exported at or None if it never
+    was."""
+    return self._rev_parse(Exporter.exported_ref(name))
+
+  def export(self, name, branch_name, directory):
+    """Writes a bundle of the named split's branch to directory holding everything reachable from
+    its tip not already exported and records the tip as exported.  Returns the Bundle written, or
+    None if the tip was already exported.  Raises ExportError if the branch does not exist or was
+    reset back to a commit already exported, which a bundle cannot carry to a mirror."""
+
+    tip = self._rev_parse('refs/heads/%s' % branch_name)
+    if tip is None:
+      raise ExportError("No such split branch: %s", branch_name)
+
+    basis = self.exported(name)
+    if basis == tip:
+      return None
+
+    revs = [ tip ] if basis is None else [ tip, '^%s' % basis ]
+    commit_count = int(self._repo.git.rev_list('--count', *revs))
+    if commit_count == 0:
+      raise ExportError("Branch %s was reset back to %s, an ancestor of the last exported tip %s; "
+                        "delete %s to export it in full", branch_name, tip, basis,
+                        Exporter.exported_ref(name))
+    if not os.path.isdir(directory):
+      os.makedirs(directory)
+    path = os.path.join(directory, '%s-%s.bundle' % (name, tip[:12]))
+    self._repo.git.bundle('create', path, 'refs/heads/%s' % branch_name, *revs[1:])
+
+    self._repo.git.update_ref('-m', 'sapling export', Exporter.exported_ref(name), tip,
+                              *([] if basis is None else [ basis ]))
+    return Bundle(path, branch_name, tip, basis, commit_count)
+
+  def _rev_parse(self, ref):
+    try:
+      return self._repo.git.rev_parse('--verify', '--quiet', '%s^{commit}' % ref)
+    except git.GitCommandError:
+      return None
@@ -0,0 +1,253 @@
+import git
+import heapq
+import lib
+import marshal
+import os
+import subprocess
+
+class ChangedPathsIndex(object):
+  """A persistent index of the paths each commit in a repository changes.  For every commit the
+  index records its commit date, its parents and, per parent, the set of paths changed relative to
+  that parent along with all their parent directories.  Finding the commits that touch a split is
+  then a walk over the index rather than over commits and trees.  The index is extended
+  incrementally to cover new commits as the head moves."""
+
+  __slots__ = ('_repo', '_path', '_tips', '_commits')
+
+  VERSION = 1
+
+  # The number of extra uninteresting commits git walks once only uninteresting ones remain.
+  _SLOP = 5
+
+  def __init__(self, repo, path = None):
+    """Opens the index stored at path, by default .git/sapling/changed-paths, starting an empty
+    index if there is none."""
+
+    self._repo = repo
+    self._path = path or os.path.join(repo.git_dir, 'sapling', 'changed-paths')
+    self._tips = []
+    self._commits = {}
+    self._load()
+
+  def update(self, rev = 'HEAD'):
+    """Indexes the commits reachable from rev that are not indexed yet and returns their count."""
+
+    tip = self._rev_parse(rev)
+    if tip in self._commits:
+      return 0
+
+    output = self._repo.git.rev_list('--parents', '--timestamp', tip,
+                                     *('^%s' % indexed for indexed in self._tips))
+    graph = []
+    for line in output.splitlines():
+      fields = line.split()
+      graph.append((fields[1], int(fields[0]), tuple(fields[2:])))
+
+    self._index(graph)
+    self._tips = self._repo.git.merge_base('--independent', tip, *self._tips).split()
+    self._save()
+    return len(graph)
+
+  def commits(self, paths, rev = 'HEAD', since = None):
+    """Returns the hexshas of the commits reachable from rev but not from since that intersect any
+    of the given paths, newest first.  These are exactly the commits git rev-list rev -- paths
+    lists, in the same order, with its default history simplification.  The index is first updated
+    to cover rev and since."""
+
+    self.update(rev)
+    head = self._rev_parse(rev)
+    bottom = None
+    if since is not None:
+      self.update(since)
+      bottom = self._rev_parse(since)
+
+    # Replays git's revision walk (limit_list and process_parents in revision.c) over the index,
+    # including when uninteresting flags reach commits since that affects simplification.
+    walk = _Walk(self._commits, paths, bottom)
+    if bottom is not None:
+      # As git does for since..rev, the bottom is queued ahead of rev.
+      walk.push(bottom)
+      walk.uninteresting.add(bottom)
+      walk.mark_parents_uninteresting(bottom)
+    walk.push(head)
+
+    changed = []
+    date = None
+    slop = ChangedPathsIndex._SLOP
+    while walk.queue:
+      commit = walk.pop()
+      if commit in walk.uninteresting:
+        walk.process_uninteresting(commit)
+        slop = walk.still_interesting(date, slop)
+        if not slop:
+          break
+      else:
+        if not walk.process(commit):
+          changed.append(commit)
+        date = self._commits[commit][0]
+
+    return [ commit for commit in changed if commit not in walk.uninteresting ]
+
+  def changes(self, commit):
+    """Returns the set of paths, along with their parent directories, that the indexed commit with
+    the given hexsha changed relative to its first parent."""
+    return self._commits[commit][2][0]
+
+  def _rev_parse(self, rev):
+    # The hexshas of indexed commits need no trip to git.
+    return rev if rev in self._commits else self._repo.git.rev_parse(rev)
+
+  def _index(self, graph):
+    # Each commit is diffed against each of its parents in turn, or the empty tree if it has none.
+    pairs = [ ' '.join((commit,) + parents[index:index + 1])
+              for (commit, _, parents) in graph for index in range(max(1, len(parents))) ]
+
+    process = subprocess.Popen([ git.Git.GIT_PYTHON_GIT_EXECUTABLE, 'diff-tree', '--stdin', '-r',
+                                 '-z', '--name-only', '--no-renames', '--root', '--always' ],
+                               cwd = self._repo.working_dir,
+                               stdin = subprocess.PIPE,
+                               stdout = subprocess.PIPE)
+    (output, _) = process.communicate(''.join('%s\n' % pair for pair in pairs))
+    if process.returncode != 0:
+      raise git.GitCommandError([ 'git', 'diff-tree' ], process.returncode)
+
+    # Every diff, even an empty one, is headed by the commit sha.
+    tokens = output.split('\0')
+    position = 0
+    changes_by_commit = {}
+    for (index, pair) in enumerate(pairs):
+      header = pair[:40]
+      if tokens[position] != header:
+        raise ValueError("Unexpected diff-tree output for %s: %s" % (header, tokens[position]))
+      position += 1
+
+      next_header = pairs[index + 1][:40] if index + 1 < len(pairs) else ''
+      changes = set()
+      while tokens[position] != next_header:
+        changes.update(self._prefixes(tokens[position]))
+        position += 1
+      changes_by_commit.setdefault(header, []).append(frozenset(changes))
+
+    for (commit, date, parents) in graph:
+      self._commits[commit] = (date, parents, tuple(changes_by_commit[commit]))
+
+  def _prefixes(self, path):
+    prefixes = []
+    index = path.find('/')
+    while index != -1:
+      prefixes.append(path[:index])
+      index = path.find('/', index + 1)
+    prefixes.append(path)
+    return prefixes
+
+  def _load(self):
+    loaded = lib.load_marshalled(self._path, ChangedPathsIndex.VERSION)
+    if loaded is not None:
+      (tips, self._commits) = loaded
+      self._tips = list(tips)
+
+  def _save(self):
+    with lib.atomic_file(self._path) as fp:
+      marshal.dump((ChangedPathsIndex.VERSION, self._tips, self._commits), fp)
+
+
+class _Walk(object):
+  """The state of a single path limited revision walk over a ChangedPathsIndex."""
+
+  __slots__ = ('queue', 'uninteresting', '_commits', '_paths', '_bottom', '_parents', '_seen')
+
+  def __init__(self, commits, paths, bottom):
+    self.queue = []
+    self.uninteresting = set()
+
+    self._commits = commits
+    self._paths = paths
+    self._bottom = bottom
+    # The parents of each commit git has parsed so far; simplification can drop some of them.
+    self._parents = {}
+    self._seen = set()
+
+  def push(self, commit):
+    # Newest first and commits with the same date in the order they were queued.
+    self._parse(commit)
+    self._seen.add(commit)
+    heapq.heappush(self.queue, (-self._commits[commit][0], len(self._seen), commit))
+
+  def pop(self):
+    return heapq.heappop(self.queue)[2]
+
+  def process(self, commit):
+    """Simplifies an interesting commit, queues the parents it keeps and returns whether it is
+    unchanged with respect to the walked paths."""
+
+    treesame = self._simplify(commit)
+    for parent in self._parents[commit]:
+      self._parse(parent)
+      if parent not in self._seen:
+        self.push(parent)
+    return treesame
+
+  def process_uninteresting(self, commit):
+    for parent in self._parents[commit]:
+      self.uninteresting.add(parent)
+      self._parse(parent)
+      self.mark_parents_uninteresting(parent)
+      if parent not in self._seen:
+        self.push(parent)
+    self.mark_parents_uninteresting(commit)
+
+  def mark_parents_uninteresting(self, commit):
+    # Like git this only reaches as far as the commits parsed so far.
+    pending = list(self._parents.get(commit, ()))
+    while pending:
+      parent = pending.pop()
+      if parent not in self.uninteresting:
+        self.uninteresting.add(parent)
+        pending.extend(self._parents.get(parent, ()))
+
+  def still_interesting(self, date, slop):
+    if not self.queue:
+      return 0
+    if date is not None and date <= -self.queue[0][0]:
+      return ChangedPathsIndex._SLOP
+    for (_, _, commit) in self.queue:
+      if commit not in self.uninteresting:
+        return ChangedPathsIndex._SLOP
+    return slop - 1
+
+  def _parse(self, commit):
+    if commit not in self._parents:
+      self._parents[commit] = self._commits[commit][1]
+
+  def _simplify(self, commit):
+    # Mirrors try_to_simplify_commit in git's revision.c.
+    parents = self._parents[commit]
+    changes = self._commits[commit][2]
+    if not parents:
+      return not self._touches(changes[0])
+
+    relevant_parents = 0
+    relevant_change = False
+    irrelevant_change = False
+    for (parent, parent_changes) in zip(parents, changes):
+      self._parse(parent)
+      # Uninteresting parents other than the walk's bottom cannot make a merge unchanged.
+      relevant = parent not in self.uninteresting or parent == self._bottom
+      if relevant:
+        relevant_parents += 1
+      if not self._touches(parent_changes):
+        if relevant:
+          self._parents[commit] = (parent,)
+          return True
+      elif relevant:
+        relevant_change = True
+      else:
+        irrelevant_change = True
+
+    return not relevant_change if relevant_parents else not irrelevant_change
+
+  def _touches(self, changes):
+    for path in self._paths:
+      if path in changes:
+        return True
+    return False
@@ -1,4 +1,8 @@
+import contextlib
+import errno
+import marshal
 import os
+import tempfile
 
 def find(iterable, predicate, default = None):
   """Finds and returns the first item in iterable that passes the supplied predicate.  If not item
@@ -33,3 +37,41 @@ would be transformed into:
   width = len(str(len(lines)))
   return os.linesep.join([str(i + 1).rjust(width) + ' ' + line for (i, line) in enumerate(lines)])
 
+
+@contextlib.contextmanager
+def atomic_file(path):
+  """A context manager yielding a binary file to write the new contents of path to.  The file is
+  written aside and only renamed into place once complete so readers never see a partial file.  The
+  parent directory of path is created if needed."""
+
+  directory = os.path.dirname(path)
+  if not os.path.isdir(directory):
+    os.makedirs(directory)
+
+  (fd, temp_path) = tempfile.mkstemp(dir = directory, prefix = '%s.' % os.path.basename(path))
+  try:
+    with os.fdopen(fd, 'wb') as fp:
+      yield fp
+  except:
+    os.remove(temp_path)
+    raise
+  os.rename(temp_path, path)
+
+def load_marshalled(path, version):
+  """Loads the tuple of values marshalled to path after the given version number.  None is
+  returned if there is no file at path or it holds values of some other version; a corrupt file
+  is treated the same so its contents are just rebuilt."""
+
+  try:
+    with open(path, 'rb') as fp:
+      values = marshal.load(fp)
+  except IOError as e:
+    if e.errno != errno.ENOENT:
+      raise
+    return None
+  except (EOFError, ValueError, TypeError):
+    return None
+
+  if not isinstance(values, tuple) or not values or values[0] != version:
+    return None
+  return values[1:]
@@ -0,0 +1,118 @@
+import re
+
+from cache import LRUCache
+
+class ExcludeMatcher(object):
+  """Matches paths against a split's exclude regular expressions.  The excludes are combined into a
+  single regular expression where that does not change their meaning and the result for recently
+  matched paths is remembered."""
+
+  __slots__ = ('_excludes', '_match', '_matched')
+
+  DEFAULT_CACHE_SIZE = 65536
+
+  # Inline flags and back references change meaning once patterns are combined into one.
+  _UNCOMBINABLE = re.compile(r'\(\?[iLmsux]|\(\?P=|\\[1-9]')
+
+  def __init__(self, excludes, cache_size = DEFAULT_CACHE_SIZE):
+    """Creates a matcher for the given compiled exclude regular expressions."""
+
+    self._excludes = frozenset(excludes)
+    self._match = ExcludeMatcher._compile(self._excludes)
+    self._matched = LRUCache(cache_size)
+
+  @property
+  def patterns(self):
+    """The sorted patterns of the exclude regular expressions."""
+    return sorted(exclude.pattern for exclude in self._excludes)
+
+  def matches(self, path):
+    """Returns True if any of the excludes match the given path."""
+
+    matched = self._matched.get(path)
+    if matched is None:
+      matched = self._match(path)
+      self._matched[path] = matched
+    return matched
+
+  def __nonzero__(self):
+    return bool(self._excludes)
+
+  @classmethod
+  def _compile(cls, excludes):
+    excludes = tuple(excludes)
+    if len(excludes) > 1 and cls._combinable(excludes):
+      try:
+        combined = re.compile('|'.join('(?:%s)' % exclude.pattern for exclude in excludes))
+      except re.error:
+        # Named groups can collide across patterns.
+        pass
+      else:
+        return lambda path: combined.match(path) is not None
+
+    def match(path):
+      for exclude in excludes:
+        if exclude.match(path):
+          return True
+      return False
+    return match
+
+  @classmethod
+  def _combinable(cls, excludes):
+    if len(set(exclude.flags for exclude in excludes)) != 1:
+      return False
+    for exclude in excludes:
+      if cls._UNCOMBINABLE.search(exclude.pattern):
+        return False
+    return True
+
+
+class PathTrie(object):
+  """A prefix tree of a split's paths so that all the paths can be resolved in a source tree with a
+  single descent that visits the directories paths share just once."""
+
+  __slots__ = ('_paths', '_root')
+
+  def __init__(self, paths):
+    self._paths = tuple(paths)
+
+    # Each node maps a name to a tuple of the indexes of the paths ending there and the child node.
+    self._root = {}
+    for (index, path) in enumerate(self._paths):
+      node = self._root
+      names = path.split('/')
+      for name in names[:-1]:
+        node = node.setdefault(name, ([], {}))[1]
+      node.setdefault(names[-1], ([], {}))[0].append(index)
+
+  @property
+  def paths(self):
+    """The paths in this trie in the order they were given."""
+    return self._paths
+
+  def resolve(self, entries, binsha, is_tree):
+    """Returns a tuple of the (binsha, mode) of each path in the tree with the given binsha or None
+    for paths the tree does not contain.  Trees are read with the entries function, which returns
+    the (binsha, mode, name) entries of the tree with a given binsha, and is_tree tells whether a
+    mode is that of a tree."""
+
+    resolved = [ None ] * len(self._paths)
+    pending = [ (binsha, self._root) ] if self._root else []
+    while pending:
+      (binsha, node) = pending.pop()
+      remaining = len(node)
+      for (child_binsha, mode, name) in entries(binsha):
+        match = node.get(name)
+        if match is None:
+          continue
+
+        (indexes, children) = match
+        for index in indexes:
+          resolved[index] = (child_binsha, mode)
+        if children and is_tree(mode):
+          pending.append((child_binsha, children))
+
+        remaining -= 1
+        if not remaining:
+          break
+    return tuple(resolved)
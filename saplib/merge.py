@@ -0,0 +1,104 @@
+from tree import TREE_MODE, is_tree, sort_entries
+
+class MergeError(Exception):
+  """Thrown when split commits cannot be merged back into the mainline."""
+
+  def __init__(self, msg, *args):
+    self.msg = msg % args
+
+  def __str__(self):
+    return self.msg
+
+
+class TreeMerger(object):
+  """Maps the changes a split commit made to its split tree back onto a mainline tree.  Split trees
+  hold the split paths at the same locations the mainline does, less excluded files, so the changes
+  between the split commit's parent tree and its tree are applied to the mainline tree path for
+  path.  Subtrees the split commit left alone keep their sha without being read, and mainline files
+  the split excludes are kept wherever they are."""
+
+  __slots__ = ('_reader', '_writer', '_paths', '_prefixes')
+
+  def __init__(self, reader, writer, paths):
+    """Creates a TreeMerger that reads trees with the given TreeReader and writes merged trees with
+    the given ObjectWriter for a split of the given paths."""
+
+    self._reader = reader
+    self._writer = writer
+    self._paths = frozenset(paths)
+
+    # The directories leading to split paths that are not themselves within a split path.
+    self._prefixes = set()
+    for path in paths:
+      names = path.split('/')
+      for index in range(1, len(names)):
+        self._prefixes.add('/'.join(names[:index]))
+
+  def merge(self, base, new, target):
+    """Applies the changes from the split tree with binsha base to the split tree with binsha new to
+    the mainline tree with binsha target and returns the binsha of the merged tree.  Raises a
+    MergeError if the changes reach outside the split paths or conflict with mainline changes."""
+
+    binsha = self._merge_tree(base, new, target, '')
+    return self._writer.write_tree([]) if binsha is None else binsha
+
+  def _merge_entry(self, base, new, target, path):
+    # Entries are (binsha, mode) tuples or None where absent; returns the merged entry.
+    if base == new:
+      return target
+
+    within = self._within(path)
+    if not within and path not in self._prefixes:
+      raise MergeError("Split changes %s which is outside the split paths", path)
+    if within and target == base:
+      return new
+
+    if self._is_tree(base) and self._is_tree(new) and self._is_tree(target):
+      binsha = self._merge_tree(base and base[0], new and new[0], target and target[0], path)
+      return None if binsha is None else (binsha, TREE_MODE)
+
+    if not within:
+      raise MergeError("Split changes %s which is outside the split paths", path)
+    if target != new:
+      raise MergeError("Split changes to %s conflict with mainline changes", path)
+    return new
+
+  def _merge_tree(self, base, new, target, path):
+    # Takes tree binshas or None and returns the merged tree binsha or None if it's empty.
+    (base_entries, new_entries, target_entries) = [ self._entries(binsha)
+                                                     for binsha in (base, new, target) ]
+
+    merged = []
+    changed = False
+    for name in set(base_entries) | set(new_entries) | set(target_entries):
+      target_entry = target_entries.get(name)
+      entry = self._merge_entry(base_entries.get(name), new_entries.get(name), target_entry,
+                                '%s/%s' % (path, name) if path else name)
+      if entry != target_entry:
+        changed = True
+      if entry is not None:
+        merged.append((entry[0], entry[1], name))
+
+    if not changed:
+      return target
+    if not merged:
+      return None
+    sort_entries(merged)
+    return self._writer.write_tree(merged)
+
+  def _entries(self, binsha):
+    if binsha is None:
+      return {}
+    return dict((name, (child_binsha, mode))
+                for (child_binsha, mode, name) in self._reader.entries(binsha))
+
+  def _is_tree(self, entry):
+    return entry is None or is_tree(entry[1])
+
+  def _within(self, path):
+    index = len(path)
+    while index != -1:
+      if path[:index] in self._paths:
+        return True
+      index = path.rfind('/', 0, index)
+    return False
@@ -0,0 +1,131 @@
+import git
+import Queue
+import StringIO
+import sys
+import threading
+
+from writer import ObjectWriter, object_sha, serialize_tree
+
+_DONE = object()
+
+class Prefetcher(object):
+  """Iterates over an iterable on a background thread, keeping up to size items ready ahead of the
+  consumer.  Errors raised iterating are re-raised to the consumer in turn.  A prefetcher must be
+  closed if it is not iterated to the end."""
+
+  __slots__ = ('_queue', '_stopped', '_thread')
+
+  def __init__(self, iterable, size = 256):
+    self._queue = Queue.Queue(size)
+    self._stopped = False
+    self._thread = threading.Thread(target = self._run, args = (iterable,))
+    self._thread.daemon = True
+    self._thread.start()
+
+  def __iter__(self):
+    return self
+
+  def next(self):
+    (item, error) = self._queue.get()
+    if error is not None:
+      raise error[0], error[1], error[2]
+    if item is _DONE:
+      # Keep the end marker in place for any further calls.
+      self._queue.put((_DONE, None))
+      raise StopIteration
+    return item
+
+  def close(self):
+    """Stops iterating, discarding the items not yet consumed."""
+
+    self._stopped = True
+    while self._thread.is_alive():
+      try:
+        self._queue.get_nowait()
+      except Queue.Empty:
+        self._thread.join(0.01)
+
+  def _run(self, iterable):
+    try:
+      for item in iterable:
+        if self._stopped:
+          return
+        self._queue.put((item, None))
+      self._queue.put((_DONE, None))
+    except:
+      self._queue.put((None, sys.exc_info()))
+
+
+class PipelinedWriter(ObjectWriter):
+  """Stores the objects written to it with an OdbWriter on a writer thread, so objects are
+  compressed and stored while the trees of the commits after them are built.  The binsha of each
+  object is computed in memory up front so writes return at once, holding up the caller only when
+  size objects are already waiting to be stored.  Branches are updated once all objects are
+  stored."""
+
+  __slots__ = ('_writer', '_queue', '_error', '_branches', '_thread')
+
+  def __init__(self, writer, size = 1024):
+    self._writer = writer
+    self._queue = Queue.Queue(size)
+    self._error = None
+    self._branches = []
+    self._thread = threading.Thread(target = self._run)
+    self._thread.daemon = True
+    self._thread.start()
+
+  def write_tree(self, entries):
+    data = serialize_tree(entries)
+    self._put((git.Tree.type, data, entries))
+    return object_sha(git.Tree.type, data)
+
+  def write_commit(self, commit):
+    stream = StringIO.StringIO()
+    commit._serialize(stream)
+    data = stream.getvalue()
+    self._put((git.Commit.type, data, None))
+    commit.binsha = object_sha(git.Commit.type, data)
+    return commit
+
+  def update_branch(self, branch_name, commit):
+    self._branches.append((branch_name, commit))
+
+  def close(self):
+    self._finish()
+    for (branch_name, commit) in self._branches:
+      self._writer.update_branch(branch_name, commit)
+    self._writer.close()
+
+  def abort(self):
+    try:
+      self._finish(check = False)
+    finally:
+      self._writer.abort()
+
+  def _put(self, item):
+    self._check()
+    self._queue.put(item)
+
+  def _finish(self, check = True):
+    self._queue.put(None)
+    self._thread.join()
+    if check:
+      self._check()
+
+  def _check(self):
+    # Storing failed on the writer thread; the error is raised on the thread writing objects.
+    if self._error is not None:
+      error = self._error
+      raise error[0], error[1], error[2]
+
+  def _run(self):
+    while True:
+      item = self._queue.get()
+      if item is None:
+        return
+      # Once storing fails the remaining objects are drained so the writing thread never blocks.
+      if self._error is None:
+        try:
+          self._writer.store(*item)
+        except:
+          self._error = sys.exc_info()
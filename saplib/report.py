@@ -0,0 +1,90 @@
+import os
+
+class SplitPlan(object):
+  """What applying a split to a branch would do: the commits it would split, oldest first, and an
+  estimate of the objects it would write."""
+
+  __slots__ = ('name', 'branch_name', 'since', 'commits', 'trees')
+
+  def __init__(self, name, branch_name, since, commits, trees):
+    self.name = name
+    self.branch_name = branch_name
+    self.since = since
+    self.commits = commits
+    self.trees = trees
+
+  @property
+  def objects(self):
+    """The estimated number of objects applying the split would write; an upper bound since
+    commits that turn out to leave the split tree unchanged are collapsed."""
+    return len(self.commits) + self.trees
+
+  def as_dict(self):
+    """Returns this plan as a dict suitable for serializing as JSON."""
+
+    return {
+      'name': self.name,
+      'branch': self.branch_name,
+      'since': self.since,
+      'commit_count': len(self.commits),
+      'commits': self.commits,
+      'estimated_objects': { 'commits': len(self.commits), 'trees': self.trees },
+    }
+
+
+class DryRun(object):
+  """Works out what applying splits would do without writing anything.  Every split is planned with
+  one shared ChangedPathsIndex so history is read and diffed once however many splits there are;
+  each split's commits are then found by walking the index in memory."""
+
+  __slots__ = ('_repo', '_index', '_head')
+
+  def __init__(self, repo, index):
+    self._repo = repo
+    self._index = index
+    self._index.update()
+    self._head = repo.git.rev_parse('HEAD')
+
+  @property
+  def head(self):
+    """The hexsha of the current head the splits are planned against."""
+    return self._head
+
+  def plan(self, split, branch_name):
+    """Returns the SplitPlan for applying the split to the named branch.  Like Split.apply only the
+    commits that are new since the branch was last split are planned."""
+
+    resume_point = split.resume_point(branch_name)
+    since = None if resume_point is None else resume_point[1]
+
+    commits = self._index.commits(split.paths, self._head, since)
+    commits.reverse()
+
+    # Every split tree grafts the split paths together with the root and the directories above the
+    # split paths.  Subtrees within the split paths are re-used as is unless excludes prune them.
+    grafts = set([ '' ])
+    for path in split.paths:
+      while path:
+        path = os.path.dirname(path)
+        grafts.add(path)
+    trees = len(grafts) * len(commits)
+    if any(pattern.startswith('!') for pattern in split.patterns):
+      trees += sum(self._pruned_trees(split.paths, commit) for commit in commits)
+
+    return SplitPlan(split.name, branch_name, since, commits, trees)
+
+  def _pruned_trees(self, paths, commit):
+    # The changed directories within the split paths are those that may need their excluded files
+    # pruned again.
+    trees = set()
+    for path in self._index.changes(commit):
+      directory = os.path.dirname(path)
+      if self._within(paths, directory):
+        trees.add(directory)
+    return len(trees)
+
+  def _within(self, paths, path):
+    for split_path in paths:
+      if path == split_path or path.startswith(split_path + '/'):
+        return True
+    return False
@@ -0,0 +1,196 @@
+import errno
+import json
+import os
+import socket
+import traceback
+
+# The client side of the protocol is used by hooks that should return as quickly as possible, so
+# the saplib modules that import GitPython are only imported by the server side where used.
+
+class ServerError(Exception):
+  """Thrown when a SplitServer cannot be started or fails to handle a request."""
+
+  def __init__(self, msg, *args):
+    self.msg = msg % args
+
+  def __str__(self):
+    return self.msg
+
+
+class SplitServer(object):
+  """Keeps the split branches of a repository up to date from a long running process.  The server
+  listens on a unix socket for requests to split, each a line of JSON answered with a line of JSON.
+  Between requests it holds on to the parsed config, only re-parsing it when it changes, to the
+  trees read and pruned so far and to the changed-paths index, so a request after a new commit only
+  walks, reads and splits that commit.
+
+  The requests are:
+  { "command": "split", "splits": [ names ] }: applies the named splits, or all configured splits if
+    splits is null or empty, answering { "splits": [ { "name", "branch", "tip" } ] }
+  { "command": "ping" }: answers {}
+  { "command": "stop" }: answers {} and stops the server
+  A request that fails is answered with { "error": description }.  Split paths are validated
+  against the head the config was parsed at."""
+
+  __slots__ = ('_repo', '_config_path', '_socket_path', '_branch_name', '_create_writer',
+               '_config_data', '_splits', '_reader', '_cache', '_index', '_running')
+
+  def __init__(self, repo, config_path, socket_path, branch_name, create_writer = None):
+    """Creates a server for the splits configured in the file at config_path that listens on
+    socket_path.  Each split is applied to the branch named by branch_name(split) with an
+    ObjectWriter from create_writer(repo), by default an OdbWriter."""
+
+    from index import ChangedPathsIndex
+    from tree import TreeReader
+    from writer import OdbWriter
+
+    self._repo = repo
+    self._config_path = config_path
+    self._socket_path = socket_path
+    self._branch_name = branch_name
+    self._create_writer = create_writer or OdbWriter
+    self._config_data = None
+    self._splits = {}
+    self._reader = TreeReader(repo.odb)
+    self._cache = None
+    self._index = ChangedPathsIndex(repo)
+    self._running = False
+
+  @classmethod
+  def request(cls, socket_path, message):
+    """Sends the request message to the server listening on socket_path and returns its decoded
+    response.  Raises socket.error if no server is listening and ServerError if the server failed
+    to handle the request."""
+
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+      client.connect(socket_path)
+      stream = client.makefile('rwb')
+      stream.write(json.dumps(message) + '\n')
+      stream.flush()
+      line = stream.readline()
+      stream.close()
+    finally:
+      client.close()
+
+    if not line:
+      raise ServerError("The server on %s closed the connection", socket_path)
+    response = json.loads(line)
+    if 'error' in response:
+      raise ServerError("%s", response['error'])
+    return response
+
+  def serve(self):
+    """Handles requests one at a time until asked to stop.  Raises ServerError if another server is
+    already listening on the socket; a socket left behind by a server that died is replaced."""
+
+    listener = self._listen()
+    try:
+      self._running = True
+      while self._running:
+        (connection, _) = listener.accept()
+        try:
+          self._respond(connection)
+        finally:
+          connection.close()
+    finally:
+      listener.close()
+      os.remove(self._socket_path)
+
+  def handle(self, request):
+    """Handles a decoded request and returns the response to send back."""
+
+    command = request.get('command')
+    if command == 'split':
+      return { 'splits': self._split(request.get('splits')) }
+    elif command == 'ping':
+      return {}
+    elif command == 'stop':
+      self._running = False
+      return {}
+    raise ServerError("Unknown command: %s", command)
+
+  def _listen(self):
+    if os.path.exists(self._socket_path):
+      try:
+        SplitServer.request(self._socket_path, { 'command': 'ping' })
+      except socket.error:
+        os.remove(self._socket_path)
+      else:
+        raise ServerError("A server is already listening on %s", self._socket_path)
+
+    directory = os.path.dirname(self._socket_path)
+    if not os.path.isdir(directory):
+      os.makedirs(directory)
+
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+      listener.bind(self._socket_path)
+      listener.listen(8)
+    except:
+      listener.close()
+      raise
+    return listener
+
+  def _respond(self, connection):
+    stream = connection.makefile('rwb')
+    try:
+      response = self.handle(json.loads(stream.readline()))
+    except ServerError as e:
+      response = { 'error': str(e) }
+    except Exception:
+      response = { 'error': traceback.format_exc() }
+    try:
+      stream.write(json.dumps(response) + '\n')
+      stream.close()
+    except socket.error as e:
+      # The client gave up waiting; the splits were still applied.
+      if e.errno != errno.EPIPE:
+        raise
+
+  def _split(self, names):
+    from splitset import SplitSet
+
+    splits = self._load_splits()
+    if names:
+      undefined = [ name for name in names if name not in splits ]
+      if undefined:
+        raise ServerError("Split not defined: %s", ", ".join(undefined))
+      selected = [ splits[name] for name in names ]
+    else:
+      selected = [ splits[name] for name in sorted(splits) ]
+
+    branch_names = dict((split.name, self._branch_name(split)) for split in selected)
+    try:
+      tips = SplitSet(self._repo, selected).apply(branch_names,
+                                                  writer = self._create_writer(self._repo),
+                                                  reader = self._reader,
+                                                  cache = self._cache,
+                                                  index = self._index)
+    except:
+      # The pruned trees cached during a failed split may never have been written, so later
+      # splits must not reuse them.
+      self._cache = SplitSet.create_cache(splits.values())
+      raise
+    return [ { 'name': split.name,
+               'branch': branch_names[split.name],
+               'tip': tips[split.name] and tips[split.name].hexsha }
+             for split in selected ]
+
+  def _load_splits(self):
+    from config import Config
+    from splitset import SplitSet
+
+    try:
+      with open(self._config_path, 'r') as fp:
+        data = fp.read()
+    except IOError as e:
+      if e.errno != errno.ENOENT:
+        raise
+      data = ''
+
+    if data != self._config_data:
+      self._splits = Config(self._repo, data).splits
+      self._cache = SplitSet.create_cache(self._splits.values())
+      self._config_data = data
+    return self._splits
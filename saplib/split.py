@@ -1,18 +1,29 @@
 import git
-import gitdb
+import itertools
 import lib
 import os
 import re
-import StringIO
+
+from commits import read_commits
+from gitdb.util import hex_to_bin
+from matcher import ExcludeMatcher, PathTrie
+from merge import MergeError, TreeMerger
+from pipeline import PipelinedWriter, Prefetcher
+from stats import NullStats, Stats, TimedMatcher, TimedObjectDB, TimedWriter
+from tree import EMPTY_TREE, TreeBuilder, TreeReader, is_tree
+from writer import OdbWriter
 
 class Split(object):
   """Represents a split of a git repository off to a remote repository.  A Split maps one or more
   subtrees of a containing git repository as a logical unit that can be pushed to or pulled from its
   remote."""
 
-  __slots__ = ('_repo', '_name', '_paths', '_excludes')
+  __slots__ = ('_repo', '_name', '_paths', '_trie', '_matcher', '_keep_empty')
+
+  _SPLIT_OF = re.compile(r'\(sapling split of ([0-9a-f]{40})\)\s*$')
+  _MERGE_OF = re.compile(r'\(sapling merge of ([0-9a-f]{40})\)\s*$', re.MULTILINE)
 
-  def __init__(self, repo, name, patterns):
+  def __init__(self, repo, name, patterns, keep_empty = False, validate = True):
     """Creates a new Split over the given repo with the specified logical name.  The patterns
     specify paths to include in the split and regular expressions to prune out sub-paths.  Paths to
     include are taken as relative to the root of the repo and can either be directory paths, in
@@ -22,10 +33,18 @@ class Split(object):
 
     For example, the following patterns would specify a split that grabs a top-level README, and the
     src/ tree except for any OWNERS files contained within:
-    [ 'README', 'src', '!.+/OWNERS$"""
+    [ 'README', 'src', '!.+/OWNERS$
+
+    Commits whose split tree is unchanged from the split of the commit before them, for example
+    commits that only change excluded files, are collapsed into that commit unless keep_empty is
+    True.
+
+    The paths are checked to exist in the current head, raising KeyError if any do not, unless
+    validate is False because they are already known to."""
 
     self._repo = repo
     self._name = name
+    self._keep_empty = keep_empty
 
     paths = []
     excludes = set()
@@ -34,14 +53,22 @@ class Split(object):
         excludes.add(re.compile(pattern[1:]))
       else:
         paths.append(os.path.normpath(pattern))
-    self.paths = paths
-    self._excludes = excludes
+    self._paths = paths
+    self._trie = PathTrie(paths)
+    if validate:
+      self._validate_paths(self._trie)
+    self._matcher = ExcludeMatcher(excludes)
 
   @property
   def name(self):
     """The logical name of this Split."""
     return self._name
 
+  @property
+  def keep_empty(self):
+    """True if commits that leave the split tree unchanged are still split."""
+    return self._keep_empty
+
   @property
   def paths(self):
     "The paths this split is comprised of."
@@ -49,117 +76,450 @@ class Split(object):
 
   @paths.setter
   def paths(self, value):
-    self._paths = self._validate_paths(value)
-
-  def _validate_paths(self, paths):
-    tree = self._current_tree()
-    for path in paths:
-      try:
-        tree / path
-      except KeyError:
+    trie = PathTrie(value)
+    self._validate_paths(trie)
+    (self._paths, self._trie) = (value, trie)
+
+  @property
+  def patterns(self):
+    """The patterns this split was defined with; passing these to the Split constructor creates an
+    equivalent split."""
+    return self.paths + [ '!%s' % pattern for pattern in self._matcher.patterns ]
+
+  def _validate_paths(self, trie):
+    # All the paths are looked up in a single descent of the current tree.
+    reader = TreeReader(self._repo.odb)
+    resolved = trie.resolve(reader.entries, self._current_tree().binsha, is_tree)
+    for (path, entry) in zip(trie.paths, resolved):
+      if entry is None:
         raise KeyError("Invalid path: %s" % path)
-    return paths
 
-  def commits(self, reverse = True):
-    """Returns an iterator over the commits in the current head that instersect this split.  By
-    default commits are returned oldest first, but this can be overridden by specifying
-    'reverse' = False"""
+  def commits(self, reverse = True, since = None, index = None):
+    """Returns an iterator over CommitRecords of the commits in the current head that instersect
+    this split.  By default commits are returned oldest first, but this can be overridden by
+    specifying 'reverse' = False.  If since is specified only commits not reachable from that commit
+    are returned.  If a ChangedPathsIndex is given the commits are found with it instead of walking
+    the history of the split paths with git."""
+
+    return read_commits(self._repo.odb, self._commit_binshas(reverse, since, index))
+
+  def _commit_binshas(self, reverse, since, index):
+    if index is not None:
+      hexshas = index.commits(self.paths, str(self._current_head()), since)
+      if reverse:
+        hexshas.reverse()
+    else:
+      args = [ '--reverse' ] if reverse else []
+      hexshas = self._repo.git.rev_list(*(args + [ self._refspec(since), '--' ] + self.paths))
+      hexshas = hexshas.split()
+    return [ hex_to_bin(hexsha) for hexsha in hexshas ]
+
+  def commit_count(self, since = None, index = None):
+    """Returns the number of commits commits(since = since, index = index) iterates over without
+    reading any of them."""
+
+    if index is not None:
+      return len(index.commits(self.paths, str(self._current_head()), since))
+
+    return int(self._repo.git.rev_list('--count', self._refspec(since), '--', *self.paths))
+
+  def _refspec(self, since):
+    head = str(self._current_head())
+    return head if since is None else '%s..%s' % (since, head)
+
+  def resume_point(self, branch_name):
+    """Returns a tuple of the tip commit of the named split branch and the hexsha of the original
+    commit it was split from if the branch exists and its history can be extended by splitting only
+    newer commits; otherwise returns None."""
+
+    branch = lib.find(self._repo.branches, lambda branch: branch.name == branch_name, lambda: None)
+    if branch is None:
+      return None
+
+    tip = branch.commit
+    match = Split._SPLIT_OF.search(tip.message)
+    if not match:
+      return None
 
-    refspec = self._current_head()
-    return git.Commit.iter_items(self._repo, refspec, self.paths, reverse = reverse)
+    original = match.group(1)
+    try:
+      self._repo.git.merge_base('--is-ancestor', original, str(self._current_head()))
+    except git.GitCommandError:
+      # The original commit is gone or no longer part of the mainline history
+      return None
+    return (tip, original)
 
   class ApplyListener(object):
     def on_start(self, commit_count):
       pass
     def on_commit(self, original_commit, new_commit):
       pass
+    def on_commit_stats(self, original_commit, phases):
+      pass
     def on_finish(self):
       pass
 
-  def apply(self, branch_name, apply_listener = ApplyListener()):
+  def apply(self, branch_name, apply_listener = ApplyListener(), writer = None, index = None,
+            stats = None, preserve_merges = False, trees = None, pipeline = False):
     """Applies this split over the commits to the named branch and returns the tip commit. An
     ApplyListener callback can be passed to track progress of the split; otherwise, a no-op
-    ApplyListener is used. If there are no (new) commits to split None is returned."""
+    ApplyListener is used.  The listener is handed None as the new commit of original commits that
+    were collapsed into the split commit before them. If the branch already holds a split of an
+    ancestor of the current head only the newer commits are split and appended to it. If there are
+    no (new) commits to split, or they were all collapsed, None is returned.  The split trees and
+    commits are written with the given ObjectWriter, which is closed once the split is applied, or
+    else straight to the repo's object database.  The commits to split are found with the given
+    ChangedPathsIndex if any.  If a Stats is given the time spent in each phase of the split is
+    recorded in it and the listener is handed the phases of each commit after it is split.
+
+    By default the split history is a single chain of commits.  If preserve_merges is True it keeps
+    the shape of the original history instead: the parents of each split commit are the splits of
+    the original commit's parents, as git log simplifies the history of the split paths, so branches
+    and merges survive the split.  Split parents that are ancestors of another split parent are
+    dropped so merges of branches that split to nothing new collapse like any other commit.  Split
+    trees already built for original commits, say by build_trees in other processes, can be passed
+    as a dict of tree binshas keyed by original commit hexsha; the index is not used.
+
+    If pipeline is True the split runs in stages on their own threads: split trees are built on the
+    calling thread while the objects written with an OdbWriter are stored on a writer thread by a
+    PipelinedWriter and, for a single chain split, while the commits after them are read and their
+    split paths resolved on a reader thread.  Each stage waits on the others only when it gets too
+    far ahead, so the split runs as fast as its slowest stage rather than as all of them in turn."""
+
+    if writer is None:
+      writer = OdbWriter(self._repo)
+    if pipeline and isinstance(writer, OdbWriter):
+      writer = PipelinedWriter(writer)
+    if stats is None:
+      stats = NullStats()
+    else:
+      writer = TimedWriter(writer, stats)
 
-    commits = list(self.commits())
-    if not commits:
+    try:
+      if preserve_merges:
+        tip = self._apply_graph(branch_name, apply_listener, writer, trees or {}, stats)
+      else:
+        tip = self._apply(branch_name, apply_listener, writer, index, stats, pipeline)
+    except:
+      writer.abort()
+      raise
+    writer.close()
+    return tip
+
+  def _apply(self, branch_name, apply_listener, writer, index, stats, pipeline):
+    resume_point = self.resume_point(branch_name)
+    if resume_point is None:
+      (parent, since) = (None, None)
+    else:
+      (parent, since) = resume_point
+
+    # Only the commit shas are listed up front; the commits themselves are read in batches as
+    # they're streamed through tree building and writing.
+    with stats.phase('enumerate', 0):
+      binshas = self._commit_binshas(True, since, index)
+    if not binshas:
       return None
 
-    commit_count = len(commits)
+    apply_listener.on_start(len(binshas))
+    if pipeline:
+      commits = self._prefetch(binshas)
+    else:
+      commits = ((commit, None) for commit in read_commits(self._repo.odb, binshas))
+    try:
+      copied = 0
+      tree_builder = self._tree_builder(writer, stats = stats)
+      for (commit, resolved) in stats.timed('read', commits):
+        new_commit = None
+        if resolved is None:
+          with stats.phase('resolve'):
+            resolved = tree_builder.resolve(commit.tree_binsha)
+        with stats.phase('build'):
+          synthetic_tree = git.Tree(self._repo, tree_builder.build(commit.tree_binsha, resolved),
+                                    path = '')
+
+        if not self._is_unchanged(synthetic_tree, parent):
+          parents = [] if parent is None else [ parent ]
+          with stats.phase('copy'):
+            parent = new_commit = self._copy_commit(commit, synthetic_tree, parents, writer)
+          copied += 1
+
+        apply_listener.on_commit(commit, new_commit)
+        phases = stats.commit_done(commit)
+        if phases is not None:
+          apply_listener.on_commit_stats(commit, phases)
+
+      if not copied:
+        return None
+
+      writer.update_branch(branch_name, parent)
+      return parent
+
+    finally:
+      commits.close()
+      apply_listener.on_finish()
+
+  def _prefetch(self, binshas):
+    # The reader thread reads through an object database of its own so its reads never interleave
+    # with those of the tree builder.  It is created just as the Repo created its own, but with git
+    # commands of its own too since those keep persistent git cat-file processes.
+    odbt = type(self._repo.odb)
+    root_path = os.path.join(self._repo.git_dir, 'objects')
+    if issubclass(odbt, git.db.GitCmdObjectDB):
+      odb = odbt(root_path, git.Git(self._repo.working_dir))
+    else:
+      odb = odbt(root_path)
+    resolver = self._tree_builder(None, reader = TreeReader(odb))
+    return Prefetcher((commit, resolver.resolve(commit.tree_binsha))
+                      for commit in read_commits(odb, binshas))
+
+  def _apply_graph(self, branch_name, apply_listener, writer, trees, stats):
+    # Maps the binsha of each split commit to its (generation, parent binshas, tree binsha) where
+    # the generation is one more than that of its highest parent.
+    lineage = {}
+    # Maps the hexsha of each original commit already split on the branch to its split binsha.
+    originals = {}
+    resume_point = self.resume_point(branch_name)
+    if resume_point is None:
+      (resumed, since) = (None, None)
+    else:
+      (tip, since) = resume_point
+      resumed = tip.binsha
+      self._read_lineage(branch_name, lineage, originals)
+
+    with stats.phase('enumerate', 0):
+      graph = self.commit_graph(since = since)
+    if not graph:
+      return None
 
-    apply_listener.on_start(commit_count)
+    apply_listener.on_start(len(graph))
     try:
-      if not commits:
+      # Maps the hexsha of each original commit to the binsha of its split commit or of the split
+      # commit it was collapsed into, or to None if it was collapsed into nothing.  Parents outside
+      # the graph are ancestors of the commit the branch was last split from and are looked up
+      # amongst the commits already split on the branch.
+      splits = {}
+      copied = 0
+      tree_builder = self._tree_builder(writer, stats = stats)
+      commits = read_commits(self._repo.odb, [ hex_to_bin(hexsha) for (hexsha, _) in graph ])
+      for ((hexsha, parent_hexshas), commit) in itertools.izip(graph, stats.timed('read', commits)):
+        parents = []
+        for parent_hexsha in parent_hexshas:
+          if parent_hexsha not in splits:
+            splits[parent_hexsha] = self._split_before(parent_hexsha, originals, resumed)
+          parent = splits[parent_hexsha]
+          if parent is not None and parent not in parents:
+            parents.append(parent)
+        if len(parents) > 1:
+          parents = self._independent(parents, lineage)
+
+        tree_binsha = trees.get(hexsha)
+        if tree_binsha is None:
+          with stats.phase('resolve'):
+            resolved = tree_builder.resolve(commit.tree_binsha)
+          with stats.phase('build'):
+            tree_binsha = tree_builder.build(commit.tree_binsha, resolved)
+
+        new_commit = None
+        if (self._keep_empty or len(parents) > 1
+            or tree_binsha != (lineage[parents[0]][2] if parents else EMPTY_TREE)):
+          with stats.phase('copy'):
+            new_commit = self._copy_commit(commit, git.Tree(self._repo, tree_binsha, path = ''),
+                                           [ git.Commit(self._repo, binsha) for binsha in parents ],
+                                           writer)
+          generation = 1 + max([ lineage[binsha][0] for binsha in parents ] or [ 0 ])
+          lineage[new_commit.binsha] = (generation, tuple(parents), tree_binsha)
+          splits[hexsha] = new_commit.binsha
+          copied += 1
+        else:
+          splits[hexsha] = parents[0] if parents else None
+
+        apply_listener.on_commit(commit, new_commit)
+        phases = stats.commit_done(commit)
+        if phases is not None:
+          apply_listener.on_commit_stats(commit, phases)
+
+      # The graph ends with the commit nearest the head, which every other commit leads to.
+      tip = splits[graph[-1][0]]
+      if not copied or tip is None or tip == resumed:
         return None
 
-      parent = None
-      branch = lib.find(self._repo.branches,
-                        lambda branch: branch.name == branch_name,
-                        lambda: self._repo.create_head(branch_name))
-
-      for commit in commits:
-        index_path = '/tmp/%s.index' % branch_name
-        if os.path.exists(index_path):
-          os.remove(index_path)
-
-        index = git.IndexFile(self._repo, index_path)
-        for item in self._subtrees(commit):
-          if self._is_included(item):
-            index.add([item])
-          else:
-            index.add(item.traverse(lambda item, depth: self._is_included(item)))
-        synthetic_tree = index.write_tree()
-
-        parents = [] if parent is None else [ parent ]
-        parent = self._copy_commit(commit, synthetic_tree, parents)
+      tip = git.Commit(self._repo, tip)
+      writer.update_branch(branch_name, tip)
+      return tip
+
+    finally:
+      apply_listener.on_finish()
+
+  def _read_lineage(self, branch_name, lineage, originals):
+    # The whole split branch is read in one go, parents before their children, so merges of
+    # branches that forked before the commit the branch was last split from can be joined to the
+    # split commits they forked from.
+    log = self._repo.git.log('-z', '--reverse', '--topo-order', '--format=%H %T %P%n%B',
+                             branch_name)
+    for entry in log.split('\0'):
+      if not entry:
+        continue
+      (header, _, message) = entry.partition('\n')
+      shas = [ hex_to_bin(hexsha) for hexsha in header.split() ]
+      (binsha, tree_binsha, parents) = (shas[0], shas[1], tuple(shas[2:]))
+      generation = 1 + max([ lineage[parent][0] for parent in parents if parent in lineage ]
+                           or [ 0 ])
+      lineage[binsha] = (generation, parents, tree_binsha)
+      match = Split._SPLIT_OF.search(message)
+      if match:
+        originals[match.group(1)] = binsha
+
+  def _split_before(self, hexsha, originals, resumed):
+    # Finds the split of an original commit outside the commits being split: that of the nearest
+    # commit in its history of the split paths that was split, if any.  Commits the branch has no
+    # record of, say because the branch was split with other paths, are taken to be split by the
+    # tip the split resumes from.
+    if hexsha in originals:
+      return originals[hexsha]
+    history = self._repo.git.rev_list('--topo-order', hexsha, '--', *self.paths).split()
+    if not history:
+      return None
+    return lib.find((originals.get(ancestor) for ancestor in history),
+                    lambda binsha: binsha is not None, lambda: resumed)
+
+  def _independent(self, parents, lineage):
+    # Drops the parents that are ancestors of other parents, as git merge-base --independent does,
+    # since merging them in adds nothing to the split history.  Only split commits with a generation
+    # above that of a parent can have it as an ancestor.
+    independent = []
+    for parent in parents:
+      generation = lineage[parent][0]
+      pending = [ other for other in parents if other != parent ]
+      seen = set()
+      while pending:
+        binsha = pending.pop()
+        if binsha == parent:
+          break
+        if binsha not in seen:
+          seen.add(binsha)
+          (other_generation, other_parents, _) = lineage[binsha]
+          if other_generation > generation:
+            pending.extend(other_parents)
+      else:
+        independent.append(parent)
+    return independent
+
+  def commit_graph(self, since = None):
+    """Returns the commits commits(since = since) iterates over as a list of (hexsha, parent
+    hexshas) tuples, parents before their children.  The parents are those of the history of the
+    split paths as git log simplifies it: the nearest ancestors along each line of history that
+    change the split paths, or else ancestors of since."""
+
+    graph = []
+    for line in self._repo.git.rev_list('--parents', '--reverse', '--topo-order',
+                                        self._refspec(since), '--', *self.paths).splitlines():
+      shas = line.split()
+      graph.append((shas[0], shas[1:]))
+    return graph
+
+  def build_trees(self, hexshas, writer):
+    """Builds the split tree of each of the original commits with the given hexshas, writing them
+    with the given ObjectWriter, which is left open, and returns a dict of the split tree binshas
+    keyed by hexsha.  The split tree of a commit does not depend on any other commit so the trees of
+    a large split can be built in several processes at once and handed to apply."""
+
+    tree_builder = self._tree_builder(writer)
+    trees = {}
+    for commit in read_commits(self._repo.odb, [ hex_to_bin(hexsha) for hexsha in hexshas ]):
+      trees[commit.hexsha] = tree_builder.build(commit.tree_binsha)
+    return trees
+
+  def merge(self, split_branch, branch_name, apply_listener = ApplyListener(), writer = None):
+    """Merges the commits made on top of this split in the split_branch history back into the
+    current head and points the named branch at the merged tip commit, which is returned.  Each
+    split commit not yet merged is merged in turn as a new mainline commit whose tree is that of the
+    mainline commit before it with the changes the split commit made to the split paths applied.
+    Split commits made by Split.apply and split commits already merged into the current head are
+    skipped; if there are none left to merge None is returned.  The ApplyListener is notified of
+    each split commit merged and its new mainline commit, which are written with the given
+    ObjectWriter, which is closed once the merge is done, or else straight to the repo's object
+    database.  Raises a MergeError if a split commit changes files outside the split paths or
+    changes files the mainline has changed differently."""
+
+    if writer is None:
+      writer = OdbWriter(self._repo)
+
+    try:
+      tip = self._merge(split_branch, branch_name, apply_listener, writer)
+    except:
+      writer.abort()
+      raise
+    writer.close()
+    return tip
+
+  def _merge(self, split_branch, branch_name, apply_listener, writer):
+    try:
+      self._repo.git.rev_parse('--verify', '--quiet', '%s^{commit}' % split_branch)
+    except git.GitCommandError:
+      raise MergeError("No such split branch: %s", split_branch)
+
+    head = self._current_head_commit()
+    merged = set(Split._MERGE_OF.findall(self._repo.git.log('--format=%B', '--fixed-strings',
+                                                            '--grep=(sapling merge of ', head)))
+
+    pending = []
+    for commit in git.Commit.iter_items(self._repo, split_branch, first_parent = True):
+      if commit.hexsha in merged or Split._SPLIT_OF.search(commit.message):
+        break
+      pending.append(commit)
+    else:
+      raise MergeError("No split of %s found in the history of %s", self._name, split_branch)
+
+    if not pending:
+      return None
+
+    apply_listener.on_start(len(pending))
+    try:
+      merger = TreeMerger(TreeReader(self._repo.odb), writer, self._paths)
+      parent = head
+      for commit in reversed(pending):
+        base = commit.parents[0].tree.binsha if commit.parents else EMPTY_TREE
+        tree = git.Tree(self._repo, merger.merge(base, commit.tree.binsha, parent.tree.binsha),
+                        path = '')
+        parent = self._copy_commit(commit, tree, [ parent ], writer, action = 'merge')
         apply_listener.on_commit(commit, parent)
 
-      branch.commit = parent
+      writer.update_branch(branch_name, parent)
       return parent
 
     finally:
       apply_listener.on_finish()
 
-  def _copy_commit(self, orig_commit, tree, parents):
+  def _tree_builder(self, writer, reader = None, cache = None, stats = None):
+    matcher = self._matcher
+    if reader is None:
+      odb = self._repo.odb
+      if isinstance(stats, Stats):
+        odb = TimedObjectDB(odb, stats)
+      reader = TreeReader(odb)
+    if isinstance(stats, Stats):
+      matcher = TimedMatcher(matcher, stats)
+    return TreeBuilder(reader, writer, self._trie, matcher, cache = cache)
+
+  def _is_unchanged(self, tree, parent):
+    if self._keep_empty:
+      return False
+    return tree.binsha == (EMPTY_TREE if parent is None else parent.tree.binsha)
+
+  def _copy_commit(self, orig_commit, tree, parents, writer, action = 'split'):
+    # The original commit is a CommitRecord or, when merging, a Commit with the same fields.
+    # Parents are referenced by sha alone so the split history is not held in memory as a chain of
+    # fully loaded commits.
+    parents = [ git.Commit(self._repo, parent.binsha) for parent in parents ]
     new_commit = git.Commit(self._repo, git.Commit.NULL_BIN_SHA, tree, orig_commit.author,
                             orig_commit.authored_date, orig_commit.author_tz_offset,
                             orig_commit.committer, orig_commit.committed_date,
                             orig_commit.committer_tz_offset,
-                            "%s\n(sapling split of %s)" % (orig_commit.message, orig_commit.hexsha),
+                            "%s\n(sapling %s of %s)" % (orig_commit.message, action,
+                                                         orig_commit.hexsha),
                             parents, orig_commit.encoding)
 
-    return self._write_commit(new_commit)
-
-  def _write_commit(self, commit):
-    stream = StringIO.StringIO()
-    commit._serialize(stream)
-
-    stream_len = stream.tell()
-    stream.seek(0)
-
-    istream = self._repo.odb.store(gitdb.IStream(git.Commit.type, stream_len, stream))
-    commit.binsha = istream.binsha
-    return commit
-
-  def _subtrees(self, commit = None, ignore_not_found = True):
-    if commit is None:
-      commit = self._current_head_commit()
-
-    for path in self.paths:
-      try:
-        yield commit.tree / path
-      except KeyError as e:
-        if not ignore_not_found:
-          raise e
-
-  def _is_included(self, item):
-    return item.type is "blob" and not self._is_excluded(item)
-
-  def _is_excluded(self, item):
-    for exclude in self._excludes:
-      if exclude.match(item.path):
-        return True
-    return False
+    return writer.write_commit(new_commit)
 
   def _current_tree(self):
     return self._current_head_commit().tree
@@ -174,5 +534,5 @@ class Split(object):
     return "Split(name=%s, paths=%s, excludes=%s)" % (
       self._name,
       self.paths,
-      [ exclude.pattern for exclude in self._excludes ]
+      self._matcher.patterns
     )
@@ -0,0 +1,210 @@
+import git
+import itertools
+import lib
+
+from commits import read_commits
+from gitdb.util import hex_to_bin
+from stats import NullStats, Stats, TimedObjectDB, TimedWriter
+from tree import TreeBuilder, TreeReader
+from writer import OdbWriter
+
+class SplitSet(object):
+  """Represents a set of Splits of a git repository that are applied together.  Rather than each
+  split walking the history of the current head and reading its commits and trees separately, a
+  SplitSet walks history once, reads each commit and tree once and fans each commit out to every
+  split whose paths it touches.  Splits that share paths and excludes prune the trees of those paths
+  once between them."""
+
+  __slots__ = ('_repo', '_splits')
+
+  def __init__(self, repo, splits):
+    self._repo = repo
+    self._splits = list(splits)
+
+  @property
+  def splits(self):
+    """The Splits in this set."""
+    return self._splits
+
+  @classmethod
+  def create_cache(cls, splits):
+    """Creates a pruned tree cache for TreeBuilders sized for sharing between the given splits."""
+    return TreeBuilder.create_cache(TreeBuilder.DEFAULT_CACHE_SIZE * max(1, len(splits)))
+
+  class ApplyListener(object):
+    def on_start(self, commit_count):
+      pass
+    def on_commit(self, original_commit, new_commits):
+      pass
+    def on_commit_stats(self, original_commit, phases):
+      pass
+    def on_finish(self):
+      pass
+
+  def apply(self, branch_names, apply_listener = ApplyListener(), writer = None, stats = None,
+            reader = None, cache = None, index = None):
+    """Applies each split over the commits to the branch named by branch_names[split.name] and
+    returns a dict of the new tip commit of each split keyed by split name, or None for splits with
+    no (new) commits to split.  Each split splits exactly the commits Split.apply would, so the
+    branches written are the same, and as with Split.apply, splits whose branch already holds a
+    split of an ancestor of the current head only split newer commits.  An ApplyListener callback
+    can be passed to track progress; it's notified once per original commit walked with a dict of
+    the new commits made for it keyed by split name, which omits splits the commit does not change
+    or was collapsed in.  All splits are written with the given ObjectWriter, which is closed once
+    the splits are applied, or else straight to the repo's object database.  As with Split.apply,
+    the time spent in each phase can be recorded in a given Stats and the commits of each split are
+    found with the given ChangedPathsIndex if any.  Trees are read with the given TreeReader and
+    pruned trees cached in the given TreeBuilder cache if any, so a long running process can keep
+    both warm from one apply to the next."""
+
+    if writer is None:
+      writer = OdbWriter(self._repo)
+    if stats is None:
+      stats = NullStats()
+    else:
+      writer = TimedWriter(writer, stats)
+
+    try:
+      tips = self._apply(branch_names, apply_listener, writer, stats, reader, cache, index)
+    except:
+      writer.abort()
+      raise
+    writer.close()
+    return tips
+
+  def _apply(self, branch_names, apply_listener, writer, stats, reader, cache, index):
+    if reader is None:
+      odb = self._repo.odb
+      if isinstance(stats, Stats):
+        odb = TimedObjectDB(odb, stats)
+      reader = TreeReader(odb)
+
+    # Pruned trees are keyed by their source tree, path and excludes so splits sharing paths and
+    # excludes share the pruning of those paths; the cache grows with the splits sharing it.
+    if cache is None:
+      cache = SplitSet.create_cache(self._splits)
+    states = [ _SplitState(self._repo, split, branch_names[split.name], reader, cache, writer,
+                           stats)
+               for split in self._splits ]
+
+    with stats.phase('enumerate', 0):
+      walk = self._walk(states, index)
+    tips = dict((split.name, None) for split in self._splits)
+    if not walk:
+      return tips
+
+    # Like Split.apply each commit is streamed through resolution, tree building and writing.
+    apply_listener.on_start(len(walk))
+    try:
+      commits = read_commits(self._repo.odb, [ binsha for (binsha, _) in walk ])
+      for ((_, walk_states), commit) in itertools.izip(walk, stats.timed('read', commits)):
+        new_commits = {}
+        for state in walk_states:
+          with stats.phase('resolve'):
+            resolved = state.resolve(commit)
+          if resolved is not None:
+            new_commit = state.copy(commit, resolved)
+            if new_commit is not None:
+              new_commits[state.split.name] = new_commit
+        apply_listener.on_commit(commit, new_commits)
+        phases = stats.commit_done(commit)
+        if phases is not None:
+          apply_listener.on_commit_stats(commit, phases)
+
+      for state in states:
+        tips[state.split.name] = state.finish()
+      return tips
+
+    finally:
+      apply_listener.on_finish()
+
+  def _walk(self, states, index):
+    # Returns the commits to split as a list of (binsha, states) tuples.  Each split is handed
+    # exactly the commits Split.apply splits, in the same order: its own history of its paths since
+    # its resume point as git simplifies it.  The histories of all the splits are merged into a
+    # single walk that keeps the order of each, so commits shared by several splits are read once.
+    histories = [ state.split._commit_binshas(True, state.since, index) for state in states ]
+    positions = [ 0 ] * len(states)
+
+    # The number of splits still to be handed each commit and the splits each commit is next for.
+    pending = {}
+    for history in histories:
+      for binsha in history:
+        pending[binsha] = pending.get(binsha, 0) + 1
+    next_for = {}
+    for (i, history) in enumerate(histories):
+      if history:
+        next_for.setdefault(history[0], []).append(i)
+
+    walk = []
+    while next_for:
+      heads = [ histories[i][positions[i]] for i in range(len(states))
+                if positions[i] < len(histories[i]) ]
+      # A commit is walked once it is next for every split still to be handed it.  Should two
+      # histories order their shared commits differently, which clock skew can cause, the commit
+      # is walked separately for the splits it is next for.
+      binsha = lib.find(heads, lambda binsha: len(next_for[binsha]) == pending[binsha],
+                        lambda: heads[0])
+      indexes = next_for.pop(binsha)
+      pending[binsha] -= len(indexes)
+      walk.append((binsha, [ states[i] for i in indexes ]))
+      for i in indexes:
+        positions[i] += 1
+        if positions[i] < len(histories[i]):
+          next_for.setdefault(histories[i][positions[i]], []).append(i)
+    return walk
+
+class _SplitState(object):
+  """Tracks the progress of a single Split during a SplitSet walk."""
+
+  __slots__ = ('split', 'since', '_repo', '_branch_name', '_writer', '_builder',
+               '_stats', '_parent', '_resolved', '_count')
+
+  def __init__(self, repo, split, branch_name, reader, cache, writer, stats):
+    self.split = split
+
+    self._repo = repo
+    self._branch_name = branch_name
+    self._writer = writer
+    self._builder = split._tree_builder(writer, reader = reader, cache = cache, stats = stats)
+    self._stats = stats
+    self._count = 0
+
+    resume_point = split.resume_point(branch_name)
+    if resume_point is None:
+      (self._parent, self.since) = (None, None)
+      self._resolved = tuple(None for path in split.paths)
+    else:
+      (self._parent, self.since) = resume_point
+      self._resolved = self._builder.resolve(git.Commit(repo, hex_to_bin(self.since)).tree.binsha)
+
+  def resolve(self, commit):
+    """Returns the split paths resolved in the given commit of the split's history, or None if
+    they are unchanged from the commit before it and so is its split tree."""
+
+    resolved = self._builder.resolve(commit.tree_binsha)
+    if resolved == self._resolved and not self.split.keep_empty:
+      return None
+
+    self._resolved = resolved
+    return resolved
+
+  def copy(self, commit, resolved):
+    """Splits the given commit and returns the new commit or None if it was collapsed."""
+
+    with self._stats.phase('build'):
+      tree = git.Tree(self._repo, self._builder.build(commit.tree_binsha, resolved), path = '')
+    if self.split._is_unchanged(tree, self._parent):
+      return None
+
+    parents = [] if self._parent is None else [ self._parent ]
+    with self._stats.phase('copy'):
+      self._parent = self.split._copy_commit(commit, tree, parents, self._writer)
+    self._count += 1
+    return self._parent
+
+  def finish(self):
+    if not self._count:
+      return None
+    self._writer.update_branch(self._branch_name, self._parent)
+    return self._parent
@@ -0,0 +1,211 @@
+import contextlib
+import gitdb
+import StringIO
+import time
+
+from writer import ObjectWriter
+
+class Stats(object):
+  """Records where the time goes when applying splits.  Time is attributed to named phases along
+  with the number of objects or operations each phase handled, both in total and for each original
+  commit split.  A phase's time excludes the time of any phases nested within it."""
+
+  __slots__ = ('_totals', '_commits', '_current', '_stack')
+
+  # The phases splits are applied in, in the order they are reported.
+  PHASES = ('enumerate', 'read', 'resolve', 'match', 'build', 'copy', 'write', 'finish')
+
+  def __init__(self):
+    self._totals = {}
+    self._commits = []
+    self._current = {}
+    self._stack = []
+
+  @contextlib.contextmanager
+  def phase(self, name, count = 1):
+    """A context manager that attributes the time spent within it to the named phase."""
+
+    frame = [ time.time(), 0.0 ]
+    self._stack.append(frame)
+    try:
+      yield
+    finally:
+      self._stack.pop()
+      elapsed = time.time() - frame[0]
+      if self._stack:
+        self._stack[-1][1] += elapsed
+      self._record(name, elapsed - frame[1], count)
+
+  def timed(self, name, iterable):
+    """Iterates over the iterable attributing the time spent producing each item to the named
+    phase."""
+
+    iterator = iter(iterable)
+    while True:
+      start = time.time()
+      try:
+        item = next(iterator)
+      except StopIteration:
+        self._record(name, time.time() - start, 0)
+        return
+      self._record(name, time.time() - start, 1)
+      yield item
+
+  def commit_done(self, original_commit):
+    """Closes out the phases recorded for the given original commit and returns them as a dict of
+    (seconds, count) tuples keyed by phase name."""
+
+    phases = dict((name, tuple(entry)) for (name, entry) in self._current.items())
+    self._commits.append((original_commit.hexsha, phases))
+    self._current = {}
+    return phases
+
+  @property
+  def totals(self):
+    """A dict of the total (seconds, count) of each phase keyed by phase name."""
+    return dict((name, tuple(entry)) for (name, entry) in self._totals.items())
+
+  def merge(self, data):
+    """Adds in the phases of another Stats as returned by its as_dict."""
+
+    for (name, phase) in data['phases'].items():
+      self._add(self._totals, name, phase['seconds'], phase['count'])
+    for commit in data['commits']:
+      phases = dict((name, (phase['seconds'], phase['count']))
+                    for (name, phase) in commit['phases'].items())
+      self._commits.append((commit['commit'], phases))
+
+  def as_dict(self):
+    """Returns the recorded phases as a dict suitable for serializing as JSON."""
+
+    def describe(phases):
+      return dict((name, { 'seconds': seconds, 'count': count })
+                  for (name, (seconds, count)) in phases.items())
+
+    return {
+      'seconds': sum(seconds for (seconds, _) in self._totals.values()),
+      'phases': describe(self._totals),
+      'commits': [ { 'commit': hexsha, 'phases': describe(phases) }
+                   for (hexsha, phases) in self._commits ],
+    }
+
+  def summary(self):
+    """Returns a table of the time spent and operations performed in each phase."""
+
+    total = sum(seconds for (seconds, _) in self._totals.values())
+    lines = [ "%-10s %10s %7s %10s %12s" % ('phase', 'seconds', '%', 'count', 'ms/op') ]
+    for name in self._ordered(self._totals):
+      (seconds, count) = self._totals[name]
+      lines.append("%-10s %10.3f %6.1f%% %10d %12s" % (
+        name, seconds, seconds / total * 100 if total else 0, count,
+        '%.3f' % (seconds / count * 1000) if count else '-'))
+    lines.append("%-10s %10.3f %6.1f%% %10d" % ('total', total, 100 if total else 0,
+                                                len(self._commits)))
+    return '\n'.join(lines)
+
+  def _ordered(self, phases):
+    known = [ name for name in Stats.PHASES if name in phases ]
+    return known + sorted(name for name in phases if name not in Stats.PHASES)
+
+  def _record(self, name, seconds, count):
+    self._add(self._totals, name, seconds, count)
+    self._add(self._current, name, seconds, count)
+
+  def _add(self, phases, name, seconds, count):
+    entry = phases.get(name)
+    if entry is None:
+      phases[name] = [ seconds, count ]
+    else:
+      entry[0] += seconds
+      entry[1] += count
+
+
+class NullStats(object):
+  """Stands in for Stats when no stats are being collected."""
+
+  __slots__ = ()
+
+  @contextlib.contextmanager
+  def phase(self, name, count = 1):
+    yield
+
+  def timed(self, name, iterable):
+    return iterable
+
+  def commit_done(self, original_commit):
+    return None
+
+
+class TimedObjectDB(object):
+  """Wraps an object database attributing the time spent reading objects to the read phase."""
+
+  __slots__ = ('_odb', '_stats')
+
+  def __init__(self, odb, stats):
+    self._odb = odb
+    self._stats = stats
+
+  def stream(self, binsha):
+    with self._stats.phase('read'):
+      return self._read(self._odb.stream(binsha))
+
+  def stream_all(self, binshas):
+    with self._stats.phase('read', len(binshas)):
+      if hasattr(self._odb, 'stream_all'):
+        return [ self._read(ostream) for ostream in self._odb.stream_all(binshas) ]
+      # Lazy streams may share a single git cat-file process, so each is read as it is opened.
+      return [ self._read(self._odb.stream(binsha)) for binsha in binshas ]
+
+  def _read(self, ostream):
+    # Object data can be read lazily so it is read here to be timed.
+    data = ostream.read()
+    return gitdb.OStream(ostream.binsha, ostream.type, len(data), StringIO.StringIO(data))
+
+
+class TimedWriter(ObjectWriter):
+  """Wraps an ObjectWriter attributing the time spent writing objects to the write phase and the
+  time spent updating branches and closing the writer to the finish phase."""
+
+  def __init__(self, writer, stats):
+    self._writer = writer
+    self._stats = stats
+
+  def write_tree(self, entries):
+    with self._stats.phase('write'):
+      return self._writer.write_tree(entries)
+
+  def write_commit(self, commit):
+    with self._stats.phase('write'):
+      return self._writer.write_commit(commit)
+
+  def update_branch(self, branch_name, commit):
+    with self._stats.phase('finish'):
+      self._writer.update_branch(branch_name, commit)
+
+  def close(self):
+    with self._stats.phase('finish'):
+      self._writer.close()
+
+  def abort(self):
+    self._writer.abort()
+
+
+class TimedMatcher(object):
+  """Wraps an ExcludeMatcher attributing the time spent matching paths to the match phase."""
+
+  __slots__ = ('_matcher', '_stats')
+
+  def __init__(self, matcher, stats):
+    self._matcher = matcher
+    self._stats = stats
+
+  @property
+  def patterns(self):
+    return self._matcher.patterns
+
+  def matches(self, path):
+    with self._stats.phase('match'):
+      return self._matcher.matches(path)
+
+  def __nonzero__(self):
+    return bool(self._matcher)
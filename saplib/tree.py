@@ -0,0 +1,201 @@
+import stat
+
+from cache import LRUCache
+from git.objects.fun import tree_entries_from_data
+from gitdb.util import hex_to_bin
+
+TREE_MODE = 0o040000
+GITLINK_MODE = 0o160000
+
+# The binsha of the tree with no entries.
+EMPTY_TREE = hex_to_bin('4b825dc642cb6eb9a060e54bf8d69288fbee4904')
+
+_UNKNOWN = object()
+
+def is_tree(mode):
+  return stat.S_ISDIR(mode)
+
+def is_gitlink(mode):
+  return stat.S_IFMT(mode) == GITLINK_MODE
+
+def sort_entries(entries):
+  """Sorts a list of (binsha, mode, name) tree entries in place into the order git stores them."""
+  entries.sort(key = _sort_key)
+
+def _sort_key(entry):
+  (binsha, mode, name) = entry
+  if isinstance(name, unicode):
+    name = name.encode('utf-8')
+  return name + '/' if is_tree(mode) else name
+
+
+class TreeReader(object):
+  """Reads tree objects from an object database, caching the decoded entries of recently read
+  trees so trees shared by many commits or splits are only decoded once."""
+
+  __slots__ = ('_odb', '_entries')
+
+  DEFAULT_CACHE_SIZE = 4096
+
+  def __init__(self, odb, cache_size = DEFAULT_CACHE_SIZE):
+    self._odb = odb
+    self._entries = LRUCache(cache_size)
+
+  def entries(self, binsha):
+    """Returns a tuple of the (binsha, mode, name) entries of the tree with the given binsha."""
+
+    entries = self._entries.get(binsha)
+    if entries is None:
+      entries = tuple(tree_entries_from_data(self._odb.stream(binsha).read()))
+      self._entries[binsha] = entries
+    return entries
+
+  def prefetch(self, binshas):
+    """Reads and caches the entries of the trees with the given binshas.  If the object database
+    supports it, the trees not already cached are read in a single batch."""
+
+    missing = [ binsha for binsha in binshas if binsha not in self._entries ]
+    if len(missing) > 1 and hasattr(self._odb, 'stream_all'):
+      for ostream in self._odb.stream_all(missing):
+        self._entries[ostream.binsha] = tuple(tree_entries_from_data(ostream.read()))
+
+  def find(self, binsha, name):
+    """Returns the entry with the given name in the tree with the given binsha or None if there is
+    no such entry."""
+
+    for entry in self.entries(binsha):
+      if entry[2] == name:
+        return entry
+    return None
+
+
+class TreeBuilder(object):
+  """Composes split trees directly out of the tree objects of the commits being split.  Subtrees
+  unaffected by the split's excludes are re-used verbatim so only the trees grafting the split paths
+  together and the trees that have excluded blobs pruned out need to be written."""
+
+  __slots__ = ('_reader', '_writer', '_trie', '_matcher', '_excludes_key', '_pruned')
+
+  DEFAULT_CACHE_SIZE = 65536
+
+  @classmethod
+  def create_cache(cls, size = DEFAULT_CACHE_SIZE):
+    """Creates a cache of pruned trees suitable for passing to a TreeBuilder."""
+    return LRUCache(size)
+
+  def __init__(self, reader, writer, trie, matcher, cache = None):
+    """Creates a TreeBuilder that reads source trees with the given TreeReader, which can be shared
+    amongst TreeBuilders, and writes split trees with the given ObjectWriter.  The trees built
+    contain the paths in the given PathTrie less any blobs whose path the given ExcludeMatcher
+    matches.  Pruned subtrees are memoized in the given cache keyed by source tree sha, path and
+    excludes; if no cache is supplied a private cache of the default size is used."""
+
+    self._reader = reader
+    self._writer = writer
+    self._trie = trie
+    self._matcher = matcher
+    self._excludes_key = frozenset(matcher.patterns)
+    self._pruned = TreeBuilder.create_cache() if cache is None else cache
+
+  def resolve(self, tree_binsha):
+    """Returns a tuple of the (binsha, mode) of each split path in the source tree with the given
+    binsha or None for the paths the tree does not contain.  Two trees resolving to equal tuples
+    build the same split tree."""
+
+    return self._trie.resolve(self._reader.entries, tree_binsha, is_tree)
+
+  def build(self, tree_binsha, resolved = None):
+    """Builds the split tree for the source tree with the given binsha and returns its binsha.  The
+    paths resolved for the tree can be passed if already known."""
+
+    if resolved is None:
+      resolved = self.resolve(tree_binsha)
+
+    graft = {}
+    for (path, entry) in zip(self._trie.paths, resolved):
+      if entry is not None:
+        self._graft(graft, path.split('/'), entry)
+
+    binsha = self._write_graft(graft, '')
+    return self._write([]) if binsha is None else binsha
+
+  def _graft(self, node, names, entry):
+    name = names[0]
+    if len(names) == 1:
+      # A whole subtree subsumes any more specific paths grafted within it.
+      node[name] = entry
+    else:
+      child = node.get(name)
+      if isinstance(child, tuple):
+        return
+      if child is None:
+        child = node[name] = {}
+      self._graft(child, names[1:], entry)
+
+  def _write_graft(self, node, prefix):
+    entries = []
+    for (name, child) in node.items():
+      path = prefix + name
+      if isinstance(child, dict):
+        (binsha, mode) = (self._write_graft(child, path + '/'), TREE_MODE)
+      else:
+        (binsha, mode) = child
+        binsha = self._prune(binsha, mode, path)
+      if binsha is not None:
+        entries.append((binsha, mode, name))
+
+    if not entries:
+      return None
+    sort_entries(entries)
+    return self._write(entries)
+
+  def _prune(self, binsha, mode, path):
+    if is_tree(mode):
+      return self._prune_tree(binsha, path)
+    elif is_gitlink(mode) or self._matcher.matches(path):
+      return None
+    else:
+      return binsha
+
+  def _prune_tree(self, binsha, path):
+    key = self._pruned_key(binsha, path)
+    pruned = self._pruned.get(key, _UNKNOWN)
+    if pruned is not _UNKNOWN:
+      return pruned
+
+    tree_entries = self._reader.entries(binsha)
+    self._prefetch_subtrees(tree_entries, path)
+
+    entries = []
+    changed = False
+    for (child_binsha, mode, name) in tree_entries:
+      pruned_binsha = self._prune(child_binsha, mode, '%s/%s' % (path, name))
+      if pruned_binsha is None:
+        changed = True
+      else:
+        changed = changed or pruned_binsha != child_binsha
+        entries.append((pruned_binsha, mode, name))
+
+    if not entries:
+      pruned = None
+    elif changed:
+      pruned = self._write(entries)
+    else:
+      pruned = binsha
+
+    self._pruned[key] = pruned
+    return pruned
+
+  def _prefetch_subtrees(self, tree_entries, path):
+    subtrees = []
+    for (binsha, mode, name) in tree_entries:
+      if is_tree(mode) and self._pruned_key(binsha, '%s/%s' % (path, name)) not in self._pruned:
+        subtrees.append(binsha)
+    self._reader.prefetch(subtrees)
+
+  def _pruned_key(self, binsha, path):
+    # Without excludes the pruned tree depends only on the tree content and not its location.
+    return (binsha, path if self._matcher else None, self._excludes_key)
+
+  def _write(self, entries):
+    return self._writer.write_tree(entries)
@@ -0,0 +1,351 @@
+import collections
+import git
+import gitdb
+import hashlib
+import lib
+import os
+import StringIO
+import subprocess
+import threading
+
+from cache import LRUCache
+from git.objects.fun import tree_to_stream
+from git.objects.util import altz_to_utctz_str
+from gitdb.util import bin_to_hex, hex_to_bin
+
+def serialize_tree(entries):
+  """Returns the raw data of a tree object with the given sorted (binsha, mode, name) entries."""
+
+  stream = StringIO.StringIO()
+  tree_to_stream(entries, stream.write)
+  return stream.getvalue()
+
+def object_sha(typename, data):
+  """Returns the binsha git gives an object of the given type and raw data."""
+  return hashlib.sha1('%s %d\0%s' % (typename, len(data), data)).digest()
+
+
+class ObjectWriter(object):
+  """Writes the trees and commits of a split and points split branches at them.  A writer is closed
+  once a split is applied; only then are all the objects and branches it was handed guaranteed to
+  be written."""
+
+  def write_tree(self, entries):
+    """Writes a tree with the given sorted (binsha, mode, name) entries and returns its binsha."""
+    raise NotImplementedError
+
+  def write_commit(self, commit):
+    """Writes the given git.Commit, setting its binsha, and returns it."""
+    raise NotImplementedError
+
+  def update_branch(self, branch_name, commit):
+    """Points the named branch at the given commit, creating the branch if needed."""
+    raise NotImplementedError
+
+  def close(self):
+    """Finishes writing all objects and branches."""
+    pass
+
+  def abort(self):
+    """Abandons writing; objects and branches not yet written may never be written."""
+    pass
+
+
+class OdbWriter(ObjectWriter):
+  """Writes objects one at a time straight to the repo's object database.  Objects are hashed in
+  memory first and only stored if the object database does not already have them; storing an
+  object costs a compressed temporary file even when the object turns out to exist."""
+
+  DEFAULT_CACHE_SIZE = 65536
+
+  def __init__(self, repo, cache_size = DEFAULT_CACHE_SIZE):
+    self._repo = repo
+    self._written = LRUCache(cache_size)
+
+  def write_tree(self, entries):
+    return self.store(git.Tree.type, serialize_tree(entries), entries)
+
+  def write_commit(self, commit):
+    stream = StringIO.StringIO()
+    commit._serialize(stream)
+    commit.binsha = self.store(git.Commit.type, stream.getvalue())
+    return commit
+
+  def update_branch(self, branch_name, commit):
+    branch = lib.find(self._repo.branches,
+                      lambda branch: branch.name == branch_name,
+                      lambda: self._repo.create_head(branch_name))
+    branch.commit = commit
+
+  def store(self, typename, data, entries = None):
+    """Stores the object with the given type name and raw data unless it is already stored and
+    returns its binsha.  The sorted (binsha, mode, name) entries of trees can be passed along."""
+
+    binsha = object_sha(typename, data)
+    if binsha not in self._written:
+      if not self._repo.odb.has_object(binsha):
+        self._write(binsha, typename, data, entries)
+      self._written[binsha] = True
+    return binsha
+
+  def _write(self, binsha, typename, data, entries):
+    # Trees are also passed their entries.
+    self._repo.odb.store(gitdb.IStream(typename, len(data), StringIO.StringIO(data)))
+
+
+class MktreeWriter(OdbWriter):
+  """Writes trees through a single persistent git mktree --batch process so they are compressed and
+  stored by git itself; commits are written as OdbWriter writes them.  Trees are streamed to git
+  mktree without waiting on it since their binshas are already known; the binshas it reports are
+  checked against them on a reader thread and any mismatch is raised by the next write or on close.
+  Branches are only updated once git mktree has stored every tree.  Git mktree normalizes the odd
+  file modes very old versions of git wrote, so trees with such modes are stored as OdbWriter
+  stores them to keep splits identical whichever writer is used."""
+
+  # The modes git mktree writes unchanged.
+  _CANONICAL_MODES = frozenset([ 0o040000, 0o100644, 0o100755, 0o120000, 0o160000 ])
+
+  def __init__(self, repo, cache_size = OdbWriter.DEFAULT_CACHE_SIZE):
+    OdbWriter.__init__(self, repo, cache_size = cache_size)
+    self._process = None
+    self._reader = None
+    self._expected = collections.deque()
+    self._error = None
+    self._branches = []
+
+  def update_branch(self, branch_name, commit):
+    self._branches.append((branch_name, commit))
+
+  def close(self):
+    self._finish()
+    for (branch_name, commit) in self._branches:
+      OdbWriter.update_branch(self, branch_name, commit)
+
+  def abort(self):
+    self._finish(check = False)
+
+  def _write(self, binsha, typename, data, entries):
+    if entries is None or not all(mode in MktreeWriter._CANONICAL_MODES
+                                  for (_, mode, _) in entries):
+      OdbWriter._write(self, binsha, typename, data, entries)
+      return
+
+    self._check()
+    if self._process is None:
+      self._process = subprocess.Popen([ git.Git.GIT_PYTHON_GIT_EXECUTABLE, 'mktree', '-z',
+                                         '--missing', '--batch' ],
+                                       bufsize = -1,
+                                       cwd = self._repo.working_dir,
+                                       stdin = subprocess.PIPE,
+                                       stdout = subprocess.PIPE)
+      self._reader = threading.Thread(target = self._verify, args = (self._process.stdout,))
+      self._reader.daemon = True
+      self._reader.start()
+
+    lines = []
+    for (child_binsha, mode, name) in entries:
+      if isinstance(name, unicode):
+        name = name.encode('utf-8')
+      lines.append('%06o %s %s\t%s\0' % (mode, self._type(mode), bin_to_hex(child_binsha), name))
+    # Each tree of the batch is terminated by an empty entry.
+    lines.append('\0')
+    self._expected.append(bin_to_hex(binsha))
+    self._process.stdin.write(''.join(lines))
+
+  def _type(self, mode):
+    if mode == 0o040000:
+      return git.Tree.type
+    if mode == 0o160000:
+      return git.Commit.type
+    return git.Blob.type
+
+  def _verify(self, stdout):
+    # Runs on the reader thread, draining git mktree's output as it comes so it never blocks
+    # writing while the writing thread blocks in turn on a full stdin pipe.
+    for line in iter(stdout.readline, ''):
+      written = line.strip()
+      expected = self._expected.popleft()
+      if written != expected and self._error is None:
+        self._error = "Expected tree %s but wrote %s" % (expected, written)
+
+  def _check(self):
+    if self._error is not None:
+      raise git.GitCommandError([ 'git', 'mktree' ], 1, self._error)
+
+  def _finish(self, check = True):
+    if self._process is None:
+      return
+    (process, self._process) = (self._process, None)
+    try:
+      process.stdin.close()
+    except IOError:
+      # Git mktree already exited; its status tells why.
+      pass
+    self._reader.join()
+    process.stdout.close()
+    status = process.wait()
+    if check:
+      if status != 0:
+        raise git.GitCommandError([ 'git', 'mktree' ], status)
+      if self._expected:
+        self._error = "Exited before writing tree %s" % self._expected[0]
+      self._check()
+
+
+class FastImportWriter(ObjectWriter):
+  """Streams objects through a single git fast-import process that writes them to a single pack.
+  Trees are only hashed as they are built; each commit is sent to fast-import described in terms of
+  the trees and blobs it already knows.  Branches are updated when the writer is closed."""
+
+  # All commits are made on a scratch ref under this prefix and given explicit parents; branches
+  # are reset to them after.  Each writer has a ref of its own so writers in several processes, as
+  # with --jobs, do not contend for it.
+  SCRATCH_REFS = 'refs/sapling/fast-import'
+
+  def __init__(self, repo):
+    self._repo = repo
+    self._scratch_ref = '%s/%d-%x' % (FastImportWriter.SCRATCH_REFS, os.getpid(), id(self))
+    self._process = subprocess.Popen([ git.Git.GIT_PYTHON_GIT_EXECUTABLE, 'fast-import', '--quiet',
+                                       '--done', '--force' ],
+                                     cwd = repo.working_dir,
+                                     stdin = subprocess.PIPE,
+                                     stdout = subprocess.PIPE)
+    self._pending_trees = {}
+    self._sent_trees = set()
+    self._marks = {}
+    self._mark_count = 0
+
+  def write_tree(self, entries):
+    binsha = object_sha(git.Tree.type, serialize_tree(entries))
+    if binsha not in self._sent_trees:
+      self._pending_trees[binsha] = entries
+    return binsha
+
+  def write_commit(self, commit):
+    self._mark_count += 1
+    mark = self._mark_count
+
+    lines = []
+    if not commit.parents:
+      lines.append('reset %s' % self._scratch_ref)
+    lines.append('commit %s' % self._scratch_ref)
+    lines.append('mark :%d' % mark)
+    lines.append(self._identity('author', commit.author, commit.authored_date,
+                                commit.author_tz_offset, commit.encoding))
+    lines.append(self._identity('committer', commit.committer, commit.committed_date,
+                                commit.committer_tz_offset, commit.encoding))
+    if commit.encoding != commit.default_encoding:
+      lines.append('encoding %s' % commit.encoding)
+
+    message = commit.message
+    if isinstance(message, unicode):
+      message = message.encode(commit.encoding)
+    lines.append('data %d\n%s' % (len(message), message))
+
+    for (index, parent) in enumerate(commit.parents):
+      lines.append('%s %s' % ('from' if index == 0 else 'merge', self._commitish(parent.binsha)))
+
+    sent = set()
+    tree_binsha = commit.tree.binsha
+    if tree_binsha in self._pending_trees:
+      lines.append('deleteall')
+      self._describe(tree_binsha, '', lines, sent)
+    else:
+      lines.append('M 040000 %s ""' % bin_to_hex(tree_binsha))
+
+    lines.append('get-mark :%d' % mark)
+    self._send(lines)
+    commit.binsha = hex_to_bin(self._process.stdout.readline().strip())
+
+    for binsha in sent:
+      self._pending_trees.pop(binsha, None)
+      self._sent_trees.add(binsha)
+    self._marks[commit.binsha] = mark
+    return commit
+
+  def update_branch(self, branch_name, commit):
+    self._send([ 'reset refs/heads/%s' % branch_name, 'from %s' % self._commitish(commit.binsha) ])
+
+  def close(self):
+    self._send([ 'done' ])
+    self._finish()
+    if self._mark_count:
+      self._repo.git.update_ref('-d', self._scratch_ref)
+
+  def abort(self):
+    # Ending the stream without a done command leaves all refs alone but makes fast-import fail
+    # with a crash report, so it is killed instead and the pack it was writing removed.
+    temp_packs = self._temp_packs()
+    if self._process.poll() is None:
+      self._process.terminate()
+    self._finish(check = False)
+    for path in temp_packs:
+      try:
+        os.remove(path)
+      except OSError:
+        pass
+
+  def _temp_packs(self):
+    # The pack fast-import writes is open under a temporary name until done; it can only be told
+    # apart from those of other git processes by the open files of the process, so without /proc
+    # it is left for git gc to prune.
+    fd_dir = '/proc/%d/fd' % self._process.pid
+    try:
+      fds = os.listdir(fd_dir)
+    except OSError:
+      return []
+
+    temp_packs = []
+    for fd in fds:
+      try:
+        path = os.readlink(os.path.join(fd_dir, fd))
+      except OSError:
+        continue
+      if os.path.basename(path).startswith('tmp_pack_'):
+        temp_packs.append(path)
+    return temp_packs
+
+  def _finish(self, check = True):
+    self._process.stdin.close()
+    self._process.stdout.close()
+    status = self._process.wait()
+    if check and status != 0:
+      raise git.GitCommandError([ 'git', 'fast-import' ], status)
+
+  def _identity(self, kind, actor, date, tz_offset, encoding):
+    line = "%s %s <%s> %s %s" % (kind, actor.name, actor.email, date, altz_to_utctz_str(tz_offset))
+    return line.encode(encoding) if isinstance(line, unicode) else line
+
+  def _commitish(self, binsha):
+    mark = self._marks.get(binsha)
+    return bin_to_hex(binsha) if mark is None else ':%d' % mark
+
+  def _describe(self, binsha, path, lines, sent):
+    # Identical new trees can appear at more than one path in a commit; fast-import only knows about
+    # them once the commit is complete so each occurrence is described in full.
+    sent.add(binsha)
+    for (child_binsha, mode, name) in self._pending_trees[binsha]:
+      if isinstance(name, unicode):
+        name = name.encode('utf-8')
+      child_path = '%s/%s' % (path, name) if path else name
+
+      if child_binsha in self._pending_trees:
+        self._describe(child_binsha, child_path, lines, sent)
+      else:
+        lines.append('M %06o %s %s' % (self._normalize(mode), bin_to_hex(child_binsha),
+                                       self._quote(child_path)))
+
+  def _normalize(self, mode):
+    if mode in (0o040000, 0o100644, 0o100755, 0o120000, 0o160000):
+      return mode
+    # Old git wrote regular files with other permission bits which fast-import does not accept.
+    return 0o100755 if mode & 0o111 else 0o100644
+
+  def _quote(self, path):
+    if path.startswith('"') or '\n' in path:
+      return '"%s"' % path.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return path
+
+  def _send(self, lines):
+    self._process.stdin.write('\n'.join(lines) + '\n')
+    self._process.stdin.flush()
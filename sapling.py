@@ -1,10 +1,11 @@
 #!/usr/bin/env python
 from __future__ import print_function
-from __builtin__ import list as pylist
 
 from sapversion import version
 
-import git
+# GitPython and gitdb are slow to import and are only needed once a repository is opened, so they,
+# like other modules only some subcommands use, are imported where used.  The saplib package itself
+# defers importing its modules until they're used.
 import optparse
 import os
 import saplib
@@ -19,8 +20,9 @@ def usage(message, *args):
   exit(1)
 
 def open_repo(native = True):
+  import git
   try:
-    return git.Repo(odbt = git.db.GitCmdObjectDB if native else git.db.GitDB)
+    return git.Repo(odbt = saplib.CatFileObjectDB if native else git.db.GitDB)
   except git.exc.InvalidGitRepositoryError:
     usage("Must be inside a git repository")
 
@@ -29,7 +31,8 @@ def open_config(repo):
   if os.path.exists(config_path):
     with open(config_path, 'r') as config:
       try:
-        return saplib.Config(repo, config.read())
+        return saplib.Config(repo, config.read(),
+                             cache_path = os.path.join(repo.git_dir, 'sapling', 'config'))
       except saplib.ConfigError as e:
         usage("Problem loading .saplings config: %s", e)
   else:
@@ -63,6 +66,7 @@ def install(show = False, force = False):
     print("symlink exists: %s" % installed_link_path)
 
 def list(repo, split_config, verbose):
+  index = saplib.ChangedPathsIndex(repo) if verbose else None
   for split in split_config.splits.values():
     print(split.name)
     if verbose:
@@ -70,71 +74,504 @@ def list(repo, split_config, verbose):
         "%s/" % os.path.relpath(os.path.join(repo.working_tree_dir, path)) for path in split.paths
       )
       log("paths (%d):\n\t%s", len(split.paths), "\n\t".join(paths))
+      log("commits: %d", split.commit_count(index = index))
+
+class ProgressTracker(object):
+  """Reports the progress of a split to stderr as a progress bar or, if verbose, a line per
+  commit."""
+
+  def __init__(self, description, verbose):
+    self._description = description
+    self._verbose = verbose
+    self._commit_index = 0
+    self._width = 80.0
+    self._pct = 0
+    self._pct_complete = 0
+
+  def on_start(self, commit_count):
+    self._commit_count = commit_count
+    message = "[%s] Processing %d commits" % (self._description, self._commit_count)
+    if self._verbose:
+      log(message)
+    else:
+      self._width = max(len(message) + 2.0, float(self._width))
+      self._quantum = self._commit_count / self._width
+      log(message + (" " * (int(self._width) - len(message) - 1)) + "|")
+
+  def on_commit(self, original_commit, new_commit):
+    self._commit_index += 1
+
+    if self._verbose:
+      log("%s -> %s (%d of %d)", original_commit.hexsha, self._describe(new_commit),
+          self._commit_index, self._commit_count)
+    else:
+      self._pct_complete = int(self._commit_index / self._quantum % self._commit_count)
+      if self._pct_complete > self._pct:
+        log("." * (self._pct_complete - self._pct), end = "")
+        self._pct = self._pct_complete
+        sys.__stdout__.flush()
+
+  def on_commit_stats(self, original_commit, phases):
+    if self._verbose:
+      log("  %s", ", ".join("%s %.1fms" % (name, seconds * 1000)
+                            for (name, (seconds, count)) in sorted(phases.items())))
+
+  def on_finish(self):
+    if not self._verbose:
+      log("." * (int(self._width) - self._pct_complete))
+
+  def _describe(self, new_commit):
+    return "(collapsed)" if new_commit is None else new_commit.hexsha
+
+class SplitSetProgressTracker(ProgressTracker):
+  """Reports the progress of a split set where each original commit maps to new commits in one or
+  more splits."""
+
+  def _describe(self, new_commits):
+    return ", ".join("%s: %s" % (name, commit.hexsha)
+                     for (name, commit) in sorted(new_commits.items())) or "(collapsed)"
+
+def branch_name(split):
+  # TODO(jsirois): allow customization of branch, consider special names:
+  # name1:branch1 name2 ... nameN:branchN
+  return '_sapling_split_%s_' % split.name
+
+class QueueProgressTracker(object):
+  """Forwards the progress of a split set applied in a worker process to the multiplexing
+  ProgressMultiplexer in the parent process."""
+
+  def __init__(self, queue, description):
+    self._queue = queue
+    self._description = description
+
+  def on_start(self, commit_count):
+    self._queue.put(('start', self._description, commit_count))
+
+  def on_commit(self, original_commit, new_commits):
+    new_shas = dict((name, commit.hexsha) for (name, commit) in new_commits.items())
+    self._queue.put(('commit', self._description, original_commit.hexsha, new_shas))
+
+  def on_commit_stats(self, original_commit, phases):
+    pass
+
+  def on_finish(self):
+    self._queue.put(('finish', self._description))
+
+class ProgressMultiplexer(object):
+  """Reports the progress of split sets being applied concurrently in worker processes.  When
+  verbose each new commit is logged, otherwise a single status line of all the running split sets
+  is kept up to date on a terminal."""
+
+  def __init__(self, verbose):
+    self._verbose = verbose
+    self._status = {}
+    self._redraw = not verbose and sys.stderr.isatty()
+
+  def on_event(self, event):
+    kind, description = event[0], event[1]
+    if kind == 'start':
+      self._status[description] = [0, event[2]]
+      self._log("[%s] Processing %d commits", description, event[2])
+    elif kind == 'commit':
+      status = self._status[description]
+      status[0] += 1
+      if self._verbose:
+        new_commits = ", ".join("%s: %s" % item for item in sorted(event[3].items()))
+        log("[%s] %s -> %s (%d of %d)", description, event[2], new_commits, status[0], status[1])
+      elif self._redraw:
+        self._draw()
+    elif kind == 'finish':
+      (commit_index, commit_count) = self._status.pop(description)
+      self._log("[%s] Split %d of %d commits", description, commit_index, commit_count)
+
+  def _log(self, message, *args):
+    if self._redraw:
+      log("\r\033[K" + message, *args)
+      self._draw()
+    else:
+      log(message, *args)
+
+  def _draw(self):
+    status = " ".join("[%s %d/%d]" % (description, index, count)
+                      for (description, (index, count)) in sorted(self._status.items()))
+    log("\r\033[K" + status, end = "")
+
+  def on_finish(self):
+    if self._redraw:
+      log("\r\033[K", end = "")
+
+_progress_queue = None
+
+def _init_worker(progress_queue):
+  global _progress_queue
+  _progress_queue = progress_queue
+
+def create_writer(repo, writer_type = 'odb'):
+  if writer_type == 'fast-import':
+    return saplib.FastImportWriter(repo)
+  elif writer_type == 'mktree':
+    return saplib.MktreeWriter(repo)
+  else:
+    return saplib.OdbWriter(repo)
+
+def _apply_splits(task):
+  import git
+  import traceback
 
-def split(splits, verbose, dry_run):
+  (working_tree_dir, odbt, writer_type, collect_stats, split_args) = task
+  try:
+    repo = git.Repo(working_tree_dir, odbt = odbt)
+    # The parent process already validated the split paths.
+    splits = [ saplib.Split(repo, name, patterns, keep_empty = keep_empty, validate = False)
+               for (name, patterns, keep_empty) in split_args ]
+    branch_names = dict((split.name, branch_name(split)) for split in splits)
+    description = ", ".join(split.name for split in splits)
+    stats = saplib.Stats() if collect_stats else None
+    tips = saplib.SplitSet(repo, splits).apply(branch_names,
+                                               QueueProgressTracker(_progress_queue, description),
+                                               writer = create_writer(repo, writer_type),
+                                               stats = stats,
+                                               index = saplib.ChangedPathsIndex(repo))
+    return (dict((name, tip and tip.hexsha) for (name, tip) in tips.items()),
+            stats and stats.as_dict(),
+            None)
+  except Exception:
+    return (None, None, traceback.format_exc())
+
+def group_splits(splits, jobs):
+  """Divides the splits into at most jobs evenly sized groups, keeping splits that share paths in
+  the same group where possible so they can share the trees pruned for those paths."""
+
+  group_count = min(jobs, len(splits))
+  capacity = (len(splits) + group_count - 1) // group_count
+  groups = [ [] for _ in range(group_count) ]
+  group_paths = [ set() for _ in range(group_count) ]
+  for split in splits:
+    open_groups = [ index for index in range(group_count) if len(groups[index]) < capacity ]
+    sharing = [ index for index in open_groups if group_paths[index].intersection(split.paths) ]
+    index = min(sharing or open_groups, key = lambda index: len(groups[index]))
+    groups[index].append(split)
+    group_paths[index].update(split.paths)
+  return [ group for group in groups if group ]
+
+def parallel_split(repo, splits, verbose, jobs, writer_type, stats = None):
+  """Applies the splits on a pool of jobs worker processes, each applying its share of the splits
+  as a SplitSet over its own repo handle.  The stats collected by each worker are merged into the
+  given Stats if any."""
+
+  import multiprocessing
+  import Queue
+
+  # The workers each load the changed-paths index, so it is brought up to date once up front.
+  saplib.ChangedPathsIndex(repo).update()
+
+  groups = group_splits(splits, jobs)
+  tasks = [ (repo.working_tree_dir,
+              type(repo.odb),
+              writer_type,
+              stats is not None,
+              [ (split.name, split.patterns, split.keep_empty) for split in group ])
+            for group in groups ]
+
+  progress_queue = multiprocessing.Queue()
+  pool = multiprocessing.Pool(len(tasks), _init_worker, (progress_queue,))
+  progress = ProgressMultiplexer(verbose)
+
+  def drain(timeout = None):
+    try:
+      while True:
+        progress.on_event(progress_queue.get(timeout = timeout) if timeout else
+                          progress_queue.get_nowait())
+    except Queue.Empty:
+      pass
+
+  try:
+    results = pool.map_async(_apply_splits, tasks)
+    while not results.ready():
+      drain(timeout = 0.1)
+    pool.close()
+    pool.join()
+    drain()
+  finally:
+    pool.terminate()
+    progress.on_finish()
+
+  tips = {}
+  for (group_tips, group_stats, error) in results.get():
+    if error:
+      usage("Problem applying splits:\n%s", error)
+    tips.update(group_tips)
+    if group_stats:
+      stats.merge(group_stats)
+  return tips
+
+def _build_trees(task):
+  import git
+  import traceback
+
+  (working_tree_dir, odbt, writer_type, name, patterns, keep_empty, hexshas) = task
+  try:
+    repo = git.Repo(working_tree_dir, odbt = odbt)
+    split = saplib.Split(repo, name, patterns, keep_empty = keep_empty, validate = False)
+    # Fast-import writes a pack per process and only once closed, so workers write loose objects.
+    writer = create_writer(repo, 'odb' if writer_type == 'fast-import' else writer_type)
+    try:
+      trees = split.build_trees(hexshas, writer)
+    except:
+      writer.abort()
+      raise
+    writer.close()
+    return (trees, None)
+  except Exception:
+    return (None, traceback.format_exc())
+
+def parallel_build_trees(repo, split, hexshas, jobs, writer_type):
+  """Builds the split trees of the original commits with the given hexshas on a pool of jobs worker
+  processes and returns them as a dict of tree binshas keyed by hexsha.  The commits are handed out
+  in runs of neighbouring commits, which share most of their trees."""
+
+  import multiprocessing
+
+  chunk_size = max(1, len(hexshas) // (jobs * 4))
+  tasks = [ (repo.working_tree_dir,
+             type(repo.odb),
+             writer_type,
+             split.name,
+             split.patterns,
+             split.keep_empty,
+             hexshas[start:start + chunk_size])
+            for start in range(0, len(hexshas), chunk_size) ]
+
+  pool = multiprocessing.Pool(min(jobs, len(tasks)))
+  try:
+    results = pool.map(_build_trees, tasks)
+    pool.close()
+    pool.join()
+  finally:
+    pool.terminate()
+
+  trees = {}
+  for (chunk_trees, error) in results:
+    if error:
+      usage("Problem building split trees:\n%s", error)
+    trees.update(chunk_trees)
+  return trees
+
+def dry_run(repo, splits, verbose, report_format = 'text'):
+  """Reports the commits that splitting each split would split along with an estimate of the
+  objects it would write, as text or as JSON."""
+
+  planner = saplib.DryRun(repo, saplib.ChangedPathsIndex(repo))
+  plans = []
   for split in splits:
     if (verbose):
       log("Operating on split: %s", split)
+    plans.append(planner.plan(split, branch_name(split)))
 
-    # TODO(jsirois): allow customization of branch, consider special names:
-    # name1:branch1 name2 ... nameN:branchN
-    branch_name = '_sapling_split_%s_' % split.name
+  if report_format == 'json':
+    import json
+    json.dump({ 'head': planner.head, 'splits': [ plan.as_dict() for plan in plans ] }, sys.stdout,
+              indent = 2, sort_keys = True)
+    print()
+  else:
+    for plan in plans:
+      print("Would split %d new commits to branch: %s (~%d objects)" % (len(plan.commits),
+                                                                         plan.branch_name,
+                                                                         plan.objects))
+      for commit in plan.commits:
+        print(commit)
+
+def preserving_split(repo, splits, verbose, jobs = 1, writer_type = 'odb', stats = None):
+  """Applies each split in turn keeping the shape of the original history.  With more than one job
+  the split trees of each split are built on a pool of worker processes first, leaving just the
+  split commits to write in order."""
 
-    if dry_run:
-      commits = pylist(split.commits())
-      print("Would split %d new commits to branch: %s" % (len(commits), branch_name))
-      print("\n".join(commit.hexsha for commit in commits))
-      return
+  for split in splits:
+    if (verbose):
+      log("Operating on split: %s", split)
+
+    trees = None
+    if jobs > 1:
+      resume_point = split.resume_point(branch_name(split))
+      since = None if resume_point is None else resume_point[1]
+      hexshas = [ hexsha for (hexsha, _) in split.commit_graph(since = since) ]
+      if hexshas:
+        if (verbose):
+          log("Building %d split trees with %d jobs", len(hexshas), jobs)
+        trees = parallel_build_trees(repo, split, hexshas, jobs, writer_type)
+
+    description = "split = %s, branch = %s" % (split.name, branch_name(split))
+    tip = split.apply(branch_name(split),
+                      apply_listener = ProgressTracker(description, verbose),
+                      writer = create_writer(repo, writer_type),
+                      stats = stats,
+                      preserve_merges = True,
+                      trees = trees)
+
+    if (tip):
+      print(tip.hexsha if len(splits) == 1 else "%s %s" % (tip.hexsha, branch_name(split)))
+    else:
+      log("No new commits to split to branch: %s", branch_name(split))
+
+def split(repo, splits, verbose, jobs = 1, writer_type = 'odb', stats = None, pipeline = False):
+  if len(splits) == 1:
+    split = splits[0]
+    if (verbose):
+      log("Operating on split: %s", split)
 
-    class ProgressTracker(saplib.Split.ApplyListener):
-      def __init__(self):
-        self._commit_index = 0
-        self._width = 80.0
-        self._pct = 0
-        self._pct_complete = 0
-
-      def on_start(self, commit_count):
-        self._commit_count = commit_count
-        message = "[split = %s, branch = %s] Processing %d commits" % (split.name,
-                                                                       branch_name,
-                                                                       self._commit_count)
-        if verbose:
-          log(message)
-        else:
-          self._width = max(len(message) + 2.0, float(self._width))
-          self._quantum = self._commit_count / self._width
-          log(message + (" " * (int(self._width) - len(message) - 1)) + "|")
-
-      def on_commit(self, original_commit, new_commit):
-        self._commit_index += 1
-
-        if verbose:
-          log("%s -> %s (%d of %d)", original_commit.hexsha, new_commit.hexsha, self._commit_index,
-              self._commit_count)
-        else:
-          self._pct_complete = int(self._commit_index / self._quantum % self._commit_count)
-          if self._pct_complete > self._pct:
-            log("." * (self._pct_complete - self._pct), end = "")
-            self._pct = self._pct_complete
-            sys.__stdout__.flush()
-
-      def on_finish(self):
-        if not verbose:
-          log("." * (int(self._width) - self._pct_complete))
-
-    tip = split.apply(branch_name, apply_listener = ProgressTracker())
+    description = "split = %s, branch = %s" % (split.name, branch_name(split))
+    tip = split.apply(branch_name(split),
+                      apply_listener = ProgressTracker(description, verbose),
+                      writer = create_writer(repo, writer_type),
+                      index = saplib.ChangedPathsIndex(repo),
+                      stats = stats,
+                      pipeline = pipeline)
 
     if (tip):
       print(tip.hexsha)
     else:
       log("No new commits to split.")
+    return
+
+  if (verbose):
+    for split in splits:
+      log("Operating on split: %s", split)
+
+  branch_names = dict((split.name, branch_name(split)) for split in splits)
+  if jobs > 1:
+    tips = parallel_split(repo, splits, verbose, jobs, writer_type, stats = stats)
+  else:
+    split_set = saplib.SplitSet(repo, splits)
+    description = "splits = %s" % ", ".join(split.name for split in splits)
+    tips = split_set.apply(branch_names,
+                           apply_listener = SplitSetProgressTracker(description, verbose),
+                           writer = create_writer(repo, writer_type),
+                           stats = stats,
+                           index = saplib.ChangedPathsIndex(repo))
+    tips = dict((name, tip and tip.hexsha) for (name, tip) in tips.items())
+
+  for split in splits:
+    tip = tips[split.name]
+    if (tip):
+      print("%s %s" % (tip, branch_names[split.name]))
+    else:
+      log("No new commits to split to branch: %s", branch_names[split.name])
+
+def profile(function, path):
+  """Runs the function under cProfile, saving the profile to path and logging its most expensive
+  calls."""
+
+  import cProfile
+  import pstats
+  import StringIO
+
+  profiler = cProfile.Profile()
+  try:
+    profiler.runcall(function)
+  finally:
+    profiler.dump_stats(path)
+    stream = StringIO.StringIO()
+    pstats.Stats(path, stream = stream).sort_stats('cumulative').print_stats(20)
+    log("Saved profile to %s\n%s", path, stream.getvalue())
+
+def merge_branch_name(split):
+  return '_sapling_merge_%s_' % split.name
+
+def merge(repo, split, verbose, source = None, writer_type = 'odb'):
+  source = source or branch_name(split)
+  if (verbose):
+    log("Merging split: %s from: %s", split, source)
+
+  description = "merge = %s, branch = %s" % (split.name, merge_branch_name(split))
+  try:
+    tip = split.merge(source, merge_branch_name(split),
+                      apply_listener = ProgressTracker(description, verbose),
+                      writer = create_writer(repo, writer_type))
+  except saplib.MergeError as e:
+    usage("Problem merging split: %s", e)
+
+  if (tip):
+    print("%s %s" % (tip.hexsha, merge_branch_name(split)))
+  else:
+    log("No new split commits to merge from: %s", source)
+
+def export(repo, splits, verbose, directory):
+  exporter = saplib.Exporter(repo)
+  for split in splits:
+    try:
+      bundle = exporter.export(split.name, branch_name(split), directory)
+    except saplib.ExportError as e:
+      usage("Problem exporting split %s: %s", split.name, e)
+
+    if bundle is None:
+      log("Nothing new to export from branch: %s", branch_name(split))
+      continue
+    if (verbose):
+      log("Exported %d commits of %s %s", bundle.commit_count, bundle.branch_name,
+          "since %s" % bundle.basis if bundle.basis else "in full")
+    print(bundle.path)
+
+def default_socket_path(git_dir):
+  return os.path.join(git_dir, 'sapling', 'serve.sock')
+
+def serve(repo, verbose, socket_path = None, writer_type = 'odb'):
+  import signal
+
+  socket_path = socket_path or default_socket_path(repo.git_dir)
+  server = saplib.SplitServer(repo, os.path.join(repo.working_tree_dir, '.saplings'), socket_path,
+                              branch_name,
+                              create_writer = lambda repo: create_writer(repo, writer_type))
+
+  # Stopping the server with kill cleans up its socket just like stopping it with ^C does.
+  signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+  if (verbose):
+    log("Serving splits on: %s", socket_path)
+  try:
+    server.serve()
+  except saplib.ServerError as e:
+    usage("Problem serving splits: %s", e)
+  except KeyboardInterrupt:
+    pass
+
+def notify(names, verbose, socket_path = None):
+  """Asks the git sap --serve for the current repo to split the named splits, or all configured
+  splits if none are named.  Returns False if no server is running."""
+
+  import socket
+
+  if socket_path is None:
+    process = subprocess.Popen([ "git", "rev-parse", "--git-dir" ], stdout = subprocess.PIPE)
+    git_dir = process.communicate()[0].strip()
+    if process.returncode != 0:
+      usage("Must be inside a git repository")
+    socket_path = default_socket_path(os.path.abspath(git_dir))
+
+  try:
+    response = saplib.SplitServer.request(socket_path, { 'command': 'split', 'splits': names })
+  except socket.error:
+    if (verbose):
+      log("No server listening on: %s", socket_path)
+    return False
+  except saplib.ServerError as e:
+    usage("Problem splitting: %s", e)
+
+  for result in response['splits']:
+    if result['tip']:
+      print("%s %s" % (result['tip'], result['branch']))
+    else:
+      log("No new commits to split to branch: %s", result['branch'])
+  return True
 
 def parse_args():
   versionMessage = "%prog {0} (http://pypi.python.org/pypi/sapling/{0})".format(version())
 
   usage = """
     %prog (-dv --python-git-db) --list
-    %prog (-dv --python-git-db) --split [splitname...]"""
+    %prog (-dv --python-git-db) --split [splitname...]
+    %prog (-dv --python-git-db) --merge splitname
+    %prog (-dv --python-git-db) --export [splitname...]
+    %prog (-dv --python-git-db) --serve
+    %prog (-v) --notify [splitname...]"""
 
   epilog = "Happy splitting!"
 
@@ -146,8 +583,8 @@ def parse_args():
                     help = "Prints extra information.")
   parser.add_option("--python-git-db", dest = "native", action = "store_false", default = True,
                     help = "Specifies the python implementation of the git object database should "
-                    "be used instead of the native one - can speed operations when repository has "
-                    "few large files.")
+                    "be used instead of reading objects through persistent git cat-file processes "
+                    "- can speed operations when repository has few large files.")
 
   # TODO(jsirois): enforce mutual exclusivity of these option groups
 
@@ -191,14 +628,116 @@ def parse_args():
                     dest = "branch",
                     help = "Specifies a branch to split to, arguments are treated as the patterns "
                            "to split.")
+  split.add_option("-j", "--jobs",
+                   dest = "jobs",
+                   type = "int",
+                   default = 1,
+                   help = "Splits using this many worker processes when splitting more than one "
+                   "split, or building the trees of a split with --preserve-merges.")
+  split.add_option("--fast-import",
+                   dest = "writer_type",
+                   action = "store_const",
+                   const = "fast-import",
+                   default = "odb",
+                   help = "Writes the split through a single git fast-import process into one pack "
+                   "instead of writing each new object as a loose object.")
+  split.add_option("--mktree",
+                   dest = "writer_type",
+                   action = "store_const",
+                   const = "mktree",
+                   help = "Writes the split trees through a single git mktree process so git "
+                   "compresses and stores them natively instead of python.")
+  split.add_option("--preserve-merges",
+                   dest = "preserve_merges",
+                   action = "store_true",
+                   default = False,
+                   help = "Keeps the branches and merges of the original history in the split "
+                   "history instead of splitting it to a single line of commits.  Each split is "
+                   "applied in turn, with --jobs building its trees in parallel.")
+  split.add_option("--pipeline",
+                   dest = "pipeline",
+                   action = "store_true",
+                   default = False,
+                   help = "Splits a single split with commits read, trees built and objects "
+                   "stored on separate threads.  Not supported with more than 1 split or with "
+                   "--preserve-merges.")
   split.add_option("-n", "--dry-run",
                    dest = "dry_run",
                    action = "store_true",
                    default = False,
-                   help = "Does not perform a split, instead just lists the commits that would be "
-                   "split.")
+                   help = "Does not perform a split, instead reports the commits that would be "
+                   "split and an estimate of the objects that would be written for each split.  "
+                   "With no split names every configured split is reported.")
+  split.add_option("--format",
+                   dest = "report_format",
+                   type = "choice",
+                   choices = [ "text", "json" ],
+                   default = "text",
+                   help = "The format of the --dry-run report: text or json. [default: %default]")
+  split.add_option("--stats",
+                   dest = "stats",
+                   action = "store_true",
+                   default = False,
+                   help = "Prints a summary of the time spent in each phase of the split.")
+  split.add_option("--stats-file",
+                   dest = "stats_file",
+                   help = "Saves the time spent in each phase of the split, in total and for each "
+                   "commit, as JSON to this file.")
+  split.add_option("--profile",
+                   dest = "profile",
+                   help = "Profiles the split saving the cProfile stats to this file.")
   parser.add_option_group(split)
 
+  merge = optparse.OptionGroup(parser, "Merge commits made on a split back into the mainline")
+  merge.add_option("--merge",
+                   dest = "subcommand",
+                   action = "store_const",
+                   const = "merge",
+                   help = "Merges the commits made on top of a split's branch since it was last "
+                   "split or merged onto the current head, writing the merged commits to a "
+                   "_sapling_merge_[splitname]_ branch.  Also honors --fast-import and --mktree.")
+  merge.add_option("--from",
+                   dest = "source",
+                   help = "Merges the split commits in this ref's history instead of those on the "
+                   "split's branch, for example a remote tracking branch of the split repo.")
+  parser.add_option_group(merge)
+
+  export = optparse.OptionGroup(parser, "Export split branches as git bundles")
+  export.add_option("--export",
+                    dest = "subcommand",
+                    action = "store_const",
+                    const = "export",
+                    help = "Writes a git bundle of each named split's branch, or of every "
+                    "configured split's, holding only the objects new since the split was last "
+                    "exported.  The tip exported is recorded in refs/sapling/exported/[splitname].")
+  export.add_option("--export-dir",
+                    dest = "export_dir",
+                    default = ".",
+                    help = "The directory to write bundles to. [default: %default]")
+  parser.add_option_group(export)
+
+  serve = optparse.OptionGroup(parser, "Keep split branches up to date from a long running server")
+  serve.add_option("--serve",
+                   dest = "subcommand",
+                   action = "store_const",
+                   const = "serve",
+                   help = "Runs a server that splits the configured splits whenever notified, "
+                   "keeping the config and the trees read so far in memory between splits.  Also "
+                   "honors --fast-import and --mktree.")
+  serve.add_option("--notify",
+                   dest = "subcommand",
+                   action = "store_const",
+                   const = "notify",
+                   help = "Asks the running server to split the named splits, or all configured "
+                   "splits if none are named, and waits for it to finish.  If no server is "
+                   "running the splits are split directly.  Suitable for post-commit and "
+                   "post-receive hooks.")
+  serve.add_option("--socket",
+                   dest = "socket_path",
+                   help = "The unix socket the server listens on. [default: "
+                   ".git/sapling/serve.sock]")
+  parser.add_option_group(serve)
+
   (options, args) = parser.parse_args()
   return (options, args, parser.error)
 
@@ -211,6 +750,13 @@ def main():
     install(options.show, options.force)
     return
 
+  notifying = options.subcommand is "notify"
+  if notifying:
+    # The server already has the repo open so the repo is only opened here if there is no server.
+    if notify(args, options.verbose, options.socket_path):
+      return
+    options.subcommand = "split"
+
   # Fail fast if we're not in a repo
   repo = open_repo(options.native)
 
@@ -236,16 +782,75 @@ def main():
       except KeyError as e:
         ferror(e)
     else:
+      splits_by_name = open_config(repo).splits
       if len(args) == 0:
-        ferror("At least 1 split must be specified")
+        if not (options.dry_run or notifying):
+          ferror("At least 1 split must be specified")
+        args = sorted(splits_by_name)
 
-      splits_by_name = open_config(repo).splits
       try:
         splits = [ splits_by_name[name] for name in args ]
       except KeyError as e:
         ferror("Split not defined: %s" % e)
 
-    split(splits, options.verbose, options.dry_run)
+    if options.jobs < 1:
+      ferror("--jobs must be at least 1")
+
+    if options.pipeline:
+      if options.preserve_merges:
+        ferror("--pipeline cannot be combined with --preserve-merges")
+      if len(splits) != 1:
+        ferror("--pipeline can only split exactly 1 split")
+
+    if options.dry_run:
+      dry_run(repo, splits, options.verbose, options.report_format)
+      return
+
+    stats = saplib.Stats() if options.stats or options.stats_file else None
+    if options.preserve_merges:
+      run_split = lambda: preserving_split(repo, splits, options.verbose, options.jobs,
+                                           options.writer_type, stats)
+    else:
+      run_split = lambda: split(repo, splits, options.verbose, options.jobs, options.writer_type,
+                                stats, pipeline = options.pipeline)
+    if options.profile:
+      profile(run_split, options.profile)
+    else:
+      run_split()
+
+    if stats is not None:
+      if options.stats:
+        log("%s", stats.summary())
+      if options.stats_file:
+        import json
+        with open(options.stats_file, 'w') as fp:
+          json.dump(stats.as_dict(), fp, indent = 2, sort_keys = True)
+
+  elif options.subcommand is "merge":
+    if len(args) != 1:
+      ferror("Exactly 1 split must be specified")
+
+    try:
+      merge_split = open_config(repo).splits[args[0]]
+    except KeyError as e:
+      ferror("Split not defined: %s" % e)
+
+    merge(repo, merge_split, options.verbose, options.source, options.writer_type)
+
+  elif options.subcommand is "export":
+    splits_by_name = open_config(repo).splits
+    try:
+      splits = [ splits_by_name[name] for name in args or sorted(splits_by_name) ]
+    except KeyError as e:
+      ferror("Split not defined: %s" % e)
+
+    export(repo, splits, options.verbose, options.export_dir)
+
+  elif options.subcommand is "serve":
+    if len(args) != 0:
+      ferror("serve takes no arguments")
+
+    serve(repo, options.verbose, options.socket_path, options.writer_type)
 
 try:
   main()
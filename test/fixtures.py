@@ -1,9 +1,40 @@
 import git
+import os
+import shutil
+import tempfile
 
 class RepoFixture(object):
 
-  # TODO(jsirois): Provide a way to easily build up a temporary repo to use for tests instead of
-  # assuming this project is housed in a git repo.
-
   def repo(self):
     return git.Repo()
+
+  def create_repo(self):
+    """Creates a new empty git repository in a temporary directory that is removed when the test
+    completes."""
+
+    path = tempfile.mkdtemp(prefix = 'sapling-test.')
+    self.addCleanup(shutil.rmtree, path)
+
+    repo = git.Repo.init(path)
+    repo.git.config('user.name', 'Sapling Test')
+    repo.git.config('user.email', 'sapling@example.com')
+    return repo
+
+  def commit(self, repo, message, files = None, removes = None):
+    """Commits the given files - a dict of path to content - to the repo, removing any paths listed
+    in removes first and returns the new head commit."""
+
+    for path in removes or []:
+      repo.git.rm('-r', '-q', path)
+
+    for (path, content) in (files or {}).items():
+      full_path = os.path.join(repo.working_tree_dir, path)
+      parent_dir = os.path.dirname(full_path)
+      if not os.path.exists(parent_dir):
+        os.makedirs(parent_dir)
+      with open(full_path, 'w') as fp:
+        fp.write(content)
+      repo.git.add(path)
+
+    repo.git.commit('-q', '--allow-empty', '-m', message)
+    return repo.head.commit
@@ -0,0 +1,33 @@
+import fixtures
+import imp
+import optparse
+import os
+import saplib
+import unittest
+
+benchmark = imp.load_source('benchmark', os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), 'bench', 'benchmark.py'))
+
+class BenchmarkTest(unittest.TestCase, fixtures.RepoFixture):
+  def test_generate(self):
+    generator = benchmark.RepoGenerator(commits = 20, files_per_commit = 3, depth = 2, splits = 2,
+                                        excludes = 2)
+    repo = generator.generate(self.create_repo().working_tree_dir)
+    self.assertEquals(20, len(list(repo.iter_commits())))
+
+    splits = saplib.Config(repo, generator.config()).splits
+    self.assertEquals([ 'split0', 'split1' ], sorted(splits))
+    self.assertEquals([ 'split0', '!.+/OWNERS$', '!.+\\.gen0$' ], splits['split0'].patterns)
+
+  def test_run(self):
+    options = optparse.Values(dict(commits = 10, files_per_commit = 2, depth = 1, splits = 2,
+                                   excludes = 1, seed = 0, fast_import = False, mktree = False,
+                                   pipeline = False, python_git_db = False, verbose = False))
+    results = benchmark.run_benchmark(options, self.create_repo().working_tree_dir)
+
+    phases = dict((phase['name'], phase) for phase in results['phases'])
+    self.assertEquals([ 'generate', 'config', 'commits', 'commits_index', 'apply', 'apply_set' ],
+                      [ phase['name'] for phase in results['phases'] ])
+    self.assertEquals(phases['commits']['commits'], phases['commits_index']['commits'])
+    self.assertEquals(phases['apply']['commits_written'], phases['apply_set']['commits_written'])
+    self.assertEquals(phases['apply']['trees_written'], phases['apply_set']['trees_written'])
@@ -0,0 +1,39 @@
+import saplib
+import unittest
+
+class LRUCacheTest(unittest.TestCase):
+  def test_invalid_capacity(self):
+    self.assertRaises(ValueError, saplib.LRUCache, 0)
+
+  def test_get(self):
+    cache = saplib.LRUCache(2)
+    self.assertEquals(None, cache.get('a'))
+    self.assertEquals(1, cache.get('a', 1))
+    self.assertRaises(KeyError, lambda: cache['a'])
+
+    cache['a'] = None
+    self.assertTrue('a' in cache)
+    self.assertEquals(None, cache.get('a', 1))
+
+    cache['a'] = 2
+    self.assertEquals(2, cache['a'])
+    self.assertEquals(1, len(cache))
+
+  def test_eviction(self):
+    cache = saplib.LRUCache(2)
+    cache['a'] = 1
+    cache['b'] = 2
+    cache['c'] = 3
+    self.assertEquals(2, len(cache))
+    self.assertFalse('a' in cache)
+
+    # Reading b makes c the least recently used entry.
+    self.assertEquals(2, cache['b'])
+    cache['d'] = 4
+    self.assertEquals([ 'b', 'd' ], sorted(key for key in 'abcd' if key in cache))
+
+    # Updating b makes d the least recently used entry.
+    cache['b'] = 5
+    cache['e'] = 6
+    self.assertEquals([ 'b', 'e' ], sorted(key for key in 'abcde' if key in cache))
+    self.assertEquals(5, cache['b'])
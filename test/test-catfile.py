@@ -0,0 +1,57 @@
+import fixtures
+import git
+import saplib
+import unittest
+
+from gitdb.exc import BadObject
+
+class CatFileTest(unittest.TestCase, fixtures.RepoFixture):
+  def setUp(self):
+    self._repo = self.create_repo()
+    self._commit = self.commit(self._repo, 'first', { 'a/x': '1', 'a/y': '22' })
+    self._cat_file = saplib.CatFile(self._repo.working_tree_dir)
+    self.addCleanup(self._cat_file.close)
+
+  def test_read(self):
+    (typename, data) = self._cat_file.read(self._commit.binsha)
+    self.assertEquals('commit', typename)
+    self.assertEquals(self._repo.odb.stream(self._commit.binsha).read(), data)
+
+  def test_read_all(self):
+    blobs = [ item for item in self._commit.tree.traverse() if item.type == 'blob' ]
+    objects = self._cat_file.read_all([ blob.binsha for blob in blobs ] * 300)
+    self.assertEquals([ ('blob', '1'), ('blob', '22') ] * 300, objects)
+
+  def test_info(self):
+    self.assertEquals(('tree', len(self._commit.tree.data_stream.read())),
+                      self._cat_file.info(self._commit.tree.binsha))
+
+  def test_missing(self):
+    missing = '\1' * 20
+    self.assertRaises(BadObject, self._cat_file.read_all, [ self._commit.binsha, missing ])
+    self.assertRaises(BadObject, self._cat_file.info, missing)
+
+    # Remains in sync after a miss.
+    self.assertEquals('commit', self._cat_file.read(self._commit.binsha)[0])
+
+  def test_object_db(self):
+    repo = git.Repo(self._repo.working_tree_dir, odbt = saplib.CatFileObjectDB)
+    commit = repo.head.commit
+    self.assertEquals(self._commit.hexsha, commit.hexsha)
+    self.assertEquals('first\n', commit.message)
+    self.assertEquals([ 'a' ], [ item.name for item in commit.tree ])
+    self.assertEquals(2, repo.odb.info(repo.tree().trees[0].blobs[1].binsha).size)
+
+  def test_object_db_has_packed_objects(self):
+    self._repo.git.repack('-a', '-d', '-q')
+    self._repo.git.prune_packed()
+    repo = git.Repo(self._repo.working_tree_dir, odbt = saplib.CatFileObjectDB)
+    tree = repo.head.commit.tree
+    self.assertTrue(repo.odb.has_object(tree.binsha))
+    self.assertFalse(repo.odb.has_object('\1' * 20))
+
+    # Packed objects are not written again as loose objects.
+    entries = [ (item.binsha, item.mode, item.name) for item in tree ]
+    loose = set(repo.odb.sha_iter())
+    self.assertEquals(tree.binsha, saplib.OdbWriter(repo).write_tree(entries))
+    self.assertEquals(loose, set(repo.odb.sha_iter()))
@@ -0,0 +1,52 @@
+import fixtures
+import git
+import saplib
+import saplib.commits
+import unittest
+
+class CommitRecordTest(unittest.TestCase, fixtures.RepoFixture):
+  FIELDS = ('hexsha', 'author', 'authored_date', 'author_tz_offset', 'committer', 'committed_date',
+            'committer_tz_offset', 'message', 'encoding')
+
+  def test_read_commits_matches_commits(self):
+    repo = self.create_repo()
+    self.commit(repo, 'first', { 'a/x': '1' })
+    repo.git.commit('-q', '--allow-empty', '-m', 'second\n\n  indented\n\ntrailing  ',
+                    '--cleanup=verbatim', '--author=J\xc3\xa9 <je@example.com>',
+                    '--date=1300000000 +0530')
+    repo.git.commit('-q', '--allow-empty', '--allow-empty-message', '-m', '')
+    repo.git.config('i18n.commitEncoding', 'ISO-8859-1')
+    repo.git.commit('-q', '--allow-empty', '-m', 'caf\xe9')
+
+    commits = list(git.Commit.iter_items(repo, 'HEAD'))
+    binshas = [ commit.binsha for commit in commits ]
+    for odb in (repo.odb, git.db.GitDB(repo.odb._root_path),
+                git.db.GitCmdObjectDB(repo.odb._root_path, repo.git)):
+      records = list(saplib.commits.read_commits(odb, binshas, batch_size = 3))
+      self.assertEquals(len(commits), len(records))
+      for (commit, record) in zip(commits, records):
+        self.assertEquals(commit.tree.binsha, record.tree_binsha)
+        for field in CommitRecordTest.FIELDS:
+          self.assertEquals(getattr(commit, field), getattr(record, field), field)
+
+  def test_split_commits(self):
+    repo = self.create_repo()
+    first = self.commit(repo, 'first', { 'a/x': '1' })
+    self.commit(repo, 'second', { 'c/y': '2' })
+    third = self.commit(repo, 'third', { 'a/x': '3' })
+
+    records = list(saplib.Split(repo, 'a', [ 'a' ]).commits())
+    self.assertEquals([ first.hexsha, third.hexsha ], [ record.hexsha for record in records ])
+    self.assertEquals(third.tree.binsha, records[1].tree_binsha)
+
+  def test_split_git_cmd_odb(self):
+    repo = self.create_repo()
+    self.commit(repo, 'first', { 'a/x': '1', 'c/y': '2' })
+    self.commit(repo, 'second', { 'a/x': '3' })
+    self.commit(repo, 'third', { 'a/z': '4' })
+    expected = saplib.Split(repo, 'a', [ 'a' ]).apply('split_a')
+
+    cmd_repo = git.Repo(repo.working_dir, odbt = git.db.GitCmdObjectDB)
+    split = saplib.Split(cmd_repo, 'a', [ 'a' ])
+    self.assertEquals(expected.hexsha, split.apply('cmd_split_a').hexsha)
+    self.assertEquals(expected.hexsha, split.apply('stats_split_a', stats = saplib.Stats()).hexsha)
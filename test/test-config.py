@@ -1,4 +1,5 @@
 import fixtures
+import os
 import saplib
 import unittest
 
@@ -27,6 +28,40 @@ splits = [ test ]""")
     self.assertEquals('test', split.name)
     self.assertEquals(['test'], split.paths)
 
+  def test_keep_empty(self):
+    config = self._create_config("""
+splits = [
+  { 'name': 'test', 'paths': [ 'test' ] },
+  { 'name': 'saplib', 'paths': [ 'saplib' ], 'keep_empty': True },
+]""")
+
+    self.assertFalse(config.splits['test'].keep_empty)
+    self.assertTrue(config.splits['saplib'].keep_empty)
+
+  def test_cache(self):
+    repo = self.create_repo()
+    self.commit(repo, 'first', { 'a/x': '1', 'b/y': '2' })
+    cache_path = os.path.join(repo.git_dir, 'sapling', 'config')
+    data = "splits = [ { 'name': 'a', 'paths': [ 'a', '!.+/OWNERS$' ], 'keep_empty': True } ]"
+
+    config = saplib.Config(repo, data, cache_path = cache_path)
+    self.assertTrue(os.path.exists(cache_path))
+
+    parse = saplib.Config._parse
+    def fail_parse(repo, config):
+      self.fail('Expected the cached config to be used')
+    saplib.Config._parse = staticmethod(fail_parse)
+    try:
+      cached = saplib.Config(repo, data, cache_path = cache_path)
+    finally:
+      saplib.Config._parse = parse
+    self.assertEquals(config.splits['a'].patterns, cached.splits['a'].patterns)
+    self.assertTrue(cached.splits['a'].keep_empty)
+
+    # A new head tree invalidates the cache and so re-validates the split paths.
+    self.commit(repo, 'second', removes = [ 'a' ])
+    self.assertRaises(saplib.ConfigError, saplib.Config, repo, data, cache_path = cache_path)
+
   def _assert_config_error(self, config):
     self.assertRaises(saplib.ConfigError, saplib.Config, self.repo(), config)
 
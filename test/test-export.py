@@ -0,0 +1,60 @@
+import fixtures
+import git
+import saplib
+import shutil
+import tempfile
+import unittest
+
+class ExporterTest(unittest.TestCase, fixtures.RepoFixture):
+  def test_export(self):
+    repo = self.create_repo()
+    self.commit(repo, 'first', { 'a/x': '1', 'c/y': '2' })
+    split = saplib.Split(repo, 'a', [ 'a' ])
+    first_tip = split.apply('split_a')
+
+    directory = self._directory()
+    exporter = saplib.Exporter(repo)
+    self.assertEquals(None, exporter.exported('a'))
+    bundle = exporter.export('a', 'split_a', directory)
+    self.assertEquals((first_tip.hexsha, None, 1), (bundle.tip, bundle.basis, bundle.commit_count))
+    self.assertEquals(first_tip.hexsha, exporter.exported('a'))
+    self.assertEquals(None, exporter.export('a', 'split_a', directory))
+
+    self.commit(repo, 'second', { 'a/x': '3' })
+    second_tip = split.apply('split_a')
+    second_bundle = exporter.export('a', 'split_a', directory)
+    self.assertEquals((second_tip.hexsha, first_tip.hexsha, 1),
+                      (second_bundle.tip, second_bundle.basis, second_bundle.commit_count))
+
+    # A mirror can only fetch the second bundle once it has the first.
+    mirror = self.create_repo()
+    self.assertRaises(git.GitCommandError, mirror.git.bundle, 'verify', second_bundle.path)
+    for exported in (bundle, second_bundle):
+      mirror.git.fetch('-q', exported.path, 'refs/heads/split_a:refs/heads/mirror')
+    self.assertEquals(second_tip.hexsha, mirror.heads.mirror.commit.hexsha)
+
+  def test_export_missing_branch(self):
+    repo = self.create_repo()
+    self.commit(repo, 'first', { 'a/x': '1' })
+    self.assertRaises(saplib.ExportError, saplib.Exporter(repo).export, 'a', 'split_a',
+                      self._directory())
+
+  def test_export_reset_branch(self):
+    repo = self.create_repo()
+    self.commit(repo, 'first', { 'a/x': '1' })
+    split = saplib.Split(repo, 'a', [ 'a' ])
+    first_tip = split.apply('split_a')
+    self.commit(repo, 'second', { 'a/x': '2' })
+    second_tip = split.apply('split_a')
+
+    directory = self._directory()
+    exporter = saplib.Exporter(repo)
+    exporter.export('a', 'split_a', directory)
+    repo.heads.split_a.commit = first_tip
+    self.assertRaises(saplib.ExportError, exporter.export, 'a', 'split_a', directory)
+    self.assertEquals(second_tip.hexsha, exporter.exported('a'))
+
+  def _directory(self):
+    directory = tempfile.mkdtemp(prefix = 'sapling-export.')
+    self.addCleanup(shutil.rmtree, directory)
+    return directory
@@ -0,0 +1,48 @@
+import fixtures
+import saplib
+import unittest
+
+class ChangedPathsIndexTest(unittest.TestCase, fixtures.RepoFixture):
+  def test_commits_match_rev_list(self):
+    repo = self.create_repo()
+    self.commit(repo, 'first', { 'a/x': '1', 'b/y': '2', 'c': '3' })
+    repo.git.checkout('-q', '-b', 'side')
+    self.commit(repo, 'side', { 'a/x': '4', 'b/z/w': '5' })
+    repo.git.checkout('-q', 'master')
+    self.commit(repo, 'master', { 'c': '6' })
+    repo.git.merge('-q', '--no-ff', '-m', 'merge', 'side')
+    since = self.commit(repo, 'fourth', { 'b/y': '7' }, removes = [ 'c' ]).hexsha
+    self.commit(repo, 'fifth', { 'a/x': '8' })
+
+    index = saplib.ChangedPathsIndex(repo)
+    for paths in ([ 'a' ], [ 'a/x' ], [ 'b' ], [ 'b/z' ], [ 'c' ], [ 'a', 'c' ], [ 'd' ]):
+      self.assertEquals(repo.git.rev_list('HEAD', '--', *paths).split(), index.commits(paths))
+      self.assertEquals(repo.git.rev_list('%s..HEAD' % since, '--', *paths).split(),
+                        index.commits(paths, since = since))
+
+  def test_update_incremental(self):
+    repo = self.create_repo()
+    self.commit(repo, 'first', { 'a/x': '1' })
+    self.commit(repo, 'second', { 'b/y': '2' })
+
+    self.assertEquals(2, saplib.ChangedPathsIndex(repo).update())
+
+    index = saplib.ChangedPathsIndex(repo)
+    self.assertEquals(0, index.update())
+
+    head = self.commit(repo, 'third', { 'a/x': '3' })
+    self.assertEquals([ head.hexsha ], index.commits([ 'a' ], since = 'HEAD~1'))
+    self.assertEquals(0, saplib.ChangedPathsIndex(repo).update())
+
+  def test_split_commits(self):
+    repo = self.create_repo()
+    self.commit(repo, 'first', { 'a/x': '1', 'c/y': '2' })
+    self.commit(repo, 'second', { 'c/y': '3' })
+    self.commit(repo, 'third', { 'a/x': '4' })
+
+    split = saplib.Split(repo, 'a', [ 'a' ])
+    index = saplib.ChangedPathsIndex(repo)
+    self.assertEquals([ commit.hexsha for commit in split.commits() ],
+                      [ commit.hexsha for commit in split.commits(index = index) ])
+    self.assertEquals([ commit.hexsha for commit in split.commits(reverse = False) ],
+                      [ commit.hexsha for commit in split.commits(reverse = False, index = index) ])
@@ -1,4 +1,9 @@
+import marshal
+import os
 import saplib
+import saplib.lib
+import shutil
+import tempfile
 import unittest
 
 class LibTest(unittest.TestCase):
@@ -35,3 +40,21 @@ b
        i
         j
 k""".strip()))
+
+  def test_load_marshalled(self):
+    directory = tempfile.mkdtemp()
+    try:
+      path = os.path.join(directory, 'cache')
+      self.assertEqual(None, saplib.lib.load_marshalled(path, 1))
+
+      with saplib.lib.atomic_file(path) as fp:
+        marshal.dump((1, 'a', [ 2 ]), fp)
+      self.assertEqual(('a', [ 2 ]), saplib.lib.load_marshalled(path, 1))
+      self.assertEqual(None, saplib.lib.load_marshalled(path, 2))
+
+      for corrupt in ('', 'garbage', marshal.dumps('not a tuple')):
+        with open(path, 'wb') as fp:
+          fp.write(corrupt)
+        self.assertEqual(None, saplib.lib.load_marshalled(path, 1))
+    finally:
+      shutil.rmtree(directory)
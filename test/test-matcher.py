@@ -0,0 +1,54 @@
+import re
+import unittest
+
+from saplib.matcher import ExcludeMatcher, PathTrie
+
+class ExcludeMatcherTest(unittest.TestCase):
+  def test_empty(self):
+    matcher = ExcludeMatcher([])
+    self.assertFalse(matcher)
+    self.assertFalse(matcher.matches('a/OWNERS'))
+
+  def test_combined(self):
+    matcher = ExcludeMatcher([ re.compile('.+/OWNERS$'), re.compile(r'.*\.sh$'), re.compile('b/') ])
+    self.assertTrue(matcher)
+    self.assertEquals([ '.*\\.sh$', '.+/OWNERS$', 'b/' ], matcher.patterns)
+    for path in ('a/OWNERS', 'a/run.sh', 'b/x'):
+      self.assertTrue(matcher.matches(path))
+      self.assertTrue(matcher.matches(path))
+    for path in ('OWNERS', 'a/OWNERS.txt', 'a/b/x'):
+      self.assertFalse(matcher.matches(path))
+      self.assertFalse(matcher.matches(path))
+
+  def test_uncombinable(self):
+    matcher = ExcludeMatcher([ re.compile('(?i)a/owners$'), re.compile(r'(.)\1'),
+                               re.compile('(?P<x>c)'), re.compile('(?P<x>d)') ])
+    self.assertTrue(matcher.matches('a/OWNERS'))
+    self.assertFalse(matcher.matches('B/OWNERS'))
+    self.assertTrue(matcher.matches('bb'))
+    self.assertTrue(matcher.matches('d'))
+
+
+class PathTrieTest(unittest.TestCase):
+  TREES = {
+    'root': [ ('a', 0o040000, 'a'), ('c', 0o100644, 'c') ],
+    'a': [ ('ab', 0o040000, 'b'), ('ax', 0o100644, 'x') ],
+    'ab': [ ('abz', 0o100644, 'z') ],
+  }
+
+  def test_resolve(self):
+    trie = PathTrie([ 'a/b', 'c', 'a', 'd', 'a/x/y', 'a/b/z' ])
+    self.assertEquals(('a/b', 'c', 'a', 'd', 'a/x/y', 'a/b/z'), trie.paths)
+
+    visited = []
+    def entries(binsha):
+      visited.append(binsha)
+      return PathTrieTest.TREES[binsha]
+
+    resolved = trie.resolve(entries, 'root', lambda mode: mode == 0o040000)
+    self.assertEquals(((('ab', 0o040000), ('c', 0o100644), ('a', 0o040000), None, None,
+                        ('abz', 0o100644))), resolved)
+    self.assertEquals([ 'root', 'a', 'ab' ], visited)
+
+  def test_empty(self):
+    self.assertEquals((), PathTrie([]).resolve(None, 'root', None))
@@ -0,0 +1,50 @@
+import fixtures
+import saplib
+import unittest
+
+class MergeTest(unittest.TestCase, fixtures.RepoFixture):
+  def test_merge(self):
+    repo = self.create_repo()
+    self.commit(repo, 'first', { 'a/x': '1', 'a/b/OWNERS': 'jake', 'a/b/y': '2', 'c/z': '3' })
+    split = saplib.Split(repo, 'a', [ 'a', '!.+/OWNERS$' ])
+    split.apply('split_a')
+
+    repo.git.checkout('-q', 'split_a')
+    change = self.commit(repo, 'change', { 'a/x': '4', 'a/n': '5' })
+    repo.git.checkout('-q', 'master')
+    head = repo.head.commit
+
+    tip = split.merge('split_a', 'merged')
+    self.assertEquals(tip.hexsha, repo.heads.merged.commit.hexsha)
+    self.assertEquals([ head.hexsha ], [ parent.hexsha for parent in tip.parents ])
+    self.assertTrue(tip.message.endswith('(sapling merge of %s)' % change.hexsha))
+    self.assertEquals('4', tip.tree['a/x'].data_stream.read())
+    self.assertEquals('5', tip.tree['a/n'].data_stream.read())
+    self.assertEquals(head.tree['a/b'].binsha, tip.tree['a/b'].binsha)
+    self.assertEquals(head.tree['c'].binsha, tip.tree['c'].binsha)
+
+    repo.git.merge('-q', '--ff-only', 'merged')
+    self.assertEquals(None, split.merge('split_a', 'merged'))
+
+  def test_merge_conflict(self):
+    repo = self.create_repo()
+    self.commit(repo, 'first', { 'a/x': '1' })
+    split = saplib.Split(repo, 'a', [ 'a' ])
+    split.apply('split_a')
+    self.commit(repo, 'mainline', { 'a/x': '2' })
+
+    repo.git.checkout('-q', 'split_a')
+    self.commit(repo, 'split', { 'a/x': '3' })
+    repo.git.checkout('-q', 'master')
+    self.assertRaises(saplib.MergeError, split.merge, 'split_a', 'merged')
+
+  def test_merge_outside_paths(self):
+    repo = self.create_repo()
+    self.commit(repo, 'first', { 'a/x': '1', 'c/y': '2' })
+    split = saplib.Split(repo, 'a', [ 'a' ])
+    split.apply('split_a')
+
+    repo.git.checkout('-q', 'split_a')
+    self.commit(repo, 'split', { 'c/y': '3' })
+    repo.git.checkout('-q', 'master')
+    self.assertRaises(saplib.MergeError, split.merge, 'split_a', 'merged')
@@ -0,0 +1,81 @@
+import fixtures
+import git
+import saplib
+import unittest
+
+from saplib.pipeline import Prefetcher
+
+class PrefetcherTest(unittest.TestCase):
+  def test_iterates_in_order(self):
+    prefetcher = Prefetcher(iter(range(100)), size = 3)
+    self.assertEquals(range(100), list(prefetcher))
+    self.assertRaises(StopIteration, prefetcher.next)
+
+  def test_raises_errors_in_turn(self):
+    def items():
+      yield 1
+      raise ValueError("broken")
+    prefetcher = Prefetcher(items())
+    self.assertEquals(1, prefetcher.next())
+    self.assertRaises(ValueError, prefetcher.next)
+
+  def test_close(self):
+    prefetcher = Prefetcher(iter(range(100)), size = 1)
+    self.assertEquals(0, prefetcher.next())
+    prefetcher.close()
+
+
+class PipelinedWriterTest(unittest.TestCase, fixtures.RepoFixture):
+  def test_apply_matches_unpipelined(self):
+    repo = self.create_repo()
+    self.commit(repo, 'first', { 'a/b/x': '1', 'a/b/OWNERS': 'jake', 'd/y': '2' })
+    self.commit(repo, 'second', { 'a/b/x': '3', 'a/c/z': '4' })
+    self.commit(repo, 'third', { 'd/y': '5' })
+    self.commit(repo, 'fourth', { 'a/b/OWNERS': 'joe' })
+
+    split = saplib.Split(repo, 'a', [ 'a', 'd', '!.+/OWNERS$' ])
+    expected = split.apply('serial')
+    for (branch_name, writer) in (('odb', None), ('mktree', saplib.MktreeWriter(repo)),
+                                  ('fast_import', saplib.FastImportWriter(repo))):
+      tip = split.apply(branch_name, writer = writer, stats = saplib.Stats(), pipeline = True)
+      self.assertEquals(expected.hexsha, tip.hexsha)
+      self.assertEquals(expected.hexsha, repo.heads[branch_name].commit.hexsha)
+
+    # Every object the pipelined split returned a sha for was stored.
+    repo.git.fsck('--connectivity-only', 'odb')
+
+  def test_apply_incremental(self):
+    repo = self.create_repo()
+    self.commit(repo, 'first', { 'a/x': '1', 'b/y': '2' })
+    split = saplib.Split(repo, 'a', [ 'a' ])
+    split.apply('serial')
+    split.apply('pipelined', pipeline = True)
+
+    self.commit(repo, 'second', { 'a/x': '3' })
+    self.commit(repo, 'third', { 'b/y': '4' })
+    self.commit(repo, 'fourth', { 'a/z': '5' })
+    expected = split.apply('serial')
+    self.assertEquals(expected.hexsha, split.apply('pipelined', pipeline = True).hexsha)
+
+  def test_apply_git_cmd_odb(self):
+    repo = self.create_repo()
+    for i in range(20):
+      self.commit(repo, 'commit %d' % i, { 'a/b/x': str(i), 'a/c/y': str(i), 'd/z': str(i) })
+    expected = saplib.Split(repo, 'a', [ 'a' ]).apply('serial')
+
+    for odbt in (git.db.GitCmdObjectDB, saplib.CatFileObjectDB):
+      split = saplib.Split(git.Repo(repo.working_dir, odbt = odbt), 'a', [ 'a' ])
+      tip = split.apply('pipelined_%s' % odbt.__name__, pipeline = True)
+      self.assertEquals(expected.hexsha, tip.hexsha)
+
+  def test_store_error(self):
+    repo = self.create_repo()
+    self.commit(repo, 'first', { 'a/x': '1' })
+
+    class BrokenWriter(saplib.OdbWriter):
+      def store(self, typename, data, entries = None):
+        raise IOError("disk full")
+
+    split = saplib.Split(repo, 'a', [ 'a' ])
+    self.assertRaises(IOError, split.apply, 'split_a', writer = BrokenWriter(repo), pipeline = True)
+    self.assertFalse('split_a' in [ head.name for head in repo.heads ])
@@ -0,0 +1,36 @@
+import fixtures
+import saplib
+import unittest
+
+class DryRunTest(unittest.TestCase, fixtures.RepoFixture):
+  def test_plan(self):
+    repo = self.create_repo()
+    self.commit(repo, 'first', { 'a/x': '1', 'a/OWNERS': 'jake', 'c/y': '2' })
+    self.commit(repo, 'second', { 'c/y': '3' })
+    self.commit(repo, 'third', { 'a/b/z': '4' })
+
+    splits = [ saplib.Split(repo, 'a', [ 'a' ]), saplib.Split(repo, 'c', [ 'c', '!.+/OWNERS$' ]) ]
+    dry_run = saplib.DryRun(repo, saplib.ChangedPathsIndex(repo))
+    self.assertEquals(repo.head.commit.hexsha, dry_run.head)
+
+    plans = [ dry_run.plan(split, 'split_%s' % split.name) for split in splits ]
+    for (split, plan) in zip(splits, plans):
+      self.assertEquals([ commit.hexsha for commit in split.commits() ], plan.commits)
+      self.assertEquals(None, plan.since)
+
+    # Without excludes a split writes just the root tree and commit for each commit split.
+    self.assertEquals(4, plans[0].objects)
+    self.assertEquals({ 'commits': 2, 'trees': 2 }, plans[0].as_dict()['estimated_objects'])
+    self.assertTrue(plans[1].objects >= 4)
+
+  def test_plan_resumes(self):
+    repo = self.create_repo()
+    self.commit(repo, 'first', { 'a/x': '1' })
+    split = saplib.Split(repo, 'a', [ 'a' ])
+    split.apply('split_a')
+    second = self.commit(repo, 'second', { 'a/x': '2' })
+
+    plan = saplib.DryRun(repo, saplib.ChangedPathsIndex(repo)).plan(split, 'split_a')
+    self.assertEquals([ second.hexsha ], plan.commits)
+    self.assertEquals(repo.head.commit.parents[0].hexsha, plan.since)
+    self.assertEquals('split_a', plan.as_dict()['branch'])
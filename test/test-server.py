@@ -0,0 +1,110 @@
+import fixtures
+import os
+import saplib
+import shutil
+import socket
+import tempfile
+import threading
+import time
+import unittest
+
+class SplitServerTest(unittest.TestCase, fixtures.RepoFixture):
+  def test_split(self):
+    repo = self.create_repo()
+    self.commit(repo, 'first', { 'a/x': '1', 'a/OWNERS': 'jake', 'c/y': '2' })
+    self._configure(repo, "[ { 'name': 'a', 'paths': [ 'a', '!.+/OWNERS$' ] }, "
+                          "  { 'name': 'c', 'paths': [ 'c' ] } ]")
+    socket_path = self._serve(repo)
+
+    response = saplib.SplitServer.request(socket_path, { 'command': 'split', 'splits': None })
+    self.assertEquals([ 'a', 'c' ], [ result['name'] for result in response['splits'] ])
+    for result in response['splits']:
+      self.assertEquals('split_%s' % result['name'], result['branch'])
+      self.assertEquals(repo.heads[result['branch']].commit.hexsha, result['tip'])
+
+    second = self.commit(repo, 'second', { 'a/x': '3' })
+    response = saplib.SplitServer.request(socket_path, { 'command': 'split', 'splits': [ 'a' ] })
+    [ result ] = response['splits']
+    self.assertEquals(repo.heads.split_a.commit.hexsha, result['tip'])
+    self.assertTrue(repo.heads.split_a.commit.message.endswith(second.hexsha + ')'))
+
+    # Splits are applied incrementally from one request to the next and match a cold split.
+    split = saplib.Split(repo, 'a', [ 'a', '!.+/OWNERS$' ])
+    self.assertEquals(result['tip'], split.apply('split_a_cold').hexsha)
+
+    response = saplib.SplitServer.request(socket_path, { 'command': 'split', 'splits': [ 'c' ] })
+    self.assertEquals([ None ], [ result['tip'] for result in response['splits'] ])
+
+  def test_errors(self):
+    repo = self.create_repo()
+    self.commit(repo, 'first', { 'a/x': '1' })
+    self._configure(repo, "[ { 'name': 'a', 'paths': [ 'a' ] } ]")
+    socket_path = self._serve(repo)
+
+    self.assertRaises(saplib.ServerError, saplib.SplitServer.request, socket_path,
+                      { 'command': 'split', 'splits': [ 'b' ] })
+    self.assertRaises(saplib.ServerError, saplib.SplitServer.request, socket_path,
+                      { 'command': 'bogus' })
+    self.assertRaises(saplib.ServerError, self._server(repo, socket_path).serve)
+
+    # The server keeps serving after a failed request.
+    self.assertEquals({}, saplib.SplitServer.request(socket_path, { 'command': 'ping' }))
+
+  def test_failed_split(self):
+    repo = self.create_repo()
+    self.commit(repo, 'first', { 'a/b/x': '1', 'a/OWNERS': 'jake' })
+    self._configure(repo, "[ { 'name': 'a', 'paths': [ 'a', '!.+/OWNERS$' ] } ]")
+
+    class InterruptedWriter(saplib.FastImportWriter):
+      def update_branch(self, branch_name, commit):
+        raise IOError("interrupted")
+    writers = [ InterruptedWriter, saplib.FastImportWriter ]
+    socket_path = self._serve(repo, create_writer = lambda repo: writers.pop(0)(repo))
+
+    request = { 'command': 'split', 'splits': [ 'a' ] }
+    self.assertRaises(saplib.ServerError, saplib.SplitServer.request, socket_path, request)
+
+    # The trees the interrupted split pruned were never written and are pruned and written again.
+    [ result ] = saplib.SplitServer.request(socket_path, request)['splits']
+    repo.git.rev_list('--objects', result['tip'])
+    self.assertEquals(saplib.Split(repo, 'a', [ 'a', '!.+/OWNERS$' ]).apply('cold').hexsha,
+                      result['tip'])
+
+  def test_stop(self):
+    repo = self.create_repo()
+    self.commit(repo, 'first', { 'a/x': '1' })
+    socket_path = self._serve(repo)
+    self.assertEquals({}, saplib.SplitServer.request(socket_path, { 'command': 'stop' }))
+    self._thread.join()
+    self.assertFalse(os.path.exists(socket_path))
+    self.assertRaises(socket.error, saplib.SplitServer.request, socket_path,
+                      { 'command': 'ping' })
+
+  def _configure(self, repo, splits):
+    with open(os.path.join(repo.working_tree_dir, '.saplings'), 'w') as fp:
+      fp.write("splits = %s\n" % splits)
+
+  def _server(self, repo, socket_path, create_writer = None):
+    return saplib.SplitServer(repo, os.path.join(repo.working_tree_dir, '.saplings'), socket_path,
+                              lambda split: 'split_%s' % split.name, create_writer = create_writer)
+
+  def _serve(self, repo, create_writer = None):
+    # Unix socket paths are limited to about 100 characters so the socket is kept out of the repo.
+    directory = tempfile.mkdtemp(prefix = 'sapling-serve.')
+    self.addCleanup(shutil.rmtree, directory)
+    socket_path = os.path.join(directory, 'serve.sock')
+
+    self._thread = threading.Thread(target = self._server(repo, socket_path, create_writer).serve)
+    self._thread.daemon = True
+    self._thread.start()
+    for _ in range(100):
+      if os.path.exists(socket_path):
+        break
+      time.sleep(0.05)
+    self.addCleanup(self._stop, socket_path)
+    return socket_path
+
+  def _stop(self, socket_path):
+    if self._thread.is_alive():
+      saplib.SplitServer.request(socket_path, { 'command': 'stop' })
+      self._thread.join()
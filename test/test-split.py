@@ -16,3 +16,161 @@ class SplitTest(unittest.TestCase, fixtures.RepoFixture):
     split = saplib.Split(self.repo(), 'jake', [ 'test', 'saplib' ])
     self.assertEquals('jake', split.name)
     self.assertEquals([ 'test', 'saplib' ], split.paths)
+
+  def test_apply(self):
+    repo = self.create_repo()
+    first = self.commit(repo, 'first', { 'a/x': '1', 'a/b/OWNERS': 'jake', 'c/y': '2' })
+    self.commit(repo, 'second', { 'c/y': '3' })
+    third = self.commit(repo, 'third', { 'a/x': '4' })
+
+    split = saplib.Split(repo, 'a', [ 'a', '!.+/OWNERS$' ])
+    tip = split.apply('split_a')
+    self.assertEquals(tip.hexsha, repo.heads.split_a.commit.hexsha)
+    blobs = [ item.path for item in tip.tree.traverse() if item.type == 'blob' ]
+    self.assertEquals([ 'a/x' ], blobs)
+    self.assertEquals([ third.hexsha, first.hexsha ], [ self._split_of(c) for c in self._log(tip) ])
+
+  def test_apply_incremental(self):
+    repo = self.create_repo()
+    self.commit(repo, 'first', { 'a/x': '1' })
+    split = saplib.Split(repo, 'a', [ 'a' ])
+    first_tip = split.apply('split_a')
+
+    self.assertEquals(None, split.apply('split_a'))
+
+    second = self.commit(repo, 'second', { 'a/x': '2' })
+    self.commit(repo, 'third', { 'c/y': '3' })
+
+    class CountingListener(saplib.Split.ApplyListener):
+      def on_start(self, commit_count):
+        self.commit_count = commit_count
+
+    listener = CountingListener()
+    second_tip = split.apply('split_a', apply_listener = listener)
+    self.assertEquals(1, listener.commit_count)
+    self.assertEquals([ first_tip.hexsha ], [ parent.hexsha for parent in second_tip.parents ])
+    self.assertEquals(second.hexsha, self._split_of(second_tip))
+
+    # A differential split must produce the same history as a full split.
+    self.assertEquals(second_tip.hexsha, split.apply('split_a_full').hexsha)
+
+  def test_commit_count(self):
+    repo = self.create_repo()
+    first = self.commit(repo, 'first', { 'a/x': '1', 'c/y': '2' })
+    self.commit(repo, 'second', { 'c/y': '3' })
+    self.commit(repo, 'third', { 'a/x': '4' })
+
+    split = saplib.Split(repo, 'a', [ 'a' ])
+    index = saplib.ChangedPathsIndex(repo)
+    self.assertEquals(2, split.commit_count())
+    self.assertEquals(2, split.commit_count(index = index))
+    self.assertEquals(1, split.commit_count(since = first.hexsha))
+    self.assertEquals(1, split.commit_count(since = first.hexsha, index = index))
+
+  def test_apply_rebuilds_unrelated_branch(self):
+    repo = self.create_repo()
+    self.commit(repo, 'first', { 'a/x': '1' })
+    repo.create_head('split_a', self.commit(repo, 'unrelated', { 'a/x': '2' }))
+
+    tip = saplib.Split(repo, 'a', [ 'a' ]).apply('split_a')
+    self.assertEquals(2, len(self._log(tip)))
+    self.assertEquals(tip.hexsha, repo.heads.split_a.commit.hexsha)
+
+  def test_apply_collapses_unchanged_trees(self):
+    repo = self.create_repo()
+    self.commit(repo, 'first', { 'a/OWNERS': 'jake' })
+    second = self.commit(repo, 'second', { 'a/x': '1' })
+    self.commit(repo, 'third', { 'a/OWNERS': 'joe' })
+
+    split = saplib.Split(repo, 'a', [ 'a', '!.+/OWNERS$' ])
+    tip = split.apply('split_a')
+    self.assertEquals([ second.hexsha ], [ self._split_of(c) for c in self._log(tip) ])
+    self.assertEquals(None, split.apply('split_a'))
+
+    self.commit(repo, 'fourth', { 'a/OWNERS': 'jack' })
+    self.assertEquals(None, split.apply('split_a'))
+    self.assertEquals(tip.hexsha, repo.heads.split_a.commit.hexsha)
+
+    keep_empty = saplib.Split(repo, 'a', [ 'a', '!.+/OWNERS$' ], keep_empty = True)
+    self.assertEquals(4, len(self._log(keep_empty.apply('split_a_all'))))
+
+  def test_apply_preserve_merges(self):
+    repo = self.create_repo()
+    first = self.commit(repo, 'first', { 'a/x': '1', 'c/y': '2' })
+    repo.git.checkout('-q', '-b', 'feature')
+    feature = self.commit(repo, 'feature', { 'a/f': '3' })
+    self.commit(repo, 'unrelated', { 'c/y': '4' })
+    repo.git.checkout('-q', 'master')
+    mainline = self.commit(repo, 'mainline', { 'a/x': '5' })
+    repo.git.merge('-q', '--no-ff', '-m', 'merge', 'feature')
+    merge = repo.head.commit
+
+    split = saplib.Split(repo, 'a', [ 'a' ])
+    graph = split.commit_graph()
+    self.assertEquals([ first.hexsha, merge.hexsha ], [ graph[0][0], graph[-1][0] ])
+    self.assertEquals([ mainline.hexsha, feature.hexsha ], graph[-1][1])
+
+    tip = split.apply('split_a', preserve_merges = True)
+    self.assertEquals(tip.hexsha, repo.heads.split_a.commit.hexsha)
+    self.assertEquals(merge.hexsha, self._split_of(tip))
+    self.assertEquals([ mainline.hexsha, feature.hexsha ],
+                      [ self._split_of(parent) for parent in tip.parents ])
+    self.assertEquals([ first.hexsha ] * 2,
+                      [ self._split_of(parent.parents[0]) for parent in tip.parents ])
+    self.assertEquals(tip.parents[0].parents[0].hexsha, tip.parents[1].parents[0].hexsha)
+
+    # Trees built up front are used as is and a resumed split extends the preserved history.
+    second = self.commit(repo, 'second', { 'a/x': '6' })
+    trees = split.build_trees([ second.hexsha ], saplib.OdbWriter(repo))
+    second_tip = split.apply('split_a', preserve_merges = True, trees = trees)
+    self.assertEquals([ tip.hexsha ], [ parent.hexsha for parent in second_tip.parents ])
+    self.assertEquals(trees[second.hexsha], second_tip.tree.binsha)
+    self.assertEquals(second_tip.hexsha,
+                      split.apply('split_a_full', preserve_merges = True).hexsha)
+
+  def test_apply_preserve_merges_collapses(self):
+    repo = self.create_repo()
+    first = self.commit(repo, 'first', { 'a/x': '1', 'a/OWNERS': 'jake' })
+    repo.git.checkout('-q', '-b', 'feature')
+    self.commit(repo, 'owners', { 'a/OWNERS': 'joe' })
+    repo.git.checkout('-q', 'master')
+    self.commit(repo, 'mainline', { 'a/x': '2' })
+    repo.git.merge('-q', '--no-ff', '-m', 'merge', 'feature')
+
+    # The feature branch only changes excluded files so the merge has a single split parent left.
+    split = saplib.Split(repo, 'a', [ 'a', '!.+/OWNERS$' ])
+    tip = split.apply('split_a', preserve_merges = True)
+    self.assertEquals([ repo.head.commit.parents[0].hexsha, first.hexsha ],
+                      [ self._split_of(c) for c in self._log(tip) ])
+
+  def test_apply_preserve_merges_resumed_fork(self):
+    repo = self.create_repo()
+    one = self.commit(repo, 'one', { 'a/x': '1' })
+    unrelated = self.commit(repo, 'unrelated', { 'c/z': '1' })
+    self.commit(repo, 'two', { 'a/x': '2' })
+    self.commit(repo, 'three', { 'a/x': '3' })
+    split = saplib.Split(repo, 'a', [ 'a' ])
+    split.apply('split_a', preserve_merges = True)
+
+    # Branches forked before the commit the split branch was last split from are merged in.
+    for (branch, fork_point, files) in (('feature', one, { 'a/y': 'f' }),
+                                        ('other', unrelated, { 'a/w': 'o' })):
+      repo.git.checkout('-q', '-b', branch, fork_point.hexsha)
+      self.commit(repo, branch, files)
+      repo.git.checkout('-q', 'master')
+      repo.git.merge('-q', '--no-ff', '-m', 'merge %s' % branch, branch)
+
+    tip = split.apply('split_a', preserve_merges = True)
+    self.assertEquals(split.apply('split_a_full', preserve_merges = True).hexsha, tip.hexsha)
+    feature = tip.parents[0].parents[1]
+    self.assertEquals([ one.hexsha ], [ self._split_of(parent) for parent in feature.parents ])
+
+  def _log(self, commit):
+    return [ commit ] + list(commit.iter_parents())
+
+  def _split_of(self, commit):
+    return commit.message.rsplit('(sapling split of ', 1)[1].rstrip(')')
+
+  def test_patterns(self):
+    split = saplib.Split(self.repo(), 'jake', [ '!.+/OWNERS$', 'test', 'saplib/' ])
+    self.assertEquals([ 'test', 'saplib', '!.+/OWNERS$' ], split.patterns)
@@ -0,0 +1,120 @@
+import fixtures
+import saplib
+import unittest
+
+class SplitSetTest(unittest.TestCase, fixtures.RepoFixture):
+  def test_apply_matches_individual_splits(self):
+    repo = self.create_repo()
+    self.commit(repo, 'first', { 'a/x': '1', 'a/OWNERS': 'jake', 'c/y': '2' })
+    self.commit(repo, 'second', { 'c/y': '3' })
+    self.commit(repo, 'third', { 'a/OWNERS': 'joe' })
+    self.commit(repo, 'fourth', { 'a/x': '4', 'd/z': '5' })
+
+    splits = [
+      saplib.Split(repo, 'a', [ 'a', '!.+/OWNERS$' ]),
+      saplib.Split(repo, 'ac', [ 'a', 'c' ]),
+      saplib.Split(repo, 'd', [ 'd' ]),
+    ]
+
+    class CountingListener(saplib.SplitSet.ApplyListener):
+      def on_start(self, commit_count):
+        self.commit_count = commit_count
+
+    listener = CountingListener()
+    tips = saplib.SplitSet(repo, splits).apply(self._branch_names(splits, 'set_'),
+                                                apply_listener = listener)
+    self.assertEquals(4, listener.commit_count)
+
+    for split in splits:
+      expected = split.apply('single_%s' % split.name)
+      self.assertEquals(expected.hexsha, tips[split.name].hexsha)
+      self.assertEquals(expected.hexsha, repo.heads['set_%s' % split.name].commit.hexsha)
+
+  def test_apply_matches_individual_splits_across_merges(self):
+    repo = self.create_repo()
+    self.commit(repo, 'first', { 'a/b/x': '1', 'c/e/y': '1' })
+    repo.git.checkout('-q', '-b', 'side')
+    self.commit(repo, 'side', { 'a/b/x': '2' })
+    repo.git.checkout('-q', 'master')
+    self.commit(repo, 'mainline', { 'a/b/x': '3' })
+    self.commit(repo, 'other', { 'c/e/z': '1' })
+    # The merge discards the mainline change to a/b, so git simplifies the mainline commit out of
+    # the history of a/b but not out of the history of a/b and c/e together.
+    repo.git.merge('-q', '--no-ff', '-X', 'theirs', '-m', 'merge', 'side')
+
+    splits = [ saplib.Split(repo, 'ab', [ 'a/b' ]), saplib.Split(repo, 'ce', [ 'c/e' ]) ]
+    for index in (None, saplib.ChangedPathsIndex(repo)):
+      prefix = 'index_' if index else ''
+      tips = saplib.SplitSet(repo, splits).apply(self._branch_names(splits, prefix + 'set_'),
+                                                  index = index)
+      for split in splits:
+        expected = split.apply('%ssingle_%s' % (prefix, split.name), index = index)
+        self.assertEquals(expected.hexsha, tips[split.name].hexsha)
+
+  def test_apply_incremental(self):
+    repo = self.create_repo()
+    self.commit(repo, 'first', { 'a/x': '1', 'c/y': '2' })
+
+    a = saplib.Split(repo, 'a', [ 'a' ])
+    c = saplib.Split(repo, 'c', [ 'c' ])
+    first_tip = a.apply('split_a')
+
+    self.commit(repo, 'second', { 'a/x': '3' })
+    split_set = saplib.SplitSet(repo, [ a, c ])
+    tips = split_set.apply(self._branch_names([ a, c ], 'split_'))
+    self.assertEquals([ first_tip.hexsha ], [ parent.hexsha for parent in tips['a'].parents ])
+    self.assertEquals([], tips['c'].parents)
+
+    self.assertEquals({ 'a': None, 'c': None },
+                      split_set.apply(self._branch_names([ a, c ], 'split_')))
+
+  def test_apply_walks_only_new_commits(self):
+    repo = self.create_repo()
+    self.commit(repo, 'first', { 'a/x': '1', 'c/y': '1' })
+    splits = [ saplib.Split(repo, 'a', [ 'a' ]), saplib.Split(repo, 'c', [ 'c' ]) ]
+    split_set = saplib.SplitSet(repo, splits)
+    branch_names = self._branch_names(splits, 'split_')
+    split_set.apply(branch_names)
+    for i in range(5):
+      self.commit(repo, 'c%d' % i, { 'c/y': str(i + 2) })
+    split_set.apply(branch_names)
+
+    # The a split was last split from the first commit but only the commit new to c is walked.
+    self.commit(repo, 'latest', { 'c/y': 'latest' })
+
+    class CountingListener(saplib.SplitSet.ApplyListener):
+      def on_start(self, commit_count):
+        self.commit_count = commit_count
+
+    listener = CountingListener()
+    tips = split_set.apply(branch_names, apply_listener = listener,
+                           index = saplib.ChangedPathsIndex(repo))
+    self.assertEquals(1, listener.commit_count)
+    self.assertEquals(None, tips['a'])
+    self.assertEquals(splits[1].apply('single_c').hexsha, tips['c'].hexsha)
+
+  def test_apply_shares_pruned_trees(self):
+    repo = self.create_repo()
+    self.commit(repo, 'first', { 'p/q/x': '1', 'p/q/OWNERS': 'jake', 'a/y': '2', 'b/z': '3' })
+
+    class CountingWriter(saplib.OdbWriter):
+      def __init__(self, repo):
+        saplib.OdbWriter.__init__(self, repo)
+        self.trees = 0
+      def write_tree(self, entries):
+        self.trees += 1
+        return saplib.OdbWriter.write_tree(self, entries)
+
+    splits = [ saplib.Split(repo, 'a', [ 'p', 'a', '!.+/OWNERS$' ]),
+               saplib.Split(repo, 'b', [ 'p', 'b', '!.+/OWNERS$' ]) ]
+    writer = CountingWriter(repo)
+    tips = saplib.SplitSet(repo, splits).apply(self._branch_names(splits, 'set_'), writer = writer)
+
+    # The pruned p and p/q trees are written once for both splits, then each split's root tree.
+    self.assertEquals(4, writer.trees)
+    self.assertEquals(tips['a'].tree['p'].binsha, tips['b'].tree['p'].binsha)
+    for split in splits:
+      self.assertEquals(split.apply('single_%s' % split.name).hexsha, tips[split.name].hexsha)
+
+  def _branch_names(self, splits, prefix):
+    return dict((split.name, prefix + split.name) for split in splits)
@@ -0,0 +1,60 @@
+import os
+import subprocess
+import sys
+import time
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+class StartupTest(unittest.TestCase):
+  def test_saplib_import_is_lazy(self):
+    self.assertEquals('[]', self._python("""
+import saplib
+import sys
+print(sorted(name for name in ('git', 'gitdb', 'saplib.split') if name in sys.modules))
+""").strip())
+
+  def test_import_star(self):
+    self.assertEquals('True', self._python("""
+import saplib
+namespace = {}
+exec('from saplib import *', namespace)
+print(all(name in namespace for name in saplib.__all__))
+""").strip())
+
+  def test_version_skips_git_imports(self):
+    self.assertEquals('[]', self._python("""
+import runpy
+import sys
+sys.argv = [ 'sapling.py', '--version' ]
+try:
+  runpy.run_path('sapling.py', run_name = '__main__')
+except SystemExit:
+  pass
+print(sorted(name for name in ('git', 'gitdb') if name in sys.modules))
+""").splitlines()[-1])
+
+  def test_version_faster_than_importing_git(self):
+    # Guards against an eager import creeping back in; importing GitPython alone is measured as the
+    # bar rather than an absolute time so the test holds on slow machines.
+    startup = self._best_time([ os.path.join(ROOT, 'sapling.py'), '--version' ])
+    import_git = self._best_time([ '-c', 'import git' ])
+    self.assertTrue(startup < import_git,
+                    "sapling.py --version took %.3fs, longer than importing git (%.3fs)"
+                    % (startup, import_git))
+
+  def _python(self, code):
+    process = subprocess.Popen([ sys.executable, '-c', code ], cwd = ROOT, stdout = subprocess.PIPE)
+    output = process.communicate()[0]
+    self.assertEquals(0, process.returncode)
+    return output
+
+  def _best_time(self, args, runs = 3):
+    best = None
+    with open(os.devnull, 'w') as devnull:
+      for _ in range(runs):
+        start = time.time()
+        subprocess.check_call([ sys.executable ] + args, cwd = ROOT, stdout = devnull)
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
@@ -0,0 +1,85 @@
+import fixtures
+import git
+import saplib
+import unittest
+
+from saplib.stats import NullStats, Stats, TimedObjectDB
+
+class StatsTest(unittest.TestCase, fixtures.RepoFixture):
+  def test_phases_exclusive(self):
+    stats = Stats()
+    with stats.phase('build'):
+      with stats.phase('write', 2):
+        pass
+    self.assertEquals([ 'build', 'write' ], sorted(stats.totals))
+    self.assertEquals(1, stats.totals['build'][1])
+    self.assertEquals(2, stats.totals['write'][1])
+
+  def test_timed(self):
+    stats = Stats()
+    self.assertEquals([ 1, 2, 3 ], list(stats.timed('enumerate', [ 1, 2, 3 ])))
+    self.assertEquals(3, stats.totals['enumerate'][1])
+
+  def test_null(self):
+    stats = NullStats()
+    with stats.phase('build'):
+      pass
+    self.assertEquals([ 1 ], list(stats.timed('enumerate', [ 1 ])))
+    self.assertEquals(None, stats.commit_done(None))
+
+  def test_merge(self):
+    stats = Stats()
+    with stats.phase('build'):
+      pass
+    stats.merge(stats.as_dict())
+    self.assertEquals(2, stats.totals['build'][1])
+    self.assertTrue(stats.summary().startswith('phase'))
+
+  def test_split_apply(self):
+    repo = self.create_repo()
+    self.commit(repo, 'first', { 'a/x': '1', 'a/OWNERS': 'jake', 'c/y': '2' })
+    self.commit(repo, 'second', { 'a/x': '3' })
+
+    class Listener(saplib.Split.ApplyListener):
+      def __init__(self):
+        self.commits = []
+      def on_commit_stats(self, original_commit, phases):
+        self.commits.append((original_commit.hexsha, sorted(phases)))
+
+    listener = Listener()
+    stats = Stats()
+    split = saplib.Split(repo, 'a', [ 'a', '!.+/OWNERS$' ])
+    tip = split.apply('split_a', apply_listener = listener, stats = stats)
+    self.assertEquals(tip.hexsha, repo.heads.split_a.commit.hexsha)
+    self.assertEquals(2, len(listener.commits))
+    for (_, phases) in listener.commits:
+      for phase in ('build', 'copy', 'resolve', 'write'):
+        self.assertTrue(phase in phases)
+
+    data = stats.as_dict()
+    self.assertEquals([ hexsha for (hexsha, _) in listener.commits ],
+                      [ commit['commit'] for commit in data['commits'] ])
+    self.assertEquals(2, data['phases']['copy']['count'])
+    self.assertTrue('finish' in data['phases'])
+    self.assertTrue('match' in data['phases'])
+
+  def test_split_set_apply(self):
+    repo = self.create_repo()
+    self.commit(repo, 'first', { 'a/x': '1', 'c/y': '2' })
+    self.commit(repo, 'second', { 'c/y': '3' })
+
+    stats = Stats()
+    splits = [ saplib.Split(repo, 'a', [ 'a' ]), saplib.Split(repo, 'c', [ 'c' ]) ]
+    saplib.SplitSet(repo, splits).apply({ 'a': 'split_a', 'c': 'split_c' }, stats = stats)
+    self.assertEquals(2, len(stats.as_dict()['commits']))
+    self.assertEquals(3, stats.totals['copy'][1])
+
+  def test_timed_odb_stream_all_git_cmd_odb(self):
+    repo = self.create_repo()
+    head = self.commit(repo, 'first', { 'a/x': '1', 'b/y': '2', 'c/z': '3' })
+    binshas = [ tree.binsha for tree in head.tree.trees ]
+
+    stats = Stats()
+    odb = TimedObjectDB(git.db.GitCmdObjectDB(repo.odb._root_path, repo.git), stats)
+    self.assertEquals([ repo.odb.stream(binsha).read() for binsha in binshas ],
+                      [ ostream.read() for ostream in odb.stream_all(binshas) ])
@@ -0,0 +1,151 @@
+import fixtures
+import git
+import glob
+import os
+import saplib
+import threading
+import unittest
+
+class FastImportWriterTest(unittest.TestCase, fixtures.RepoFixture):
+  def test_apply_matches_odb_writer(self):
+    repo = self.create_repo()
+    files = { 'a/b/x': '1', 'a/b/OWNERS': 'jake', 'a/c/x': '1', 'a/c/OWNERS': 'jake', 'd/y': '2' }
+    self.commit(repo, 'first', files)
+    self.commit(repo, 'second', { 'a/b/x': '3', 'a/"odd" name': '4' })
+    self.commit(repo, 'third', { 'd/y': '5' }, removes = [ 'a/c' ])
+
+    split = saplib.Split(repo, 'a', [ 'a', 'd', '!.+/OWNERS$' ])
+    expected = split.apply('odb')
+    tip = split.apply('fast_import', writer = saplib.FastImportWriter(repo))
+
+    self.assertEquals(expected.hexsha, tip.hexsha)
+    self.assertEquals(expected.hexsha, repo.heads.fast_import.commit.hexsha)
+    self.assertEquals('', repo.git.for_each_ref(saplib.FastImportWriter.SCRATCH_REFS))
+
+  def test_apply_incremental(self):
+    repo = self.create_repo()
+    self.commit(repo, 'first', { 'a/x': '1' })
+    split = saplib.Split(repo, 'a', [ 'a' ])
+    first_tip = split.apply('split_a', writer = saplib.FastImportWriter(repo))
+
+    self.commit(repo, 'second', { 'a/x': '2' })
+    tip = split.apply('split_a', writer = saplib.FastImportWriter(repo))
+    self.assertEquals([ first_tip.hexsha ], [ parent.hexsha for parent in tip.parents ])
+    self.assertEquals(split.apply('split_a_odb').hexsha, tip.hexsha)
+
+  def test_split_set(self):
+    repo = self.create_repo()
+    self.commit(repo, 'first', { 'a/x': '1', 'c/y': '2' })
+    self.commit(repo, 'second', { 'a/x': '3' })
+
+    splits = [ saplib.Split(repo, 'a', [ 'a' ]), saplib.Split(repo, 'c', [ 'c' ]) ]
+    tips = saplib.SplitSet(repo, splits).apply({ 'a': 'split_a', 'c': 'split_c' },
+                                                writer = saplib.FastImportWriter(repo))
+    for split in splits:
+      self.assertEquals(split.apply('odb_%s' % split.name).hexsha, tips[split.name].hexsha)
+
+  def test_concurrent_writers(self):
+    repo = self.create_repo()
+    names = [ 'd%d' % i for i in range(6) ]
+    for i in range(10):
+      self.commit(repo, 'commit %d' % i, dict(('%s/x' % name, str(i)) for name in names))
+
+    splits = [ saplib.Split(repo, name, [ name ]) for name in names ]
+    tips = {}
+    errors = []
+    def apply(split):
+      try:
+        tips[split.name] = split.apply('split_%s' % split.name,
+                                       writer = saplib.FastImportWriter(repo)).hexsha
+      except Exception as e:
+        errors.append(e)
+    threads = [ threading.Thread(target = apply, args = (split,)) for split in splits ]
+    for thread in threads:
+      thread.start()
+    for thread in threads:
+      thread.join()
+
+    self.assertEquals([], errors)
+    for split in splits:
+      self.assertEquals(split.apply('odb_%s' % split.name).hexsha, tips[split.name])
+    self.assertEquals('', repo.git.for_each_ref(saplib.FastImportWriter.SCRATCH_REFS))
+
+  def test_abort(self):
+    repo = self.create_repo()
+    self.commit(repo, 'first', { 'a/x': '1' })
+    self.commit(repo, 'second', { 'a/x': '2' })
+
+    class FailingListener(saplib.Split.ApplyListener):
+      def on_commit(self, original_commit, new_commit):
+        if original_commit.message.startswith('second'):
+          raise ValueError("interrupted")
+
+    split = saplib.Split(repo, 'a', [ 'a' ])
+    self.assertRaises(ValueError, split.apply, 'split_a', apply_listener = FailingListener(),
+                      writer = saplib.FastImportWriter(repo))
+    self.assertFalse('split_a' in [ head.name for head in repo.heads ])
+    self.assertEquals('', repo.git.for_each_ref(saplib.FastImportWriter.SCRATCH_REFS))
+    self.assertEquals([], glob.glob(os.path.join(repo.git_dir, 'fast_import_crash_*')))
+    self.assertEquals([], glob.glob(os.path.join(repo.git_dir, 'objects', 'pack', 'tmp_*')))
+
+
+class MktreeWriterTest(unittest.TestCase, fixtures.RepoFixture):
+  def test_apply_matches_odb_writer(self):
+    repo = self.create_repo()
+    self.commit(repo, 'first', { 'a/b/x': '1', 'a/b/OWNERS': 'jake', 'a/c/y': '2', 'd/z': '3' })
+    self.commit(repo, 'second', { 'a/b/x': '4', 'a/c/OWNERS': 'joe' })
+
+    split = saplib.Split(repo, 'a', [ 'a', 'd', '!.+/OWNERS$' ])
+    expected = split.apply('odb')
+    tip = split.apply('mktree', writer = saplib.MktreeWriter(repo))
+    self.assertEquals(expected.hexsha, tip.hexsha)
+
+  def test_odd_modes(self):
+    repo = self.create_repo()
+    head = self.commit(repo, 'first', { 'x': '1' })
+    entries = [ (head.tree['x'].binsha, 0o100664, 'x') ]
+
+    expected = saplib.OdbWriter(repo).write_tree(entries)
+    writer = saplib.MktreeWriter(repo)
+    self.assertEquals(expected, writer.write_tree(entries))
+    self.assertEquals(head.tree.binsha, writer.write_tree([ (head.tree['x'].binsha, 0o100644,
+                                                             'x') ]))
+    new_tree = writer.write_tree([ (head.tree.binsha, 0o040000, 't') ])
+    writer.close()
+    self.assertTrue(repo.odb.has_object(new_tree))
+
+  def test_mismatch(self):
+    repo = self.create_repo()
+    head = self.commit(repo, 'first', { 'x': '1', 'y': '2' })
+
+    # Git mktree sorts the entries it is handed, so an unsorted tree is written under another sha.
+    writer = saplib.MktreeWriter(repo)
+    writer.write_tree([ (head.tree['y'].binsha, 0o100644, 'y'),
+                        (head.tree['x'].binsha, 0o100644, 'x') ])
+    writer.update_branch('mktree', head)
+    self.assertRaises(git.GitCommandError, writer.close)
+    self.assertFalse('mktree' in [ branch.name for branch in repo.heads ])
+
+
+class OdbWriterTest(unittest.TestCase, fixtures.RepoFixture):
+  def test_write_tree_skips_existing(self):
+    repo = self.create_repo()
+    head = self.commit(repo, 'first', { 'a/x': '1' })
+    entries = [ (blob.binsha, blob.mode, blob.name) for blob in head.tree['a'].blobs ]
+
+    stored = []
+    store = repo.odb.store
+    def counting_store(istream):
+      stored.append(istream.type)
+      return store(istream)
+    repo.odb.store = counting_store
+
+    writer = saplib.OdbWriter(repo)
+    self.assertEquals(head.tree['a'].binsha, writer.write_tree(entries))
+    self.assertEquals([], stored)
+
+    new_entries = entries + [ (head.tree['a'].binsha, 0o040000, 'b') ]
+    binsha = writer.write_tree(new_entries)
+    self.assertEquals(binsha, writer.write_tree(new_entries))
+    self.assertEquals([ 'tree' ], stored)
+    self.assertTrue(repo.odb.has_object(binsha))